@@ -6,6 +6,14 @@ from apps.cases.tasks import handle_external_signs
 class Command(BaseCommand):
     help = 'Gets esigns from external sign service'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Commands per batch (transaction)')
+        parser.add_argument('--max-batches', type=int, default=None, help='Stop after this number of batches')
+
     def handle(self, *args, **options):
-        handle_external_signs()
+        report = handle_external_signs(options['batch_size'], options['max_batches'])
+        self.stdout.write(
+            f"Batches: {report['batches']}, commands: {report['commands']}, signs: {report['signs']}, "
+            f"errors: {report['errors']}, {report['seconds']} s ({report['signs_per_second']} signs/s)"
+        )
         self.stdout.write(self.style.SUCCESS('Finished'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from apps.cases.services.case_summary_services import case_summary_rebuild
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the denormalized case summary table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        total = case_summary_rebuild(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Finished. Cases processed: {total}'))
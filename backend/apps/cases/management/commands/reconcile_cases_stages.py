@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from apps.cases.services.case_stage_reconcile_services import case_stage_reconcile
+from apps.cases.tasks import reconcile_cases_stages_task
+
+
+class Command(BaseCommand):
+    help = 'Re-evaluates the actual stage of every active case and performs the stage actions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report stage changes')
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--workers', type=int, default=1, help='Number of worker processes')
+        parser.add_argument('--async', action='store_true', dest='run_async', help='Run as Celery tasks')
+
+    def handle(self, *args, **options):
+        if options['run_async']:
+            reconcile_cases_stages_task.delay(options['dry_run'], options['batch_size'])
+            self.stdout.write(self.style.SUCCESS('Finished. Task is queued'))
+            return
+
+        report = case_stage_reconcile(
+            dry_run=options['dry_run'],
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+        )
+
+        prefix = '[dry-run] ' if report['dry_run'] else ''
+        for change in report['changes']:
+            stages = ' -> '.join(str(x) for x in [change['stage_from'], *change['steps']])
+            self.stdout.write(f"{prefix}{change['case_number']} (id {change['case_id']}): {stages}")
+        for error in report['errors']:
+            self.stderr.write(f"{prefix}id {error['case_id']}: {error['error']}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Finished. Cases processed: {report['total']}, changed: {len(report['changes'])}, "
+            f"errors: {len(report['errors'])}, time: {report['elapsed']:.2f} s "
+            f"({report['cases_per_second']:.1f} cases/sec)"
+        ))
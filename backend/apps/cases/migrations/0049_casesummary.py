@@ -0,0 +1,114 @@
+# Generated by Django 4.0.6 on 2026-10-18 10:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def _user_full_name(apps, user):
+    """ФИО пользователя (как User.get_full_name) или e-mail."""
+    if user is None:
+        return None
+    if user.last_name:
+        return f"{user.last_name} {user.first_name} {user.middle_name}".strip()
+    CertificateOwner = apps.get_model('users', 'CertificateOwner')
+    cert = CertificateOwner.objects.filter(user_id=user.pk).order_by('pk').first()
+    return cert.pszSubjFullName.strip() if cert and cert.pszSubjFullName else user.email
+
+
+def fill_summaries(apps, schema_editor):
+    """Начальное заполнение сводных данных ап. дел."""
+    Case = apps.get_model('cases', 'Case')
+    CaseSummary = apps.get_model('cases', 'CaseSummary')
+    CollegiumMembership = apps.get_model('cases', 'CollegiumMembership')
+
+    heads = {}
+    for membership in CollegiumMembership.objects.filter(is_head=True).select_related('person').order_by('pk'):
+        heads.setdefault(membership.case_id, membership.person)
+
+    summaries = []
+    cases = Case.objects.select_related(
+        'claim', 'claim__obj_kind', 'claim__claim_kind', 'stage_step', 'secretary'
+    ).annotate(
+        unsigned_docs_count=models.Count(
+            'document', filter=models.Q(document__sign__timestamp=''), distinct=True
+        )
+    )
+    for case in cases.iterator():
+        claim = case.claim
+        summaries.append(CaseSummary(
+            case_id=case.pk,
+            case_number=case.case_number,
+            created_at=case.created_at,
+            stage_code=case.stage_step.code if case.stage_step else None,
+            stage_title=case.stage_step.title if case.stage_step else None,
+            claim_id=claim.pk if claim else None,
+            obj_kind_id=claim.obj_kind_id if claim else None,
+            obj_kind_title=claim.obj_kind.title if claim else None,
+            claim_kind_id=claim.claim_kind_id if claim else None,
+            claim_kind_title=claim.claim_kind.title if claim else None,
+            obj_number=claim.obj_number if claim else None,
+            obj_title=claim.obj_title if claim else None,
+            third_person=claim.third_person if claim else False,
+            submission_date=claim.submission_date if claim else None,
+            collegium_head_name=_user_full_name(apps, heads.get(case.pk)),
+            secretary_id=case.secretary_id,
+            secretary_name=_user_full_name(apps, case.secretary),
+            expert_id=case.expert_id,
+            papers_owner_id=case.papers_owner_id,
+            unsigned_docs_count=case.unsigned_docs_count,
+            decision_date=case.decision_date,
+            published=case.published,
+            stopped=case.stopped,
+            paused=case.paused,
+        ))
+    CaseSummary.objects.bulk_create(summaries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('cases', '0048_case_stop_date'),
+        ('filling', '0019_person'),
+        ('users', '0011_user_first_name_genitive_user_last_name_genitive_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CaseSummary',
+            fields=[
+                ('case', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='cases.case', verbose_name='Справа')),
+                ('case_number', models.CharField(blank=True, max_length=255, null=True, verbose_name='Номер справи')),
+                ('created_at', models.DateTimeField(db_index=True, verbose_name='Дата створення справи')),
+                ('stage_code', models.PositiveIntegerField(blank=True, null=True, verbose_name='Код етапу')),
+                ('stage_title', models.CharField(blank=True, max_length=1024, null=True, verbose_name='Етап стадії розгляду')),
+                ('claim_id', models.PositiveIntegerField(blank=True, null=True, verbose_name='Id звернення')),
+                ('obj_kind_id', models.PositiveIntegerField(blank=True, null=True, verbose_name='Id виду ОПІВ')),
+                ('obj_kind_title', models.CharField(blank=True, max_length=255, null=True, verbose_name='Вид ОПІВ')),
+                ('claim_kind_id', models.PositiveIntegerField(blank=True, null=True, verbose_name='Id виду звернення')),
+                ('claim_kind_title', models.CharField(blank=True, max_length=255, null=True, verbose_name='Вид звернення')),
+                ('obj_number', models.CharField(blank=True, max_length=255, null=True, verbose_name='Номер заявки або охоронного документа')),
+                ('obj_title', models.CharField(blank=True, max_length=1024, null=True, verbose_name='Назва ОПІВ')),
+                ('third_person', models.BooleanField(default=False, verbose_name='Апелянт - третя особа')),
+                ('submission_date', models.DateTimeField(blank=True, null=True, verbose_name='Дата та час подачі')),
+                ('collegium_head_name', models.CharField(blank=True, max_length=1024, null=True, verbose_name='Голова колегії')),
+                ('secretary_name', models.CharField(blank=True, max_length=1024, null=True, verbose_name='Секретар (ПІБ)')),
+                ('unsigned_docs_count', models.PositiveIntegerField(default=0, verbose_name='Кількість непідписаних документів')),
+                ('decision_date', models.DateField(blank=True, null=True, verbose_name='Дата оголошення рішення АП')),
+                ('published', models.DateTimeField(blank=True, null=True, verbose_name='Дата та час публікації на веб-сайті')),
+                ('stopped', models.BooleanField(default=False, verbose_name='Розгляд справи припинений')),
+                ('paused', models.BooleanField(default=False, verbose_name='Діловодство по справі зупинене')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Оновлено')),
+                ('expert', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Експерт')),
+                ('papers_owner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Особа, у якої знаходиться паперова справа')),
+                ('secretary', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Секретар')),
+            ],
+            options={
+                'verbose_name': 'Зведені дані справи',
+                'verbose_name_plural': 'Зведені дані справ',
+                'db_table': 'cases_summary',
+            },
+        ),
+        migrations.RunPython(fill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.0.6 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cases', '0049_casesummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='pdf_error',
+            field=models.TextField(blank=True, default='', verbose_name='Помилка конвертації у pdf'),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='pdf_file',
+            field=models.CharField(blank=True, default='', max_length=500, verbose_name='Файл pdf'),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='pdf_status',
+            field=models.CharField(blank=True, choices=[('pending', 'Очікує конвертації у pdf'), ('converting', 'Конвертується у pdf'), ('done', 'Конвертовано у pdf'), ('failed', 'Помилка конвертації у pdf')], default='', max_length=10, verbose_name='Стан конвертації у pdf'),
+        ),
+    ]
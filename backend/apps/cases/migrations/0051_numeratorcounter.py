@@ -0,0 +1,58 @@
+# Generated by Django 4.0.6 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+import re
+
+REG_NUMBER_RE = re.compile(r'^(Вх|Вих)-(\d+)/(\d{4})$')
+CASE_NUMBER_RE = re.compile(r'^(.+)-(\d+)$')
+
+
+def seed_counters(apps, schema_editor):
+    """Начальные значения счётчиков - наибольшие из уже присвоенных номеров."""
+    Case = apps.get_model('cases', 'Case')
+    Document = apps.get_model('cases', 'Document')
+    NumeratorCounter = apps.get_model('cases', 'NumeratorCounter')
+    values = {}
+
+    def add(series: str, value: int) -> None:
+        values[series] = max(values.get(series, 0), value)
+
+    for number in Document.objects.exclude(registration_number=None).values_list('registration_number', flat=True):
+        match = REG_NUMBER_RE.match(number)
+        if match:
+            kind = 'outgoing' if match.group(1) == 'Вих' else 'incoming'
+            add(f"reg_number:{kind}:{match.group(3)}", int(match.group(2)))
+
+    for number in Case.objects.exclude(case_number=None).values_list('case_number', flat=True):
+        match = CASE_NUMBER_RE.match(number)
+        if match:
+            add(f"case_number:{match.group(1)}", int(match.group(2)))
+
+    NumeratorCounter.objects.bulk_create(
+        [NumeratorCounter(series=series, value=value) for series, value in values.items()]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cases', '0050_document_pdf_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NumeratorCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('series', models.CharField(max_length=255, unique=True, verbose_name='Серія номерів')),
+                ('value', models.BigIntegerField(default=0, verbose_name='Останнє видане значення')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Оновлено')),
+            ],
+            options={
+                'verbose_name': 'Лічильник нумератора',
+                'verbose_name_plural': 'Лічильники нумератора',
+            },
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
@@ -110,9 +110,10 @@ class Case(TimeStampModel):
     @property
     def order_datetime(self) -> Optional[datetime.datetime]:
         """Возвращает время и дату приказа."""
-        doc = self.document_set.filter(document_type__code='0034').first()
-        if doc:
-            return doc.registration_date
+        # Перебор document_set.all() позволяет использовать подгруженные (prefetch_related) документы
+        docs = [doc for doc in self.document_set.all() if doc.document_type and doc.document_type.code == '0034']
+        if docs:
+            return min(docs, key=lambda doc: doc.pk).registration_date
         return None
 
     class Meta:
@@ -173,6 +174,13 @@ class CaseHistory(TimeStampModel):
 
 class Document(TimeStampModel):
     """Модель документа дела."""
+
+    class PdfStatus(models.TextChoices):
+        PENDING = 'pending', 'Очікує конвертації у pdf'
+        CONVERTING = 'converting', 'Конвертується у pdf'
+        DONE = 'done', 'Конвертовано у pdf'
+        FAILED = 'failed', 'Помилка конвертації у pdf'
+
     claim = models.ForeignKey(Claim, on_delete=models.SET_NULL, null=True, verbose_name='Звернення')
     case = models.ForeignKey(Case, on_delete=models.SET_NULL, null=True, verbose_name='Справа')
     document_type = models.ForeignKey(DocumentType, on_delete=models.SET_NULL, null=True, verbose_name='Тип документа')
@@ -196,6 +204,15 @@ class Document(TimeStampModel):
         default=True
     )
     converted_to_pdf = models.BooleanField('Конвертовано у pdf', default=False)
+    pdf_status = models.CharField(
+        'Стан конвертації у pdf',
+        choices=PdfStatus.choices,
+        max_length=10,
+        blank=True,
+        default=''
+    )
+    pdf_file = models.CharField('Файл pdf', max_length=500, blank=True, default='')
+    pdf_error = models.TextField('Помилка конвертації у pdf', blank=True, default='')
     deleted = models.BooleanField('Видалено', default=False)
 
     @property
@@ -247,10 +264,15 @@ class Document(TimeStampModel):
             return str(path).replace(path.name, f"{path.stem}_signs.pdf")
         return str(path).replace(path.stem, f"{path.stem}_signs")
 
+    @property
+    def pdf_in_progress(self) -> bool:
+        """Ожидает ли документ конвертации в pdf или конвертируется."""
+        return self.pdf_status in (self.PdfStatus.PENDING, self.PdfStatus.CONVERTING)
+
     @property
     def can_be_sent_to_sign(self):
         """Может ли документ быть передан на подпись."""
-        return self.auto_generated and self.case and self.sign_set.count() == 0
+        return self.auto_generated and self.case and self.sign_set.count() == 0 and not self.pdf_in_progress
 
     @property
     def is_sent_to_sign(self) -> bool:
@@ -395,6 +417,73 @@ class Sign(TimeStampModel):
         db_table = 'documents_signs'
 
 
+class CaseSummary(models.Model):
+    """Сводные данные ап. дела для списков и поиска (денормализованная таблица, одна запись на дело).
+    Поддерживается в актуальном состоянии сигналами (см. signals.py) и командой rebuild_case_summary.
+    ФИО пользователей и названия из справочников (виды ОПІВ и звернень, этапы стадий) обновляются сигналами
+    при сохранении этих объектов; изменения, сделанные без сигналов (update, bulk_update), требуют перестроения."""
+    case = models.OneToOneField(
+        Case,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='summary',
+        verbose_name='Справа'
+    )
+    case_number = models.CharField('Номер справи', max_length=255, blank=True, null=True)
+    created_at = models.DateTimeField('Дата створення справи', db_index=True)
+    stage_code = models.PositiveIntegerField('Код етапу', null=True, blank=True)
+    stage_title = models.CharField('Етап стадії розгляду', max_length=1024, null=True, blank=True)
+    claim_id = models.PositiveIntegerField('Id звернення', null=True, blank=True)
+    obj_kind_id = models.PositiveIntegerField('Id виду ОПІВ', null=True, blank=True)
+    obj_kind_title = models.CharField('Вид ОПІВ', max_length=255, null=True, blank=True)
+    claim_kind_id = models.PositiveIntegerField('Id виду звернення', null=True, blank=True)
+    claim_kind_title = models.CharField('Вид звернення', max_length=255, null=True, blank=True)
+    obj_number = models.CharField('Номер заявки або охоронного документа', max_length=255, null=True, blank=True)
+    obj_title = models.CharField('Назва ОПІВ', max_length=1024, null=True, blank=True)
+    third_person = models.BooleanField('Апелянт - третя особа', default=False)
+    submission_date = models.DateTimeField('Дата та час подачі', null=True, blank=True)
+    collegium_head_name = models.CharField('Голова колегії', max_length=1024, null=True, blank=True)
+    secretary = models.ForeignKey(
+        UserModel,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Секретар'
+    )
+    secretary_name = models.CharField('Секретар (ПІБ)', max_length=1024, null=True, blank=True)
+    expert = models.ForeignKey(
+        UserModel,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Експерт'
+    )
+    papers_owner = models.ForeignKey(
+        UserModel,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Особа, у якої знаходиться паперова справа'
+    )
+    unsigned_docs_count = models.PositiveIntegerField('Кількість непідписаних документів', default=0)
+    decision_date = models.DateField('Дата оголошення рішення АП', null=True, blank=True)
+    published = models.DateTimeField('Дата та час публікації на веб-сайті', null=True, blank=True)
+    stopped = models.BooleanField('Розгляд справи припинений', default=False)
+    paused = models.BooleanField('Діловодство по справі зупинене', default=False)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Оновлено')
+
+    def __str__(self):
+        return self.case_number or ''
+
+    class Meta:
+        verbose_name = 'Зведені дані справи'
+        verbose_name_plural = 'Зведені дані справ'
+        db_table = 'cases_summary'
+
+
 class PostalProtocolExchange(models.Model):
     id_rec = models.AutoField(primary_key=True)
     id_cead = models.IntegerField(blank=True, null=True)
@@ -447,3 +536,17 @@ class EsignProtocolExchange(models.Model):
     class Meta:
         managed = False
         db_table = 'esign_protocol_exchange'
+
+
+class NumeratorCounter(models.Model):
+    """Счётчик нумератора: последнее выданное значение серии номеров (см. services/numerator_services.py)."""
+    series = models.CharField('Серія номерів', max_length=255, unique=True)
+    value = models.BigIntegerField('Останнє видане значення', default=0)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Оновлено')
+
+    def __str__(self):
+        return f"{self.series}: {self.value}"
+
+    class Meta:
+        verbose_name = 'Лічильник нумератора'
+        verbose_name_plural = 'Лічильники нумератора'
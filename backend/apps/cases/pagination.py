@@ -0,0 +1,119 @@
+from django.core.cache import cache
+from django.db.models import Q, QuerySet
+
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from typing import Optional, Tuple
+import base64
+import binascii
+import datetime
+
+
+class CaseKeysetPagination(BasePagination):
+    """Keyset-пагинация (курсор) списка ап. дел по паре полей (created_at, id).
+
+    Ожидает queryset, отсортированный по ('-created_at', '-id').
+    Количество отфильтрованных записей считается только для первой страницы и передаётся дальше в курсоре,
+    общее количество записей кешируется."""
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'length'
+    page_size = api_settings.PAGE_SIZE or 50
+    max_page_size = 500
+    total_count_cache_key = 'cases_total_count'
+    total_count_cache_timeout = 60
+
+    def __init__(self):
+        self.request = None
+        self.next_cursor = None
+        self.filtered_count = None
+        self.total_count = None
+
+    @staticmethod
+    def encode_cursor(created_at: datetime.datetime, pk: int, filtered_count: int) -> str:
+        """Кодирует позицию последней записи страницы в строку курсора."""
+        raw = f"{created_at.isoformat()}|{pk}|{filtered_count}"
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Optional[Tuple[datetime.datetime, int, int]]:
+        """Декодирует строку курсора. Возвращает None, если курсор некорректный."""
+        try:
+            raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+            created_at, pk, filtered_count = raw.split('|')
+            return datetime.datetime.fromisoformat(created_at), int(pk), int(filtered_count)
+        except (ValueError, UnicodeError, binascii.Error):
+            return None
+
+    def get_page_size(self, request) -> int:
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_total_count(self, queryset: QuerySet) -> int:
+        """Возвращает общее количество ап. дел (без учёта фильтров), значение кешируется."""
+        total_count = cache.get(self.total_count_cache_key)
+        if total_count is None:
+            total_count = queryset.model.objects.count()
+            cache.set(self.total_count_cache_key, total_count, self.total_count_cache_timeout)
+        return total_count
+
+    def paginate_queryset(self, queryset: QuerySet, request, view=None) -> list:
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        position = None
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            position = self.decode_cursor(cursor)
+
+        if position:
+            created_at, pk, self.filtered_count = position
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+        else:
+            # Первая страница - подсчёт количества отфильтрованных записей (без сортировки)
+            self.filtered_count = queryset.order_by().count()
+
+        self.total_count = self.get_total_count(queryset)
+
+        # Одна лишняя запись позволяет определить, есть ли следующая страница
+        page = list(queryset[:page_size + 1])
+        if len(page) > page_size:
+            page = page[:page_size]
+            last = page[-1]
+            self.next_cursor = self.encode_cursor(last.created_at, last.pk, self.filtered_count)
+        else:
+            self.next_cursor = None
+
+        return page
+
+    def get_next_link(self) -> Optional[str]:
+        if not self.next_cursor:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data) -> Response:
+        return Response({
+            'count': self.filtered_count,
+            'total': self.total_count,
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema: dict) -> dict:
+        return {
+            'type': 'object',
+            'properties': {
+                'count': {'type': 'integer'},
+                'total': {'type': 'integer'},
+                'next': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
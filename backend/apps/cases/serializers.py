@@ -1,7 +1,7 @@
-from django.template.loader import render_to_string
-
 from rest_framework import serializers
-from .models import Document, Sign, Case, CaseHistory
+from .models import Document, Sign, Case, CaseHistory, CaseSummary
+from .services import document_services
+from apps.common.fragment_cache import fragment_render
 from apps.classifiers.models import DocumentType, ClaimKind, ObjKind
 from apps.filling.models import Claim
 
@@ -72,6 +72,18 @@ class SignTypeSerializer(serializers.ModelSerializer):
         )
 
 
+class DocumentListSerializer(serializers.ListSerializer):
+    """Сериализатор списка документов: состояния и права пользователя вычисляются сразу для всех документов."""
+
+    def to_representation(self, data):
+        documents = list(data.all() if hasattr(data, 'all') else data)
+        self.context['documents_flags'] = document_services.document_get_flags(
+            documents,
+            self.context['request'].user
+        )
+        return super().to_representation(documents)
+
+
 class DocumentSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField(read_only=True)
     document_type = DocumentTypeSerializer()
@@ -84,22 +96,37 @@ class DocumentSerializer(serializers.ModelSerializer):
     signs_info = serializers.SerializerMethodField()
     actions = serializers.SerializerMethodField()
 
+    def get_flags(self, document: Document) -> dict:
+        """Возвращает состояния и права пользователя для документа (предвычисленные DocumentListSerializer)."""
+        flags = self.context.get('documents_flags') or {}
+        if document.pk not in flags:
+            flags = document_services.document_get_flags([document], self.context['request'].user)
+        return flags[document.pk]
+
     def get_signs_info(self, document: Document):
-        return render_to_string(
+        flags = self.get_flags(document)
+        return fragment_render(
             'cases/_partials/document_signs_info.html',
+            document,
             {
                 'document': document,
+                'flags': flags,
                 'request': self.context['request']
-            }
+            },
+            vary=(sorted(flags.items()), getattr(document, 'signs_count', None))
         )
 
     def get_actions(self, document: Document):
-        return render_to_string(
+        flags = self.get_flags(document)
+        return fragment_render(
             'cases/_partials/actions.html',
+            document,
             {
                 'document': document,
+                'flags': flags,
                 'request': self.context['request']
-            }
+            },
+            vary=(sorted(flags.items()), getattr(document, 'signs_count', None))
         )
 
     class Meta:
@@ -118,6 +145,7 @@ class DocumentSerializer(serializers.ModelSerializer):
 
             'document_type',
         )
+        list_serializer_class = DocumentListSerializer
 
 
 class CaseSerializer(serializers.ModelSerializer):
@@ -137,22 +165,86 @@ class CaseSerializer(serializers.ModelSerializer):
         )
 
     def get_case_number_link(self, case: Case):
-        return render_to_string(
+        return fragment_render(
             'cases/_partials/case_number_link.html',
+            case,
             {
                 'case': case
             }
         )
 
     def get_stage_verbal(self, case: Case):
-        return render_to_string(
+        return fragment_render(
             'cases/_partials/case_stage.html',
+            case,
             {
                 'case': case
             }
         )
 
 
+class CaseSummarySerializer(serializers.ModelSerializer):
+    """Сериализатор списка ап. дел по сводным данным (формат ответа совпадает с CaseSerializer)."""
+    id = serializers.IntegerField(source='case_id', read_only=True)
+    case_number_link = serializers.SerializerMethodField()
+    claim = serializers.SerializerMethodField()
+    stage_verbal = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CaseSummary
+        fields = (
+            'id',
+            'case_number',
+            'case_number_link',
+            'claim',
+            'stage_verbal',
+        )
+
+    def get_template_case(self, summary: CaseSummary) -> dict:
+        """Возвращает данные дела в том виде, в котором их используют шаблоны ячеек списка."""
+        return {
+            'pk': summary.case_id,
+            'case_number': summary.case_number,
+            'stopped': summary.stopped,
+            'stage_step': {'code': summary.stage_code},
+        }
+
+    def get_case_number_link(self, summary: CaseSummary):
+        return fragment_render(
+            'cases/_partials/case_number_link.html',
+            summary,
+            {
+                'case': self.get_template_case(summary)
+            }
+        )
+
+    def get_claim(self, summary: CaseSummary):
+        return {
+            'id': summary.claim_id,
+            'obj_kind': {
+                'id': summary.obj_kind_id,
+                'title': summary.obj_kind_title,
+            },
+            'claim_kind': {
+                'id': summary.claim_kind_id,
+                'title': summary.claim_kind_title,
+            },
+            'obj_number': summary.obj_number,
+            'obj_title': summary.obj_title,
+            'third_person': summary.third_person,
+            'submission_date': summary.submission_date.strftime('%d.%m.%Y %H:%M:%S') if summary.submission_date else None,
+        }
+
+    def get_stage_verbal(self, summary: CaseSummary):
+        return fragment_render(
+            'cases/_partials/case_stage.html',
+            summary,
+            {
+                'case': self.get_template_case(summary)
+            }
+        )
+
+
 class CaseHistorySerializer(serializers.ModelSerializer):
     user_fullname = serializers.ReadOnlyField(source='user.get_full_name')
     created_at = serializers.DateTimeField(format='%d.%m.%Y %H:%M:%S')
@@ -3,3 +3,9 @@ from .document_services import *
 from .sign_services import *
 from .create_document_service import *
 from .case_stage_step_change_action_service import *
+from .case_detail_context_service import *
+from .case_summary_services import *
+from .case_stage_reconcile_services import *
+from .case_template_context_service import *
+from .numerator_services import *
+from .external_sign_services import *
@@ -0,0 +1,51 @@
+from django.contrib.auth import get_user_model
+
+from apps.cases.models import Case, Document
+from apps.filling import services as filling_services
+from .case_services import case_get_stages_data
+from .document_services import document_get_to_sign_data
+
+from typing import List
+
+UserModel = get_user_model()
+
+
+class CaseDetailContext:
+    """Собирает данные страницы ап. дела.
+
+    Ап. дело должно быть загружено с профилем 'detail' (case_get_qs('detail')): стадия, обращение и
+    документы с подписями уже подгружены, поэтому дополнительно выполняются только запросы стадий
+    и полей обращения. JSON данных обращения разбирается один раз."""
+    case: Case
+    user: UserModel
+
+    def __init__(self, case: Case, user: UserModel):
+        self.case = case
+        self.user = user
+
+    def _get_documents_to_sign(self, documents: List[Document]) -> List[dict]:
+        """Документы, которые ожидают подписания пользователем (см. document_get_case_documents_to_sign)."""
+        res = []
+        for document in sorted(documents, key=lambda x: x.created_at, reverse=True):
+            for sign in document.sign_set.all():
+                if sign.user_id == self.user.pk and not sign.timestamp:
+                    res.append(document_get_to_sign_data(document))
+                    break
+        return res
+
+    def _has_unsigned_docs(self, documents: List[Document]) -> bool:
+        """Имеет ли дело неподписанные документы (см. Case.has_unsigned_docs)."""
+        for document in documents:
+            for sign in document.sign_set.all():
+                if not sign.timestamp:
+                    return True
+        return False
+
+    def build(self) -> dict:
+        documents = list(self.case.document_set.all())
+        return {
+            'stages': case_get_stages_data(self.case),
+            'claim': filling_services.claim_get_data(self.case.claim, with_documents=False),
+            'documents_to_sign': self._get_documents_to_sign(documents),
+            'case_has_unsigned_docs': self._has_unsigned_docs(documents),
+        }
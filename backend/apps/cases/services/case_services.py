@@ -4,7 +4,8 @@ from django.db.models import Count, Q, QuerySet, Prefetch
 from apps.cases.models import Case, Document, CaseStage, CaseStageStep, CaseHistory, CollegiumMembership, Sign
 from apps.filling import services as filling_services
 from . import create_document_service
-from .document_services import document_set_reg_number, document_set_barcode, document_set_reg_date
+from .document_services import document_register
+from .numerator_services import numerator_next_case_number
 from apps.classifiers import services as classifiers_services
 
 from typing import Iterable, List, Union
@@ -13,6 +14,111 @@ import datetime
 UserModel = get_user_model()
 
 
+# Профили загрузки ап. дел: какие связи подгружаются (select_related / prefetch_related)
+# и какие поля выбираются (only) в зависимости от того, для чего нужно дело
+CASE_QS_PROFILES = {
+    # Список дел (только поля, необходимые CaseSerializer)
+    'list': {
+        'select_related': (
+            'claim',
+            'claim__obj_kind',
+            'claim__claim_kind',
+            'stage_step',
+        ),
+        'prefetch_related': (),
+        'only': (
+            'id',
+            'case_number',
+            'stopped',
+            'created_at',
+            'updated_at',
+            'claim',
+            'claim__obj_number',
+            'claim__obj_title',
+            'claim__third_person',
+            'claim__submission_date',
+            'claim__obj_kind',
+            'claim__obj_kind__title',
+            'claim__claim_kind',
+            'claim__claim_kind__title',
+            'stage_step',
+            'stage_step__code',
+        ),
+    },
+    # Страница дела (шапка, данные дела, коллегия, заседания, оплаты)
+    'detail': {
+        'select_related': (
+            'claim',
+            'claim__obj_kind',
+            'claim__claim_kind',
+            'papers_owner',
+            'expert',
+            'secretary',
+            'stage_step',
+            'stage_step__stage',
+        ),
+        'prefetch_related': (
+            'collegiummembership_set__person',
+            'collegium',
+            'document_set__document_type',
+            'document_set__sign_set',
+            'refusal_reasons',
+            'meeting_set__invitation_set',
+            'payment_set',
+        ),
+        'only': (),
+    },
+    # Определение фактической стадии дела (CaseStageStepQualifier, CaseSetActualStageStepService).
+    # Документы и подписи не подгружаются: проверки стадий используют CaseDocumentFacts
+    'stage': {
+        'select_related': (
+            'claim',
+            'claim__claim_kind',
+            'secretary',
+            'stage_step',
+        ),
+        'prefetch_related': (
+            'collegiummembership_set__person',
+        ),
+        'only': (),
+    },
+    # Формирование документов дела (формы действий с делом, создание документов)
+    'documents': {
+        'select_related': (
+            'claim',
+            'claim__obj_kind',
+            'claim__claim_kind',
+            'secretary',
+            'stage_step',
+        ),
+        'prefetch_related': (
+            'collegiummembership_set__person',
+        ),
+        'only': (),
+    },
+    # Проверка доступа к действию с делом (секретарь, стадия, признаки остановки)
+    'permission': {
+        'select_related': (
+            'secretary',
+            'stage_step',
+            'stage_step__stage',
+        ),
+        'prefetch_related': (),
+        'only': (),
+    },
+}
+
+
+def case_get_qs(profile: str = 'detail') -> QuerySet[Case]:
+    """Возвращает queryset ап. дел, загружаемых согласно профилю из CASE_QS_PROFILES.
+    Сортировка по (created_at, id) позволяет использовать keyset-пагинацию."""
+    shape = CASE_QS_PROFILES[profile]
+    cases = Case.objects.select_related(*shape['select_related']).prefetch_related(*shape['prefetch_related'])
+    if shape['only']:
+        cases = cases.only(*shape['only'])
+    return cases.order_by('-created_at', '-id')
+
+
 def case_get_all_qs(order_by: str = '-created_at') -> QuerySet[Case]:
     """Возвращает список апелляционных дел, к которым есть доступ у пользователя"""
     cases = Case.objects.select_related(
@@ -39,27 +145,32 @@ def case_get_all_qs(order_by: str = '-created_at') -> QuerySet[Case]:
     return cases.distinct()
 
 
+def case_get_list_qs() -> QuerySet[Case]:
+    """Возвращает облегчённый queryset ап. дел для списка (только поля, необходимые CaseSerializer)."""
+    return case_get_qs('list')
+
+
 def case_get_all_active_qs(order_by: str = '-created_at') -> QuerySet[Case]:
     """Возвращает активные ап. дела."""
     return case_get_all_qs(order_by).exclude(stopped=True)
 
 
-def case_get_one(case_id: int) -> Case:
-    """Возвращает список апелляционных дел, к которым есть доступ у пользователя"""
-    return case_get_all_qs().filter(pk=case_id).first()
+def case_get_one(case_id: int, profile: str = 'detail') -> Case:
+    """Возвращает ап. дело, загруженное согласно профилю."""
+    return case_get_qs(profile).filter(pk=case_id).first()
 
 
 def case_filter_dt_list(cases: QuerySet[Case], current_user_id: int, user: str = None, obj_kind: int = None,
                         stage: str = None) -> Iterable[Case]:
     """Фильтрует список ап. дел по определённым параметрам."""
     # Оставляет только ап. дела, к которым имеет отношение пользователь
+    # (подзапрос по коллегии вместо JOIN, чтобы не получать дубли и не требовать distinct)
     if user and user == 'me':
-        current_user = UserModel.objects.get(pk=current_user_id)
         cases = cases.filter(
-            Q(collegiummembership__person=current_user)
-            | Q(expert=current_user)
-            | Q(secretary=current_user)
-            | Q(papers_owner=current_user)
+            Q(pk__in=CollegiumMembership.objects.filter(person_id=current_user_id).values('case_id'))
+            | Q(expert_id=current_user_id)
+            | Q(secretary_id=current_user_id)
+            | Q(papers_owner_id=current_user_id)
         )
 
     # Фильтр по типу ОИС
@@ -102,20 +213,7 @@ def case_get_documents_qs(case_id: int) -> Iterable[Document]:
 def case_generate_next_number(claim_id: int) -> str:
     """Генерирует следующий номер дела."""
     claim = filling_services.claim_get_by_id(claim_id)
-
-    now = datetime.datetime.now()
-    cur_year = now.year
-    cur_month = now.month
-
-    res = f"{claim.obj_kind.abbr}-{claim.claim_kind.abbr}-{cur_year}{cur_month}"
-
-    cases_count = Case.objects.filter(
-        created_at__year=cur_year,
-        created_at__month=cur_month
-    ).count() + 1
-
-    cases_count = str(int(cases_count) + 1).zfill(3)
-    return f"{res}-{cases_count}"
+    return numerator_next_case_number(claim.obj_kind.abbr, claim.claim_kind.abbr)
 
 
 def case_create_from_claim(claim_id: int, user: UserModel) -> Union[Case, None]:
@@ -142,9 +240,7 @@ def case_create_from_claim(claim_id: int, user: UserModel) -> Union[Case, None]:
 
         # Присваивание документам номеров и штрихкодов
         for doc in claim.document_set.all():
-            document_set_reg_number(doc.pk)
-            document_set_reg_date(doc.pk)
-            document_set_barcode(doc.pk)
+            document_register(doc)
 
         return case
     return None
@@ -152,33 +248,38 @@ def case_create_from_claim(claim_id: int, user: UserModel) -> Union[Case, None]:
 
 def case_get_stages(case_id: int) -> Union[List[dict], None]:
     """Возвращает стадии ап. дела."""
-    case = case_get_all_qs().filter(pk=case_id).first()
+    case = case_get_one(case_id, 'permission')
     if case:
-        stages = CaseStage.objects.order_by('number')
-        res = []
-        current_stage_step = case.stage_step
-        for stage in stages:
-            if current_stage_step.stage.number > stage.number:
-                status = 'done'
-            elif current_stage_step.stage.number == stage.number:
-                if case.stopped:
-                    status = 'stopped'
-                elif case.paused:
-                    status = 'paused'
-                else:
-                    status = 'current'
-            else:
-                status = 'not-active'
-
-            res.append({
-                'title': stage.title,
-                'number': stage.number,
-                'status': status
-            })
-        return res
+        return case_get_stages_data(case)
     return None
 
 
+def case_get_stages_data(case: Case) -> List[dict]:
+    """Возвращает стадии загруженного ап. дела (case.stage_step и case.stage_step.stage должны быть подгружены)."""
+    stages = CaseStage.objects.order_by('number')
+    res = []
+    current_stage_step = case.stage_step
+    for stage in stages:
+        if current_stage_step.stage.number > stage.number:
+            status = 'done'
+        elif current_stage_step.stage.number == stage.number:
+            if case.stopped:
+                status = 'stopped'
+            elif case.paused:
+                status = 'paused'
+            else:
+                status = 'current'
+        else:
+            status = 'not-active'
+
+        res.append({
+            'title': stage.title,
+            'number': stage.number,
+            'status': status
+        })
+    return res
+
+
 def case_add_history_action(case_id: int, action: str, user_id: int) -> None:
     """Добавляет действие в историю действий дела."""
     CaseHistory.objects.create(
@@ -294,27 +395,19 @@ def case_create_collegium(case_id: int, head_id: int, members_ids: List[int], si
 def case_create_docs_consider_for_acceptance(case_id: int, signer_id: int, user_id: int) -> None:
     """Создаёт документы для стадии принятия дела к рассмотрению."""
     # Получение дела
-    case = case_get_one(case_id)
+    case = case_get_one(case_id, 'documents')
 
     # Типы документов, которые необходимо создать
     doc_types = classifiers_services.get_doc_types_for_consideration(case.claim.claim_kind_id)
 
-    # Сервис создания документов
-    service = create_document_service.Service()
-
-    # Создание документов
-    for doc_type in doc_types:
-        document = service.execute(
-            case_id=case_id,
-            doc_code=doc_type['code'],
-            signer_id=signer_id,
-            user_id=user_id,
-        )
-        # Подписант документа
-        Sign.objects.create(
-            document=document,
-            user_id=signer_id,
-        )
+    # Создание документов и подписантов документов
+    create_document_service.create_documents(
+        case_id,
+        [doc_type['code'] for doc_type in doc_types],
+        user_id,
+        signer_id,
+        create_signs=True,
+    )
 
     # Запись в историю дела
     # case_add_history_action(
@@ -327,29 +420,20 @@ def case_create_docs_consider_for_acceptance(case_id: int, signer_id: int, user_
 def case_create_docs(case_id: int, doc_types_codes: Iterable[str], user_id: int, signer_id: int = None,
                      form_data: dict = None):
     """Создаёт документы ап. дела определённых типов."""
-    # Сервис создания документов
-    service = create_document_service.Service()
-
-    # Создание документов
-    for doc_type_code in doc_types_codes:
-        document = service.execute(
-            case_id=case_id,
-            doc_code=doc_type_code,
-            user_id=user_id,
-            signer_id=signer_id,
-            form_data=form_data,
-        )
-        if signer_id:
-            # Подписант документа
-            Sign.objects.create(
-                document=document,
-                user_id=signer_id,
-            )
+    # Создание документов и подписантов документов
+    create_document_service.create_documents(
+        case_id,
+        doc_types_codes,
+        user_id,
+        signer_id,
+        create_signs=bool(signer_id),
+        form_data=form_data,
+    )
 
 
 def case_renew_consideration(case_id: int, user_id: int) -> None:
     """Возобновляет рассмотрение ап. дела."""
-    case = case_get_one(case_id)
+    case = case_get_one(case_id, 'permission')
     if case.paused:
         case.paused = False
         case.save()
@@ -365,22 +449,18 @@ def case_renew_consideration(case_id: int, user_id: int) -> None:
 def case_create_docs_for_meeting_holding(case_id: int, user_id: int, form_data: dict) -> None:
     """Создаёт документы для проведения ап. заседания."""
     # Получение дела
-    case = case_get_one(case_id)
+    case = case_get_one(case_id, 'documents')
 
     # Типы документов, которые необходимо создать
     doc_types = classifiers_services.get_doc_types_for_meeting_holding(case.claim.claim_kind_id)
 
-    # Сервис создания документов
-    service = create_document_service.Service()
-
     # Создание документов
-    for doc_type in doc_types:
-        service.execute(
-            case_id=case_id,
-            doc_code=doc_type['code'],
-            user_id=user_id,
-            form_data=form_data,
-        )
+    create_document_service.create_documents(
+        case_id,
+        [doc_type['code'] for doc_type in doc_types],
+        user_id,
+        form_data=form_data,
+    )
 
 
 def case_get_user_cases_current(user_id: int) -> Iterable[Case]:
@@ -0,0 +1,172 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+
+from apps.cases.models import Case, CaseStageStep
+from apps.notifications.services import Service as NotificationService, DbChannel
+from .case_services import case_get_one
+from .case_stage_step_change_action_service import (CaseDocumentFacts, CaseStageStepQualifier,
+                                                    CaseSetActualStageStepService)
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, List, Optional, Tuple
+import logging
+import multiprocessing
+import time
+
+logger = logging.getLogger(__name__)
+
+# Стадии, переход из которых выполняется только действием пользователя (условия следующей стадии всегда выполнены)
+RECONCILE_SKIP_STAGES = (1000, 2000)
+
+# Максимальное количество последовательных переходов одного ап. дела за одну сверку
+RECONCILE_MAX_STEPS = 20
+
+
+def case_stage_reconcile_get_ids() -> List[int]:
+    """Возвращает id активных ап. дел, стадию которых необходимо сверить."""
+    return list(
+        Case.objects.filter(
+            stopped=False,
+            paused=False,
+            stage_step__isnull=False,
+        ).exclude(
+            stage_step__code__in=RECONCILE_SKIP_STAGES
+        ).order_by('pk').values_list('pk', flat=True)
+    )
+
+
+def case_stage_reconcile_one(case_id: int, dry_run: bool = False, user_id: int = None) -> Optional[dict]:
+    """Определяет фактическую стадию ап. дела и (если не dry_run) переводит дело на неё,
+    выполняя сопутствующие стадиям действия вне запроса от имени пользователя user_id.
+    Возвращает сведения о переходах или None, если стадия дела актуальна."""
+    case = case_get_one(case_id, 'stage')
+    # Дело удалено после планирования сверки
+    if not case or not case.stage_step:
+        return None
+    stage_from = case.stage_step.code
+    qualifier = CaseStageStepQualifier()
+    steps = []
+
+    if dry_run:
+        # Документы не меняются, поэтому сведения о них собираются один раз,
+        # а стадия дела меняется только в памяти
+        facts = CaseDocumentFacts.for_case(case.pk)
+        while len(steps) < RECONCILE_MAX_STEPS and case.stage_step.code not in RECONCILE_SKIP_STAGES:
+            stage_step = qualifier.get_stage_step(case, facts)
+            if not stage_step or stage_step == case.stage_step.code:
+                break
+            steps.append(stage_step)
+            case.stage_step = CaseStageStep(code=stage_step)
+    else:
+        service = CaseSetActualStageStepService(
+            qualifier, case, None, NotificationService([DbChannel()]), user_id
+        )
+        while len(steps) < RECONCILE_MAX_STEPS and case.stage_step.code not in RECONCILE_SKIP_STAGES:
+            with transaction.atomic():
+                stage_step = service.execute()
+            if not stage_step:
+                break
+            steps.append(stage_step)
+
+    if not steps:
+        return None
+    return {
+        'case_id': case.pk,
+        'case_number': case.case_number,
+        'stage_from': stage_from,
+        'steps': steps,
+    }
+
+
+def _case_stage_reconcile_chunk(case_ids: List[int], dry_run: bool) -> Tuple[List[dict], List[dict]]:
+    """Сверяет стадии пакета ап. дел. Ошибка в одном деле не прерывает обработку пакета."""
+    changes, errors = [], []
+    for case_id in case_ids:
+        try:
+            res = case_stage_reconcile_one(case_id, dry_run)
+        except Exception as e:
+            logger.exception('Case %s: stage reconciliation failed', case_id)
+            errors.append({'case_id': case_id, 'error': str(e)})
+        else:
+            if res:
+                changes.append(res)
+    return changes, errors
+
+
+def case_stage_reconcile(case_ids: Iterable[int] = None, dry_run: bool = False, batch_size: int = 100,
+                         workers: int = 1) -> dict:
+    """Сверяет стадии ап. дел (по умолчанию - всех активных) пакетами по batch_size дел.
+    При workers > 1 пакеты обрабатываются в пуле процессов.
+    Возвращает отчёт: переходы стадий, ошибки, время выполнения и производительность (дел/сек)."""
+    started = time.perf_counter()
+    case_ids = list(case_ids) if case_ids is not None else case_stage_reconcile_get_ids()
+    chunks = [case_ids[i:i + batch_size] for i in range(0, len(case_ids), batch_size)]
+
+    changes, errors = [], []
+    if workers > 1 and len(chunks) > 1:
+        # Дочерние процессы не должны использовать соединения с БД, открытые в родительском процессе
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as executor:
+            for chunk_changes, chunk_errors in executor.map(
+                    _case_stage_reconcile_chunk, chunks, [dry_run] * len(chunks)
+            ):
+                changes.extend(chunk_changes)
+                errors.extend(chunk_errors)
+    else:
+        for chunk in chunks:
+            chunk_changes, chunk_errors = _case_stage_reconcile_chunk(chunk, dry_run)
+            changes.extend(chunk_changes)
+            errors.extend(chunk_errors)
+
+    elapsed = time.perf_counter() - started
+    return {
+        'dry_run': dry_run,
+        'total': len(case_ids),
+        'changes': changes,
+        'errors': errors,
+        'elapsed': elapsed,
+        'cases_per_second': len(case_ids) / elapsed if elapsed else 0,
+    }
+
+
+def _case_stage_pending_key(case_id: int) -> str:
+    return f"case_stage_evaluation:pending:{case_id}"
+
+
+def _case_stage_lock_key(case_id: int) -> str:
+    return f"case_stage_evaluation:lock:{case_id}"
+
+
+def case_stage_schedule_evaluation(case_id: int, user_id: int = None) -> None:
+    """Планирует определение стадии ап. дела фоновой задачей после фиксации текущей транзакции.
+    Вызовы до начала выполнения задачи (в течение CASE_STAGE_EVALUATION_DELAY секунд) объединяются в одну задачу."""
+    from apps.cases.tasks import case_evaluate_stage_task
+
+    delay = getattr(settings, 'CASE_STAGE_EVALUATION_DELAY', 5)
+
+    def schedule():
+        # Отметка о запланированной задаче ставится только после фиксации транзакции (отменённая транзакция
+        # не должна откладывать определение стадии) и живёт дольше задержки на случай, если задача не будет выполнена
+        if cache.add(_case_stage_pending_key(case_id), user_id, delay + 60):
+            case_evaluate_stage_task.apply_async((case_id, user_id), countdown=delay)
+
+    transaction.on_commit(schedule)
+
+
+def case_stage_evaluation_lock_acquire(case_id: int) -> bool:
+    """Блокирует определение стадии ап. дела (не допускает параллельного выполнения для одного дела)."""
+    timeout = getattr(settings, 'CASE_STAGE_EVALUATION_LOCK_TIMEOUT', 60 * 5)
+    return cache.add(_case_stage_lock_key(case_id), True, timeout)
+
+
+def case_stage_evaluation_lock_release(case_id: int) -> None:
+    cache.delete(_case_stage_lock_key(case_id))
+
+
+def case_stage_evaluate(case_id: int, user_id: int = None) -> Optional[dict]:
+    """Определяет стадию ап. дела и выполняет сопутствующие стадиям действия.
+    Сообщение о смене стадии пользователь user_id получает оповещением."""
+    # Изменения дела после этого момента запланируют новое определение стадии
+    cache.delete(_case_stage_pending_key(case_id))
+    return case_stage_reconcile_one(case_id, user_id=user_id)
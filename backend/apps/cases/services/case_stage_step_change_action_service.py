@@ -2,22 +2,109 @@ from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.contrib import messages
 
-from apps.cases.models import Case, CaseStageStep
+from apps.cases.models import Case, CaseStageStep, Document, Sign
 from apps.classifiers import services as classifiers_services
 from .case_services import case_change_stage_step, case_get_all_persons, case_create_docs
 
 from apps.classifiers.services import get_doc_types_for_meeting
 from apps.notifications.services import Service as NotificationService
 
+from typing import Iterable, List, Optional, Set, Tuple
+import logging
+import time
+
 
 UserModel = get_user_model()
+logger = logging.getLogger(__name__)
+
+
+class CaseDocumentFacts:
+    """Сведения о документах ап. дела, необходимые для проверок стадий: коды типов документов, которые присутствуют,
+    подписаны главой АП (или заместителем), переданы на подпись и подписаны всеми подписантами."""
+    head_groups = ('Голова Апеляційної палати', 'Заступник голови Апеляційної палати')
+
+    codes: Set[str]
+    codes_signed_by_head: Set[str]
+    codes_sent_to_sign: Set[str]
+    codes_signed: Set[str]
+
+    def __init__(self, documents: Iterable[dict]):
+        """documents - словари вида {'pk': ..., 'code': ..., 'signs': [{'timestamp': ..., 'groups': {...}}, ...]}"""
+        self.codes = set()
+        self.codes_signed_by_head = set()
+        self.codes_sent_to_sign = set()
+        self.codes_signed = set()
+        # Подписан ли всеми подписантами первый (по id) документ определённого типа
+        self._first_signed = {}
+
+        for document in sorted(documents, key=lambda x: x['pk']):
+            code = document['code']
+            signs = document['signs']
+            is_signed = bool(signs) and all(sign['timestamp'] for sign in signs)
+
+            self.codes.add(code)
+            if signs:
+                self.codes_sent_to_sign.add(code)
+            if is_signed:
+                self.codes_signed.add(code)
+            for sign in signs:
+                if sign['timestamp'] and sign['groups'].intersection(self.head_groups):
+                    self.codes_signed_by_head.add(code)
+                    break
+            self._first_signed.setdefault(code, is_signed)
+
+    @classmethod
+    def for_case(cls, case_id: int) -> 'CaseDocumentFacts':
+        """Собирает сведения о документах ап. дела двумя запросами (документы; подписи с группами подписантов)."""
+        documents = {
+            pk: {'pk': pk, 'code': code, 'signs': {}}
+            for pk, code in Document.objects.filter(case_id=case_id).values_list('pk', 'document_type__code')
+        }
+        signs = Sign.objects.filter(
+            document__case_id=case_id
+        ).values_list(
+            'pk', 'document_id', 'timestamp', 'user__groups__name'
+        )
+        for sign_pk, document_id, timestamp, group in signs:
+            sign = documents[document_id]['signs'].setdefault(sign_pk, {'timestamp': timestamp, 'groups': set()})
+            if group:
+                sign['groups'].add(group)
+
+        return cls([{**item, 'signs': list(item['signs'].values())} for item in documents.values()])
+
+    def first_document_is_signed(self, code: str) -> bool:
+        """Подписан ли всеми подписантами первый документ определённого типа."""
+        return self._first_signed.get(code, False)
 
 
 class CaseStageStepQualifier:
     """Класс, задачей которого есть определить фактическую стадию ап. дела (например, по подписанным документам)."""
     case: Case
 
+    # Граф переходов: код текущей стадии -> коды стадий, в которые возможен переход (от старшей к младшей).
+    # Проверяются только стадии, достижимые из текущей.
+    transitions = {
+        1000: (2000,),
+        2000: (2001,),
+        2001: (2002,),
+        2002: (2003,),
+        2003: (2004,),
+        2004: (3000, 2005),
+        2005: (2006,),
+        2006: (3000,),
+        3000: (3001,),
+        3001: (3002, 3001),
+        3002: (4000, 3001),
+        4000: (5000, 3001),
+        5000: (6000,),
+        6000: (7000,),
+        7000: (8000,),
+    }
+
     def __init__(self):
+        self._facts: Optional[CaseDocumentFacts] = None
+        # Время выполнения проверок переходов последнего определения стадии: (код текущей стадии, код стадии, сек.)
+        self.timings: List[Tuple[int, int, float]] = []
         # Функции проверки стадий
         self.stages_checks = {
             2000: self._satisfies_2000,
@@ -37,6 +124,13 @@ class CaseStageStepQualifier:
             8000: self._satisfies_8000,
         }
 
+    @property
+    def facts(self) -> CaseDocumentFacts:
+        """Сведения о документах ап. дела (собираются один раз за определение стадии и только если нужны)."""
+        if self._facts is None:
+            self._facts = CaseDocumentFacts.for_case(self.case.pk)
+        return self._facts
+
     def _satisfies_2000(self):
         """Удовлетворяет условиям стадии 2000 "Прийнято в роботу. Очікує на заповнення досьє."."""
         return self.case.stage_step.code == 1000
@@ -53,11 +147,7 @@ class CaseStageStepQualifier:
         """Удовлетворяет условиям стадии 2003 "Розпорядження підписано. Очікує на прийняття до розгляду."."""
         if self.case.stage_step.code == 2002:
             # Коды документов, которые д.б. подписаны
-            doc_codes_to_sign = ['0005', '0028']
-            for document in self.case.document_set.all():
-                if document.document_type.code in doc_codes_to_sign and document.is_signed_by_head:
-                    doc_codes_to_sign.remove(document.document_type.code)
-            return len(doc_codes_to_sign) == 0
+            return {'0005', '0028'}.issubset(self.facts.codes_signed_by_head)
         return False
 
     def _satisfies_2004(self):
@@ -69,9 +159,7 @@ class CaseStageStepQualifier:
             }
 
             # Множество кодов документов, которые присутствуют у дела
-            doc_types_current = {
-                x.document_type.code for x in self.case.document_set.select_related('document_type').all()
-            }
+            doc_types_current = self.facts.codes
 
             # Проверка есть ли коды документов, которые должны присутствовать на стадии, в текущих документах дела
             return doc_types_should_exist.issubset(doc_types_current)
@@ -87,9 +175,7 @@ class CaseStageStepQualifier:
             }
 
             # Множество кодов документов, которые присутствуют у дела
-            doc_types_current = {
-                x.document_type.code for x in self.case.document_set.select_related('document_type').all()
-            }
+            doc_types_current = self.facts.codes
 
             # Проверка есть ли коды документов, которые должны присутствовать на стадии, в текущих документах дела
             if doc_types_should_exist.issubset(doc_types_current):
@@ -109,9 +195,7 @@ class CaseStageStepQualifier:
             }
 
             # Множество кодов документов, которые присутствуют у дела
-            doc_types_current = {
-                x.document_type.code for x in self.case.document_set.select_related('document_type').all()
-            }
+            doc_types_current = self.facts.codes
 
             # Проверка есть ли коды документов, которые должны присутствовать на стадии, в текущих документах дела
             return doc_types_should_exist.issubset(doc_types_current)
@@ -127,9 +211,7 @@ class CaseStageStepQualifier:
             }
 
             # Множество кодов подписанных документов, которые присутствуют у дела
-            doc_types_current = {
-                x.document_type.code for x in self.case.document_set.all() if x.is_signed_by_head
-            }
+            doc_types_current = self.facts.codes_signed_by_head
 
             # Проверка есть ли коды документов, которые должны присутствовать на стадии,
             # в текущих подписанных документах дела
@@ -137,8 +219,7 @@ class CaseStageStepQualifier:
 
         elif self.case.stage_step.code == 2006:
             # Проверка есть ли подписанный протокол предварительного заседания
-            document = self.case.document_set.filter(document_type__code='0027').first()
-            return document and document.is_signed
+            return self.facts.first_document_is_signed('0027')
 
         return False
 
@@ -183,9 +264,7 @@ class CaseStageStepQualifier:
                 }
 
                 # Множество кодов подписанных документов, которые присутствуют у дела
-                doc_types_current = {
-                    x.document_type.code for x in self.case.document_set.all() if x.is_signed_by_head
-                }
+                doc_types_current = self.facts.codes_signed_by_head
 
                 # Проверка есть ли коды документов, которые должны присутствовать на стадии,
                 # в текущих подписанных документах дела
@@ -202,9 +281,7 @@ class CaseStageStepQualifier:
             }
 
             # Множество кодов документов, которые присутствуют у дела
-            doc_types_current = {
-                x.document_type.code for x in self.case.document_set.all()
-            }
+            doc_types_current = self.facts.codes
 
             # Проверка есть ли коды документов, которые должны присутствовать на стадии,
             # в текущих документах дела
@@ -220,10 +297,7 @@ class CaseStageStepQualifier:
             }
 
             # Множество кодов документов переданных на подпись, которые присутствуют у дела
-            doc_set = self.case.document_set.prefetch_related('sign_set').all()
-            doc_types_current = {
-                x.document_type.code for x in doc_set if x.is_sent_to_sign
-            }
+            doc_types_current = self.facts.codes_sent_to_sign
 
             # Проверка есть ли коды документов, которые должны присутствовать на стадии,
             # в текущих документах дела
@@ -239,10 +313,7 @@ class CaseStageStepQualifier:
             }
 
             # Множество кодов документов переданных на подпись, которые присутствуют у дела
-            doc_set = self.case.document_set.prefetch_related('sign_set').all()
-            doc_types_current = {
-                x.document_type.code for x in doc_set if x.is_signed
-            }
+            doc_types_current = self.facts.codes_signed
 
             # Проверка есть ли коды документов, которые должны присутствовать на стадии,
             # в текущих документах дела
@@ -253,33 +324,54 @@ class CaseStageStepQualifier:
         """Удовлетворяет условиям стадии 8000 "Опубліковано на веб-сайті. Справу закрито."."""
         return self.case.stage_step.code == 7000 and self.case.published
 
-    def get_stage_step(self, case: Case) -> int:
+    def get_stage_step(self, case: Case, facts: CaseDocumentFacts = None) -> int:
         self.case = case
-        # Проверка стадий в обратном порядке (от старшей к младшей)
-        for stage in sorted(self.stages_checks.keys(), reverse=True):
-            if self.stages_checks[stage]():
+        self._facts = facts
+        self.timings = []
+        current_code = case.stage_step.code if case.stage_step else None
+
+        # Проверка стадий, в которые возможен переход из текущей (от старшей к младшей)
+        for stage in self.transitions.get(current_code, ()):
+            started = time.perf_counter()
+            satisfies = self.stages_checks[stage]()
+            elapsed = time.perf_counter() - started
+            self.timings.append((current_code, stage, elapsed))
+            logger.debug('Case %s: transition %s -> %s checked in %.4f s', case.pk, current_code, stage, elapsed)
+            if satisfies:
                 return stage
         return 0
 
 
 class CaseSetActualStageStepService:
-    """Присваивает значение актуальной стадии ап. дела и производит сопутствующие стадии действия."""
+    """Присваивает значение актуальной стадии ап. дела и производит сопутствующие стадии действия.
+    Вне запроса (request=None, например, в фоновых задачах) действия выполняются от имени пользователя user_id
+    (может быть не указан), а сообщения Django Messages не добавляются."""
     def __init__(self,
                  qualifier: CaseStageStepQualifier,
                  case: Case,
                  request,
-                 notification_service: NotificationService):
+                 notification_service: NotificationService,
+                 user_id: int = None):
         self.case = case
         self.qualifier = qualifier
         self.request = request
         self.notification_service = notification_service
+        self.user_id = request.user.pk if request else user_id
+
+    def _add_message(self, message: str) -> None:
+        """Добавляет сообщение Django Messages, а вне запроса - оповещает пользователя, от имени которого
+        выполняются действия."""
+        if self.request:
+            messages.add_message(self.request, messages.SUCCESS, message)
+        elif self.user_id:
+            self.notification_service.execute(message, [self.user_id])
 
     def _call_2000_actions(self):
         """Выполнение действий, характерных для стадии 2000 -
         "Прийнято в роботу. Очікує на заповнення досьє."."""
-        self.case.secretary = self.request.user
+        self.case.secretary_id = self.user_id
         self.case.save()
-        case_change_stage_step(self.case.pk, 2000, self.request.user.pk)
+        case_change_stage_step(self.case.pk, 2000, self.user_id)
         self.case.refresh_from_db()
         self.notify_all_persons()
 
@@ -287,13 +379,13 @@ class CaseSetActualStageStepService:
         # Текущий пользователь и есть секретарь, т.к. данную операцию проводит только пользователь с ролью секретарь
         case_url = reverse('cases-detail', kwargs={'pk': self.case.pk})
         message = f'Вас призначено секретарем по справі <b><a href="{case_url}">{self.case.case_number}</a></b>'
-        messages.add_message(self.request, messages.SUCCESS, message)
-        self.notification_service.execute(message, [self.request.user.pk])
+        self._add_message(message)
+        self.notification_service.execute(message, [self.user_id])
 
     def _call_2001_actions(self):
         """Выполнение действий, характерных для стадии 2001 -
         "Досьє заповнено. Очікує на розподіл колегії."."""
-        case_change_stage_step(self.case.pk, 2001, self.request.user.pk)
+        case_change_stage_step(self.case.pk, 2001, self.user_id)
         self.case.refresh_from_db()
         self.notify_all_persons()
 
@@ -301,14 +393,14 @@ class CaseSetActualStageStepService:
         case_url = reverse('cases-detail', kwargs={'pk': self.case.pk})
         message = f'Вас запрошено у якості експерта до участі у розгляду справи ' \
                   f'<b><a href="{case_url}">{self.case.case_number}</a></b>'
-        if self.case.expert == self.request.user:
-            messages.add_message(self.request, messages.SUCCESS, message)
+        if self.case.expert_id and self.case.expert_id == self.user_id:
+            self._add_message(message)
             self.notification_service.execute(message, [self.case.expert.pk])
 
     def _call_2002_actions(self):
         """Выполнение действий, характерных для стадии 2002 -
         "Здійснено розподіл колегії. Очікує на підписання розпорядження."."""
-        case_change_stage_step(self.case.pk, 2002, self.request.user.pk)
+        case_change_stage_step(self.case.pk, 2002, self.user_id)
         self.case.refresh_from_db()
         self.notify_all_persons()
 
@@ -325,7 +417,7 @@ class CaseSetActualStageStepService:
         """Выполнение действий, характерных для стадии 2003 -
         "Розпорядження підписано. Очікує на прийняття до розгляду."."""
         # Изменение стадии дела
-        case_change_stage_step(self.case.pk, 2003, self.request.user.pk)
+        case_change_stage_step(self.case.pk, 2003, self.user_id)
         self.case.refresh_from_db()
         self.notify_all_persons()
 
@@ -333,7 +425,7 @@ class CaseSetActualStageStepService:
         """Выполнение действий, характерных для стадии 2004 -
         "Документи для прийняття справи до розгляду очікують на підписання."."""
         # Изменение стадии дела
-        case_change_stage_step(self.case.pk, 2004, self.request.user.pk)
+        case_change_stage_step(self.case.pk, 2004, self.user_id)
         self.case.refresh_from_db()
         self.notify_all_persons()
 
@@ -341,7 +433,7 @@ class CaseSetActualStageStepService:
         """Выполнение действий, характерных для стадии 2005 -
         "Документи для прийняття справи до розгляду очікують на підписання."."""
         # Изменение стадии дела
-        case_change_stage_step(self.case.pk, 2005, self.request.user.pk)
+        case_change_stage_step(self.case.pk, 2005, self.user_id)
         self.case.refresh_from_db()
         self.notify_all_persons()
 
@@ -357,7 +449,7 @@ class CaseSetActualStageStepService:
         """Выполнение действий, характерных для стадии 2005 -
         "Документи для прийняття справи до розгляду очікують на підписання."."""
         # Изменение стадии дела
-        case_change_stage_step(self.case.pk, 2006, self.request.user.pk)
+        case_change_stage_step(self.case.pk, 2006, self.user_id)
         self.case.refresh_from_db()
         self.notify_all_persons()
 
@@ -373,7 +465,7 @@ class CaseSetActualStageStepService:
         """Выполнение действий, характерных для стадии 3000 -
         "Справу прийнято до розгляду. Очікує на призначення засідання."."""
         # Изменение стадии дела
-        case_change_stage_step(self.case.pk, 3000, self.request.user.pk)
+        case_change_stage_step(self.case.pk, 3000, self.user_id)
         self.case.refresh_from_db()
         self.notify_all_persons()
 
@@ -381,7 +473,7 @@ class CaseSetActualStageStepService:
         """Выполнение действий, характерных для стадии 3001 -
         "Створене засідання АП. Чекає на погодження членів колегії."."""
         # Изменение стадии дела
-        case_change_stage_step(self.case.pk, 3001, self.request.user.pk)
+        case_change_stage_step(self.case.pk, 3001, self.user_id)
         self.case.refresh_from_db()
 
         # Оповещение членов коллегии о приглашении к участии в заседании
@@ -402,7 +494,7 @@ class CaseSetActualStageStepService:
         """Выполнение действий, характерных для стадии 3002 -
         "Створене засідання АП. Чекає на підписання документів."."""
         # Изменение стадии дела
-        case_change_stage_step(self.case.pk, 3002, self.request.user.pk)
+        case_change_stage_step(self.case.pk, 3002, self.user_id)
         self.case.refresh_from_db()
 
         # Оповещение людей, причастных к данному ап. делу, а также главы АП и его заместителей
@@ -412,7 +504,7 @@ class CaseSetActualStageStepService:
         case_create_docs(
             self.case.pk,
             [x['code'] for x in get_doc_types_for_meeting(self.case.claim.claim_kind_id)],
-            self.request.user.pk,
+            self.user_id,
             self.case.collegium_head.pk
         )
         self.notification_service.execute(
@@ -424,7 +516,7 @@ class CaseSetActualStageStepService:
         """Выполнение действий, характерных для стадии 4000 -
         "Чекає на проведення засідання Апеляційної палати."."""
         # Изменение стадии дела
-        case_change_stage_step(self.case.pk, 4000, self.request.user.pk)
+        case_change_stage_step(self.case.pk, 4000, self.user_id)
         self.case.refresh_from_db()
         self.notify_all_persons()
 
@@ -432,7 +524,7 @@ class CaseSetActualStageStepService:
         """Выполнение действий, характерных для стадии 5000 -
         "Апеляційне засідання проведено. Чекає передачу документів на підпис."."""
         # Изменение стадии дела
-        case_change_stage_step(self.case.pk, 5000, self.request.user.pk)
+        case_change_stage_step(self.case.pk, 5000, self.user_id)
         self.case.refresh_from_db()
         self.notify_all_persons()
 
@@ -440,7 +532,7 @@ class CaseSetActualStageStepService:
         """Выполнение действий, характерных для стадии 6000 -
         "Документи рішення сформовані та чекають на підписання."."""
         # Изменение стадии дела
-        case_change_stage_step(self.case.pk, 6000, self.request.user.pk)
+        case_change_stage_step(self.case.pk, 6000, self.user_id)
         self.case.refresh_from_db()
         self.notify_all_persons()
 
@@ -448,7 +540,7 @@ class CaseSetActualStageStepService:
         """Выполнение действий, характерных для стадии 7000 -
         "Очікує на передачу документів на веб-сайт"."""
         # Изменение стадии дела
-        case_change_stage_step(self.case.pk, 7000, self.request.user.pk)
+        case_change_stage_step(self.case.pk, 7000, self.user_id)
         self.case.refresh_from_db()
         self.notify_all_persons()
 
@@ -456,7 +548,7 @@ class CaseSetActualStageStepService:
         """Выполнение действий, характерных для стадии 8000 -
         "Опубліковано на веб-сайті. Справу закрито."."""
         # Изменение стадии дела
-        case_change_stage_step(self.case.pk, 8000, self.request.user.pk)
+        case_change_stage_step(self.case.pk, 8000, self.user_id)
 
         self.case.refresh_from_db()
 
@@ -471,10 +563,13 @@ class CaseSetActualStageStepService:
         главы АП, заместителей, текущего пользователя."""
         # Оповещение пользователя, совершившего операцию, с помощью Django Messages
         message = self.get_message_stage()
-        messages.add_message(self.request, messages.SUCCESS, message)
+        self._add_message(message)
 
         # Оповещение людей, причастных к данному ап. делу, а также главы АП и его заместителей
+        # (вне запроса пользователь уже оповещён в _add_message)
         users_ids = case_get_all_persons(self.case.pk)
+        if not self.request:
+            users_ids = [x for x in users_ids if x != self.user_id]
         self.notification_service.execute(message, users_ids)
 
     def get_message_stage(self):
@@ -485,9 +580,9 @@ class CaseSetActualStageStepService:
                   f'змінено на <b>"{stage.title}"</b> (код стадії - {stage.code})'
         return message
 
-    def execute(self):
-        # Определение стадии
-        case_stage_step = self.qualifier.get_stage_step(self.case)
+    def execute(self, facts: CaseDocumentFacts = None):
+        # Определение стадии (сведения о документах, если не переданы, собираются квалификатором)
+        case_stage_step = self.qualifier.get_stage_step(self.case, facts)
 
         # Сравнение определённой стадии с текущей стадией, чтобы не предпринимать действия если они совпадают
         if self.case.stage_step.code != case_stage_step:
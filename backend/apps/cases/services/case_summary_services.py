@@ -0,0 +1,202 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, Q, QuerySet, Prefetch
+from django.utils import timezone
+
+from apps.cases.models import Case, CaseStageStep, CaseSummary, CollegiumMembership
+from apps.classifiers.models import ClaimKind, ObjKind
+
+from typing import Iterable, Optional
+import threading
+
+UserModel = get_user_model()
+
+# Ап. дела, обновление сводных данных которых запланировано и ещё не выполнено (для каждого потока)
+_local = threading.local()
+
+
+def case_summary_get_source_qs() -> QuerySet[Case]:
+    """Возвращает queryset ап. дел со всеми данными, необходимыми для формирования сводных данных."""
+    return Case.objects.select_related(
+        'claim',
+        'claim__obj_kind',
+        'claim__claim_kind',
+        'stage_step',
+        'secretary',
+    ).prefetch_related(
+        Prefetch(
+            'collegiummembership_set',
+            queryset=CollegiumMembership.objects.filter(is_head=True).select_related('person'),
+            to_attr='head_memberships'
+        ),
+    ).annotate(
+        unsigned_docs_count=Count('document', filter=Q(document__sign__timestamp=''), distinct=True)
+    )
+
+
+def _user_full_name(user: Optional[UserModel]) -> Optional[str]:
+    """Возвращает ФИО пользователя (или e-mail, если ФИО получить невозможно)."""
+    if not user:
+        return None
+    try:
+        return user.get_full_name
+    except AttributeError:
+        return user.email
+
+
+def case_summary_build(case: Case) -> CaseSummary:
+    """Формирует (без сохранения) сводные данные ап. дела, загруженного через case_summary_get_source_qs."""
+    claim = case.claim
+    head = case.head_memberships[0].person if case.head_memberships else None
+    return CaseSummary(
+        case_id=case.pk,
+        case_number=case.case_number,
+        created_at=case.created_at,
+        stage_code=case.stage_step.code if case.stage_step else None,
+        stage_title=case.stage_step.title if case.stage_step else None,
+        claim_id=claim.pk if claim else None,
+        obj_kind_id=claim.obj_kind_id if claim else None,
+        obj_kind_title=claim.obj_kind.title if claim else None,
+        claim_kind_id=claim.claim_kind_id if claim else None,
+        claim_kind_title=claim.claim_kind.title if claim else None,
+        obj_number=claim.obj_number if claim else None,
+        obj_title=claim.obj_title if claim else None,
+        third_person=claim.third_person if claim else False,
+        submission_date=claim.submission_date if claim else None,
+        collegium_head_name=_user_full_name(head),
+        secretary_id=case.secretary_id,
+        secretary_name=_user_full_name(case.secretary),
+        expert_id=case.expert_id,
+        papers_owner_id=case.papers_owner_id,
+        unsigned_docs_count=case.unsigned_docs_count,
+        decision_date=case.decision_date,
+        published=case.published,
+        stopped=case.stopped,
+        paused=case.paused,
+    )
+
+
+def case_summary_refresh(case_id: int) -> None:
+    """Обновляет сводные данные ап. дела (удаляет их, если дело не существует)."""
+    case = case_summary_get_source_qs().filter(pk=case_id).first()
+    if case:
+        case_summary_build(case).save()
+    else:
+        CaseSummary.objects.filter(pk=case_id).delete()
+
+
+def case_summary_schedule_refresh(case_id: Optional[int]) -> None:
+    """Планирует обновление сводных данных ап. дела после фиксации текущей транзакции
+    (несколько изменений дела в одной транзакции приводят к одному обновлению)."""
+    if not case_id:
+        return
+
+    if not hasattr(_local, 'pending'):
+        _local.pending = set()
+    _local.pending.add(case_id)
+
+    def refresh():
+        # Дело уже обновлено функцией, запланированной ранее в этой же транзакции.
+        # После отмены транзакции её функции не выполняются, и дело обновится при следующей фиксации
+        if case_id not in _local.pending:
+            return
+        _local.pending.discard(case_id)
+        case_summary_refresh(case_id)
+
+    transaction.on_commit(refresh)
+
+
+def case_summary_update_user_names(user: UserModel) -> int:
+    """Обновляет ФИО пользователя в сводных данных ап. дел, где он секретарь или глава коллегии.
+    Изменяются только записи с другим ФИО (сохранение пользователя без изменения ФИО не изменяет записи).
+    Возвращает количество обновлённых записей."""
+    name = _user_full_name(user)
+    now = timezone.now()
+    updated = CaseSummary.objects.filter(
+        secretary_id=user.pk
+    ).exclude(
+        secretary_name=name
+    ).update(secretary_name=name, updated_at=now)
+    updated += CaseSummary.objects.filter(
+        case_id__in=CollegiumMembership.objects.filter(person_id=user.pk, is_head=True).values('case_id')
+    ).exclude(
+        collegium_head_name=name
+    ).update(collegium_head_name=name, updated_at=now)
+    return updated
+
+
+def case_summary_update_obj_kind_title(obj_kind: ObjKind) -> int:
+    """Обновляет название вида ОПІВ в сводных данных ап. дел."""
+    return CaseSummary.objects.filter(
+        obj_kind_id=obj_kind.pk
+    ).exclude(
+        obj_kind_title=obj_kind.title
+    ).update(obj_kind_title=obj_kind.title, updated_at=timezone.now())
+
+
+def case_summary_update_claim_kind_title(claim_kind: ClaimKind) -> int:
+    """Обновляет название вида звернення в сводных данных ап. дел."""
+    return CaseSummary.objects.filter(
+        claim_kind_id=claim_kind.pk
+    ).exclude(
+        claim_kind_title=claim_kind.title
+    ).update(claim_kind_title=claim_kind.title, updated_at=timezone.now())
+
+
+def case_summary_update_stage_step(stage_step: CaseStageStep) -> int:
+    """Обновляет код и название этапа стадии в сводных данных ап. дел, находящихся на этом этапе."""
+    return CaseSummary.objects.filter(
+        case_id__in=Case.objects.filter(stage_step_id=stage_step.pk).values('pk')
+    ).exclude(
+        stage_code=stage_step.code, stage_title=stage_step.title
+    ).update(stage_code=stage_step.code, stage_title=stage_step.title, updated_at=timezone.now())
+
+
+def case_summary_rebuild(batch_size: int = 500) -> int:
+    """Полностью перестраивает сводные данные ап. дел. Возвращает количество обработанных дел."""
+    CaseSummary.objects.exclude(case_id__in=Case.objects.values('pk')).delete()
+
+    total = 0
+    cases_ids = list(Case.objects.order_by('pk').values_list('pk', flat=True))
+    for i in range(0, len(cases_ids), batch_size):
+        batch_ids = cases_ids[i:i + batch_size]
+        summaries = [case_summary_build(case) for case in case_summary_get_source_qs().filter(pk__in=batch_ids)]
+        with transaction.atomic():
+            CaseSummary.objects.filter(pk__in=batch_ids).delete()
+            CaseSummary.objects.bulk_create(summaries)
+        total += len(summaries)
+
+    return total
+
+
+def case_summary_get_list_qs() -> QuerySet[CaseSummary]:
+    """Возвращает сводные данные ап. дел для списка.
+    Сортировка по (created_at, case_id) позволяет использовать keyset-пагинацию."""
+    return CaseSummary.objects.order_by('-created_at', '-case_id')
+
+
+def case_summary_filter_dt_list(summaries: QuerySet[CaseSummary], current_user_id: int, user: str = None,
+                                obj_kind: int = None, stage: str = None) -> Iterable[CaseSummary]:
+    """Фильтрует сводные данные ап. дел по определённым параметрам (см. case_filter_dt_list)."""
+    # Оставляет только ап. дела, к которым имеет отношение пользователь
+    if user and user == 'me':
+        summaries = summaries.filter(
+            Q(pk__in=CollegiumMembership.objects.filter(person_id=current_user_id).values('case_id'))
+            | Q(expert_id=current_user_id)
+            | Q(secretary_id=current_user_id)
+            | Q(papers_owner_id=current_user_id)
+        )
+
+    # Фильтр по типу ОИС
+    if obj_kind and obj_kind != 'all':
+        summaries = summaries.filter(obj_kind_id=obj_kind)
+
+    if stage and stage != 'all':
+        if stage == 'new':
+            summaries = summaries.filter(stage_code=1000)
+        elif stage == 'finished':
+            summaries = summaries.filter(stopped=True)
+        else:
+            summaries = summaries.filter(stage_code__gt=1000).exclude(stopped=True)
+
+    return summaries
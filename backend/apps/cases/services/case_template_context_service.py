@@ -0,0 +1,407 @@
+from django.contrib.auth import get_user_model
+from django.utils.functional import cached_property
+
+from apps.cases.models import Case, Document, CollegiumMembership
+from apps.common.utils import first_lower
+
+from typing import Dict, List, Optional, Tuple
+
+UserModel = get_user_model()
+
+
+class CaseTemplateContext:
+    """Значения переменных шаблонов документов ап. дела.
+
+    Значения вычисляются при первом обращении и только один раз (документ обращения, коллегия и заседания
+    загружаются не более одного раза), поэтому документы нескольких типов формируются из одного контекста,
+    а для каждого документа вычисляются только переменные его шаблона (см. DOC_TYPES_VARS)."""
+    case: Case
+    signer: Optional[UserModel]
+    form_data: dict
+
+    def __init__(self, case: Case, signer: UserModel = None, form_data: dict = None):
+        self.case = case
+        self.signer = signer
+        self.form_data = form_data or {}
+
+    def get_vars(self, doc_code: str) -> Dict[str, str]:
+        """Возвращает значения переменных шаблона документа определённого типа."""
+        return {placeholder: getattr(self, attr) for placeholder, attr in DOC_TYPES_VARS.get(doc_code, {}).items()}
+
+    # Данные дела
+
+    @cached_property
+    def claim_doc(self) -> Document:
+        """Документ обращения."""
+        return Document.objects.get(document_type__code__in=('0001', '0002', '0003', '0004'), claim=self.case.claim)
+
+    @cached_property
+    def memberships(self) -> List[CollegiumMembership]:
+        return list(self.case.collegiummembership_set.all())
+
+    @cached_property
+    def head(self) -> Optional[UserModel]:
+        """Глава коллегии."""
+        return next((x.person for x in self.memberships if x.is_head), None)
+
+    @cached_property
+    def members(self) -> List[UserModel]:
+        """Члены коллегии (кроме главы)."""
+        return [x.person for x in self.memberships if not x.is_head]
+
+    @cached_property
+    def case_number(self) -> str:
+        return self.case.case_number
+
+    @cached_property
+    def addressee(self) -> str:
+        return self.case.addressee
+
+    @cached_property
+    def address(self) -> str:
+        return self.case.address
+
+    @cached_property
+    def meeting_datetime(self) -> str:
+        """Дата и время последнего заседания."""
+        return self.case.meeting_set.order_by('-pk').first().datetime.strftime('%d.%m.%Y %H:%M:%S')
+
+    @cached_property
+    def pre_meeting_datetime(self) -> str:
+        """Дата и время подготовительного заседания."""
+        pre_meeting = self.case.meeting_set.filter(meeting_type='PRE').first()
+        return pre_meeting.datetime.strftime('%d.%m.%Y %H:%M:%S') if pre_meeting else ''
+
+    # Обращение
+
+    @cached_property
+    def obj_kind_title(self) -> str:
+        return first_lower(self.case.claim.obj_kind.title)
+
+    @cached_property
+    def claim_kind_title(self) -> str:
+        return first_lower(self.case.claim.claim_kind.template_title)
+
+    @cached_property
+    def obj_title(self) -> str:
+        return self.case.claim.obj_title
+
+    @cached_property
+    def obj_number(self) -> str:
+        return self.case.claim.obj_number
+
+    @cached_property
+    def appellant_title(self) -> str:
+        return self.case.claim.get_appellant_title()
+
+    @cached_property
+    def appellant_address(self) -> str:
+        return self.case.claim.get_appellant_address()
+
+    @cached_property
+    def applicant_title(self) -> str:
+        return self.case.claim.get_applicant_title()
+
+    @cached_property
+    def applicant_address(self) -> str:
+        return self.case.claim.get_applicant_address()
+
+    @cached_property
+    def owner_title(self) -> str:
+        return self.case.claim.get_owner_title()
+
+    @cached_property
+    def owner_address(self) -> str:
+        return self.case.claim.get_owner_address()
+
+    @cached_property
+    def appellant_with_represent_title(self) -> str:
+        """Апеллянт (заявитель) и его представитель."""
+        represent = self.case.claim.get_represent_title()
+        if represent:
+            return f'{self.applicant_title} (представник - {represent})'
+        return self.applicant_title
+
+    @cached_property
+    def represent_or_appellant(self) -> Tuple[str, str]:
+        """Представитель апеллянта или апеллянт (имя и адрес)."""
+        claim = self.case.claim
+        represent = claim.get_represent_title(third_person=claim.third_person)
+        if represent:
+            return represent, claim.get_represent_address()
+        return self.appellant_title, self.appellant_address
+
+    @cached_property
+    def represent_or_appellant_title(self) -> str:
+        return self.represent_or_appellant[0]
+
+    @cached_property
+    def represent_or_appellant_address(self) -> str:
+        return self.represent_or_appellant[1]
+
+    @cached_property
+    def case_extra_info(self) -> str:
+        """Дополнительная информация о деле (апеллянт, номер заявки, заявитель/владелец)."""
+        claim = self.case.claim
+        res = f"апелянт - {self.appellant_title}"
+        if claim.claim_kind.claim_sense == 'DE':
+            res += f", номер заявки: {claim.obj_number}"
+
+        if claim.third_person:
+            if claim.claim_kind.claim_sense == 'DE':
+                res += f", заявник: {self.applicant_title}"
+            else:
+                res += f"номер охоронного документа: {claim.obj_number}, " \
+                       f"власник: {self.owner_title}"
+        return res
+
+    @cached_property
+    def claim_doc_reg_num(self) -> str:
+        return self.claim_doc.registration_number
+
+    @cached_property
+    def claim_doc_reg_date(self) -> str:
+        return self.claim_doc.input_date.strftime("%d.%m.%Y")
+
+    @cached_property
+    def doc_download_code(self) -> str:
+        """Последние 10 цифр штрих-кода документа обращения."""
+        return self.claim_doc.barcode[-10:]
+
+    # Коллегия
+
+    @cached_property
+    def head_title(self) -> str:
+        return self.head.get_full_name if self.head else ''
+
+    @cached_property
+    def head_title_short(self) -> str:
+        return self.head.get_full_name_initials()
+
+    @cached_property
+    def head_position(self) -> str:
+        return first_lower(self.head.position) if self.head else ''
+
+    @cached_property
+    def member_1_title(self) -> str:
+        return self.members[0].get_full_name
+
+    @cached_property
+    def member_1_title_short(self) -> str:
+        return self.members[0].get_full_name_initials()
+
+    @cached_property
+    def member_1_position(self) -> str:
+        return first_lower(self.members[0].position)
+
+    @cached_property
+    def member_2_title(self) -> str:
+        return self.members[1].get_full_name
+
+    @cached_property
+    def member_2_title_short(self) -> str:
+        return self.members[1].get_full_name_initials()
+
+    @cached_property
+    def member_2_position(self) -> str:
+        return first_lower(self.members[1].position)
+
+    @cached_property
+    def collegium_initials(self) -> str:
+        """Все члены коллегии, включая главу (фамилия и инициалы)."""
+        return ', '.join(x.person.get_full_name_initials() for x in self.memberships)
+
+    @cached_property
+    def members_titles(self) -> str:
+        """Члены коллегии, кроме главы."""
+        return f'{self.member_1_title}, {self.member_2_title}'
+
+    # Секретарь и подписант
+
+    @cached_property
+    def secretary_title(self) -> str:
+        return self.case.secretary.get_full_name
+
+    @cached_property
+    def secretary_title_short(self) -> str:
+        return self.case.secretary.get_full_name_initials()
+
+    @cached_property
+    def secretary_position(self) -> str:
+        return self.case.secretary.position
+
+    @cached_property
+    def secretary_email(self) -> str:
+        return self.case.secretary.email
+
+    @cached_property
+    def secretary_phone(self) -> str:
+        return self.case.secretary.phone_number or ''
+
+    @cached_property
+    def signer_title(self) -> str:
+        return self.signer.get_full_name
+
+    @cached_property
+    def signer_position(self) -> str:
+        return self.signer.position
+
+    # Данные формы
+
+    @cached_property
+    def reason(self) -> str:
+        return self.form_data.get('reason', '')
+
+    @cached_property
+    def circumstances(self) -> str:
+        return self.form_data.get('circumstances', '')
+
+    @cached_property
+    def order_date(self) -> str:
+        return self.form_data['order_date'].strftime('%d.%m.%Y') if self.form_data.get('order_date') else 'Дата наказу'
+
+    @cached_property
+    def order_number(self) -> str:
+        return self.form_data.get('order_number') or 'Номер наказу'
+
+    @cached_property
+    def director_position(self) -> str:
+        return self.form_data.get('signer_position') or 'Посада підписанта'
+
+    @cached_property
+    def director_name(self) -> str:
+        return self.form_data.get('signer_name') or 'ПІБ підписанта'
+
+
+# Переменная шаблона -> атрибут CaseTemplateContext (значение по умолчанию)
+VARS = {
+    '{{ CASE_NUMBER }}': 'case_number',
+    '{{ CLAIM_KIND }}': 'claim_kind_title',
+    '{{ OBJ_KIND }}': 'obj_kind_title',
+    '{{ OBJ_KIND_TITLE }}': 'obj_kind_title',
+    '{{ OBJ_TITLE }}': 'obj_title',
+    '{{ OBJ_NUMBER }}': 'obj_number',
+    '{{ APP_NUMBER }}': 'obj_number',
+    '{{ REGISTRATION_NUMBER }}': 'obj_number',
+    '{{ CASE_EXTRA_INFO }}': 'case_extra_info',
+    '{{ HEADER_PERSON_TITLE }}': 'addressee',
+    '{{ HEADER_PERSON_ADDRESS }}': 'address',
+    '{{ APPELAINT_TITLE }}': 'appellant_title',
+    '{{ APPELAINT_ADDRESS }}': 'appellant_address',
+    '{{ APPLICANT_TITLE }}': 'applicant_title',
+    '{{ APPLICANT_ADDRESS }}': 'applicant_address',
+    '{{ OWNER_TITLE }}': 'owner_title',
+    '{{ OWNER_ADDRESS }}': 'owner_address',
+    '{{ CLAIM_DOC_REG_NUM }}': 'claim_doc_reg_num',
+    '{{ CLAIM_DOC_REG_DATE }}': 'claim_doc_reg_date',
+    '{{ DOC_DOWNLOAD_CODE }}': 'doc_download_code',
+    '{{ HEAD_TITLE }}': 'head_title',
+    '{{ HEAD_POSITION }} ': 'head_position',
+    '{{ COLLEGIUM_HEAD }}': 'head_title',
+    '{{ COLLEGIUM_HEAD_SHORT }}': 'head_title_short',
+    '{{ COLLEGIUM_MEMBERS }}': 'collegium_initials',
+    '{{ MEMBER_1_TITLE }}': 'member_1_title',
+    '{{ MEMBER_1_POSITION }}': 'member_1_position',
+    '{{ MEMBER_2_TITLE }}': 'member_2_title',
+    '{{ MEMBER_2_POSITION }}': 'member_2_position',
+    '{{ COLLEGIUM_MEMBER_1 }}': 'member_1_title_short',
+    '{{ COLLEGIUM_MEMBER_2 }}': 'member_2_title_short',
+    '{{ SECRETARY_TITLE }}': 'secretary_title',
+    '{{ SECRETARY_TITLE_SHORT }}': 'secretary_title_short',
+    '{{ SECRETARY_POSITION }}': 'secretary_position',
+    '{{ SECRETARY_EMAIL }}': 'secretary_email',
+    '{{ SECRETARY_PHONE }}': 'secretary_phone',
+    '{{ SIGNER_TITLE }}': 'signer_title',
+    '{{ SIGNER_POSITION }}': 'signer_position',
+    '{{ MEETING_DATETIME }}': 'meeting_datetime',
+    '{{ MEETING_DATE }}': 'meeting_datetime',
+    '{{ PRE_MEETING_DATETIME }}': 'pre_meeting_datetime',
+    '{{ REASON }}': 'reason',
+    '{{ CIRCUMSTANCES }}': 'circumstances',
+    '{{ ORDER_DATE }}': 'order_date',
+    '{{ ORDER_NUMBER }}': 'order_number',
+    '{{ DIRECTOR_POSITION }}': 'director_position',
+    '{{ DIRECTOR_NAME }}': 'director_name',
+}
+
+
+def _vars(*placeholders: str, **overrides: str) -> Dict[str, str]:
+    """Переменные шаблона со значениями по умолчанию; overrides - переменные (без скобок) с другими атрибутами."""
+    res = {placeholder: VARS[placeholder] for placeholder in placeholders}
+    res.update({f'{{{{ {name} }}}}': attr for name, attr in overrides.items()})
+    return res
+
+
+_VARS_CONSIDERATION = (
+    '{{ HEADER_PERSON_TITLE }}', '{{ HEADER_PERSON_ADDRESS }}', '{{ CLAIM_DOC_REG_NUM }}', '{{ CLAIM_DOC_REG_DATE }}',
+    '{{ OBJ_KIND_TITLE }}', '{{ OBJ_TITLE }}', '{{ APPELAINT_TITLE }}', '{{ APPELAINT_ADDRESS }}',
+    '{{ COLLEGIUM_MEMBERS }}', '{{ SECRETARY_EMAIL }}', '{{ COLLEGIUM_HEAD }}', '{{ SECRETARY_TITLE }}',
+    '{{ SECRETARY_PHONE }}',
+)
+
+_DOC_TYPES_VARS = {
+    # Розпорядження про створення колегії, протокол розпорядження
+    ('0005', '0028'): _vars(
+        '{{ CASE_NUMBER }}', '{{ CLAIM_KIND }}', '{{ OBJ_KIND }}', '{{ OBJ_TITLE }}', '{{ CASE_EXTRA_INFO }}',
+        '{{ HEAD_TITLE }}', '{{ HEAD_POSITION }} ', '{{ MEMBER_1_TITLE }}', '{{ MEMBER_1_POSITION }}',
+        '{{ MEMBER_2_TITLE }}', '{{ MEMBER_2_POSITION }}', '{{ SECRETARY_TITLE }}', '{{ SECRETARY_POSITION }}',
+        '{{ SIGNER_TITLE }}', '{{ SIGNER_POSITION }}',
+    ),
+    # Повідомлення апелянту про прийняття справи до розгляду
+    ('0006',): _vars(
+        *_VARS_CONSIDERATION, '{{ APP_NUMBER }}', '{{ APPLICANT_TITLE }}', '{{ APPLICANT_ADDRESS }}',
+        HEADER_PERSON_TITLE='represent_or_appellant_title',
+        HEADER_PERSON_ADDRESS='represent_or_appellant_address',
+    ),
+    # Повідомлення заявнику про прийняття справи до розгляду
+    ('0007',): _vars(
+        *_VARS_CONSIDERATION, '{{ APP_NUMBER }}', '{{ APPLICANT_TITLE }}', '{{ APPLICANT_ADDRESS }}',
+        '{{ DOC_DOWNLOAD_CODE }}',
+    ),
+    # Повідомлення апелянту про прийняття апеляційної заяви до розгляду
+    ('0009',): _vars(
+        *_VARS_CONSIDERATION, '{{ REGISTRATION_NUMBER }}', '{{ PRE_MEETING_DATETIME }}', '{{ DOC_DOWNLOAD_CODE }}',
+    ),
+    # Повідомлення власнику про прийняття апеляційної заяви до розгляду
+    ('0010',): _vars(
+        *_VARS_CONSIDERATION, '{{ REGISTRATION_NUMBER }}', '{{ OWNER_TITLE }}', '{{ OWNER_ADDRESS }}',
+        '{{ PRE_MEETING_DATETIME }}', '{{ DOC_DOWNLOAD_CODE }}',
+    ),
+    # Повідомлення апелянту про прийняття заяви про визнання ТМ ДВ до розгляду
+    ('0011',): _vars(*_VARS_CONSIDERATION, '{{ APP_NUMBER }}', '{{ DOC_DOWNLOAD_CODE }}'),
+    # Повідомлення про зупинення розгляду справи / визнання заяви неподаною
+    ('0012', '0013', '0014', '0015', '0016', '0017', '0018', '0019', '0020', '0021', '0022', '0023'): _vars(
+        '{{ HEADER_PERSON_TITLE }}', '{{ HEADER_PERSON_ADDRESS }}', '{{ CLAIM_DOC_REG_NUM }}',
+        '{{ CLAIM_DOC_REG_DATE }}', '{{ OBJ_KIND_TITLE }}', '{{ OBJ_TITLE }}', '{{ APP_NUMBER }}',
+        '{{ REGISTRATION_NUMBER }}', '{{ APPELAINT_TITLE }}', '{{ APPELAINT_ADDRESS }}', '{{ APPLICANT_TITLE }}',
+        '{{ APPLICANT_ADDRESS }}', '{{ COLLEGIUM_HEAD }}', '{{ SECRETARY_TITLE }}', '{{ SECRETARY_PHONE }}',
+        '{{ REASON }}', '{{ CIRCUMSTANCES }}',
+    ),
+    # Повідомлення про призначення засідання
+    ('0024', '0025', '0026'): _vars(
+        '{{ HEADER_PERSON_TITLE }}', '{{ HEADER_PERSON_ADDRESS }}', '{{ CLAIM_DOC_REG_NUM }}',
+        '{{ CLAIM_DOC_REG_DATE }}', '{{ OBJ_KIND_TITLE }}', '{{ OBJ_TITLE }}', '{{ APPELAINT_TITLE }}',
+        '{{ APPELAINT_ADDRESS }}', '{{ COLLEGIUM_HEAD }}', '{{ SECRETARY_TITLE }}', '{{ SECRETARY_PHONE }}',
+        '{{ SECRETARY_EMAIL }}', '{{ MEETING_DATETIME }}',
+    ),
+    # Протокол підготовчого засідання
+    ('0027',): _vars(
+        '{{ MEETING_DATE }}', '{{ CASE_NUMBER }}', '{{ COLLEGIUM_HEAD }}', '{{ SECRETARY_TITLE }}', '{{ OBJ_NUMBER }}',
+        '{{ OBJ_KIND_TITLE }}', '{{ OBJ_TITLE }}', '{{ COLLEGIUM_HEAD_SHORT }}', '{{ COLLEGIUM_MEMBER_1 }}',
+        '{{ COLLEGIUM_MEMBER_2 }}',
+        COLLEGIUM_MEMBERS='members_titles',
+    ),
+    # Документи засідання Апеляційної палати
+    ('0029', '0030', '0031', '0032', '0033', '0034'): _vars(
+        '{{ CLAIM_DOC_REG_NUM }}', '{{ CLAIM_DOC_REG_DATE }}', '{{ CASE_NUMBER }}', '{{ OBJ_KIND_TITLE }}',
+        '{{ OBJ_TITLE }}', '{{ OBJ_NUMBER }}', '{{ SECRETARY_TITLE }}', '{{ SECRETARY_TITLE_SHORT }}',
+        '{{ SECRETARY_PHONE }}', '{{ SECRETARY_EMAIL }}', '{{ MEETING_DATE }}', '{{ COLLEGIUM_HEAD }}',
+        '{{ COLLEGIUM_HEAD_SHORT }}', '{{ COLLEGIUM_MEMBER_1 }}', '{{ COLLEGIUM_MEMBER_2 }}', '{{ ORDER_DATE }}',
+        '{{ ORDER_NUMBER }}', '{{ DIRECTOR_POSITION }}', '{{ DIRECTOR_NAME }}',
+        APPELAINT_TITLE='appellant_with_represent_title',
+        COLLEGIUM_MEMBERS='members_titles',
+    ),
+}
+
+# Код типа документа -> переменные его шаблона (переменная -> атрибут CaseTemplateContext)
+DOC_TYPES_VARS = {code: doc_vars for codes, doc_vars in _DOC_TYPES_VARS.items() for code in codes}
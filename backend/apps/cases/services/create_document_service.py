@@ -1,14 +1,24 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
 
-from apps.cases.models import Document, Case
+from apps.cases.models import Document, DocumentHistory, Case, Sign
 from apps.classifiers.models import DocumentType
 
 from .document_services import document_add_history
-from apps.common.utils import docx_replace, first_lower, get_random_file_name, get_temp_file_path
-
-from docx import Document as PyDocxDocument
+from .case_summary_services import case_summary_schedule_refresh
+from .case_template_context_service import CaseTemplateContext
+from apps.common.utils import get_random_file_name, get_temp_file_path
+from apps.common.docx_template import docx_template_render
 
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+import multiprocessing
+import os
+import threading
 
 UserModel = get_user_model()
 
@@ -24,37 +34,13 @@ class Service:
 
     def _get_file_vars(self) -> dict:
         """Формирует список с переменными для замены в файле docx."""
-        if self.doc_type.code in ('0005', '0028'):
-            return get_file_vars_0005(self.case, self.signer)
-        elif self.doc_type.code == '0006':
-            return get_file_vars_0006(self.case, self.document)
-        elif self.doc_type.code == '0007':
-            return get_file_vars_0007(self.case, self.document)
-        elif self.doc_type.code == '0009':
-            return get_file_vars_0009(self.case, self.document)
-        elif self.doc_type.code == '0010':
-            return get_file_vars_0010(self.case, self.document)
-        elif self.doc_type.code == '0011':
-            return get_file_vars_0011(self.case, self.document)
-        elif self.doc_type.code in ('0012', '0013', '0014', '0015', '0016', '0017', '0018', '0019', '0020', '0021',
-                                    '0022', '0023'):
-            return get_file_vars_stopping(self.case, self.extra_args['form_data'])
-        elif self.doc_type.code in ('0024', '0025', '0026'):
-            return get_file_vars_meeting(self.case, self.document)
-        elif self.doc_type.code == '0027':
-            return get_file_vars_pre_meeting_protocol(self.case, self.document)
-        elif self.doc_type.code in ('0029', '0030', '0031', '0032', '0033', '0034'):
-            return get_file_vars_meeting_holding(self.case, self.document, self.extra_args['form_data'])
-        else:
-            return {}
+        context = CaseTemplateContext(self.case, self.signer, self.extra_args.get('form_data'))
+        return context.get_vars(self.doc_type.code)
 
     def _create_doc_file(self) -> Path:
         """Создаёт файл на диске."""
-        # Открытие файла с шаблоном
-        docx = PyDocxDocument(self.doc_type.template.path)
-
-        # Получение и замена переменных в файле
-        docx_replace(docx, self.file_vars)
+        # Заполнение шаблона (шаблон компилируется один раз и кешируется до изменения файла)
+        docx = docx_template_render(self.doc_type.template.path, self.file_vars)
 
         # def iter_target_paragraphs(document):
         #     """Generate each paragraph inside all tables of `document`."""
@@ -117,366 +103,132 @@ class Service:
         return self.document
 
 
-def get_file_vars_0005(case: Case, signer: UserModel) -> dict:
-    """Возвращает словарь со значениями переменных для формирования документа с кодом 0005
-    (Розпорядження про створення колегії)."""
-    # Члены коллегии
-    common_members = []
-    head_title = ''
-    head_position = ''
-    for member in case.collegiummembership_set.all():
-        if member.is_head:
-            head_title = member.person.get_full_name
-            head_position = first_lower(member.person.position)
-        else:
-            common_members.append(
-                {
-                    'title': member.person.get_full_name,
-                    'position': first_lower(member.person.position)
-                }
-            )
-
-    # Апелянт
-    appellant = case.claim.get_appellant_title()
-
-    case_extra_info = f"апелянт - {appellant}"
-    if case.claim.claim_kind.claim_sense == 'DE':
-        case_extra_info += f", номер заявки: {case.claim.obj_number}"
-
-    if case.claim.third_person:
-        if case.claim.claim_kind.claim_sense == 'DE':
-            case_extra_info += f", заявник: {case.claim.get_applicant_title()}"
-        else:
-            case_extra_info += f"номер охоронного документа: {case.claim.obj_number}, " \
-                               f"власник: {case.claim.get_owner_title()}"
-
-    return {
-        '{{ CASE_NUMBER }}': case.case_number,
-        '{{ CLAIM_KIND }}': first_lower(case.claim.claim_kind.template_title),
-        '{{ OBJ_KIND }}': first_lower(case.claim.obj_kind.title),
-        '{{ OBJ_TITLE }}': case.claim.obj_title,
-        '{{ CASE_EXTRA_INFO }}': case_extra_info,
-        '{{ HEAD_TITLE }}': head_title,
-        '{{ HEAD_POSITION }} ': head_position,
-        '{{ MEMBER_1_TITLE }}': common_members[0]['title'],
-        '{{ MEMBER_1_POSITION }}': common_members[0]['position'],
-        '{{ MEMBER_2_TITLE }}': common_members[1]['title'],
-        '{{ MEMBER_2_POSITION }}': common_members[1]['position'],
-        '{{ SECRETARY_TITLE }}': case.secretary.get_full_name,
-        '{{ SECRETARY_POSITION }}': case.secretary.position,
-        '{{ SIGNER_TITLE }}': signer.get_full_name,
-        '{{ SIGNER_POSITION }}': signer.position,
-    }
-
-
-def get_file_vars_0006(case: Case, document: Document) -> dict:
-    """Возвращает словарь со значениями переменных для формирования документа с кодом 0006
-    (сообщение апеллянту о принятии дела к рассмотрению)."""
-    # Представитель апеллянта или апеллянт
-    represent = case.claim.get_represent_title(third_person=case.claim.third_person)
-    if represent:
-        header_person_title = represent
-        header_person_address = case.claim.get_represent_address()
-    else:
-        header_person_title = case.claim.get_appellant_title()
-        header_person_address = case.claim.get_appellant_address()
-
-    # Документ обращения
-    claim_doc = Document.objects.get(document_type__code__in=('0001', '0002', '0003', '0004'), claim=case.claim)
-    claim_doc_reg_num = claim_doc.registration_number
-    claim_doc_reg_date = claim_doc.input_date.strftime("%d.%m.%Y")
-
-    # Коллегия
-    collegium_head = ''
-    collegium = []
-    for item in case.collegiummembership_set.select_related('person').all():
-        collegium.append(item.person.get_full_name_initials())
-        if item.is_head:
-            collegium_head = item.person.get_full_name
-    return {
-        '{{ HEADER_PERSON_TITLE }}': header_person_title,
-        '{{ HEADER_PERSON_ADDRESS }}': header_person_address,
-        '{{ CLAIM_DOC_REG_NUM }}': claim_doc_reg_num,
-        '{{ CLAIM_DOC_REG_DATE }}': claim_doc_reg_date,
-        '{{ OBJ_KIND_TITLE }}': first_lower(case.claim.obj_kind.title),
-        '{{ OBJ_TITLE }}': case.claim.obj_title,
-        '{{ APP_NUMBER }}': case.claim.obj_number,
-        '{{ APPELAINT_TITLE }}': case.claim.get_appellant_title(),
-        '{{ APPELAINT_ADDRESS }}': case.claim.get_appellant_address(),
-        '{{ APPLICANT_TITLE }}': case.claim.get_applicant_title(),
-        '{{ APPLICANT_ADDRESS }}': case.claim.get_applicant_address(),
-        '{{ COLLEGIUM_MEMBERS }}': ', '.join(collegium),
-        '{{ SECRETARY_EMAIL }}': case.secretary.email,
-        '{{ COLLEGIUM_HEAD }}': collegium_head,
-        '{{ SECRETARY_TITLE }}': case.secretary.get_full_name,
-        '{{ SECRETARY_PHONE }}': case.secretary.phone_number or '',
-    }
-
-
-def get_file_vars_0007(case: Case, document: Document) -> dict:
-    """Возвращает словарь со значениями переменных для формирования документа с кодом 0007
-    (сообщение заявителю о принятии дела к рассмотрению)."""
-
-    # Документ обращения
-    claim_doc = Document.objects.get(document_type__code__in=('0001', '0002', '0003', '0004'), claim=case.claim)
-    claim_doc_reg_num = claim_doc.registration_number
-    claim_doc_reg_date = claim_doc.input_date.strftime("%d.%m.%Y")
-
-    # Коллегия
-    collegium = []
-    for item in case.collegiummembership_set.all():
-        collegium.append(item.person.get_full_name_initials())
-    collegium_head = case.collegium_head.get_full_name
-
-    return {
-        '{{ HEADER_PERSON_TITLE }}': case.addressee,
-        '{{ HEADER_PERSON_ADDRESS }}': case.address,
-        '{{ CLAIM_DOC_REG_NUM }}': claim_doc_reg_num,
-        '{{ CLAIM_DOC_REG_DATE }}': claim_doc_reg_date,
-        '{{ OBJ_KIND_TITLE }}': first_lower(case.claim.obj_kind.title),
-        '{{ OBJ_TITLE }}': case.claim.obj_title,
-        '{{ APP_NUMBER }}': case.claim.obj_number,
-        '{{ APPELAINT_TITLE }}': case.claim.get_appellant_title(),
-        '{{ APPELAINT_ADDRESS }}': case.claim.get_appellant_address(),
-        '{{ APPLICANT_TITLE }}': case.claim.get_applicant_title(),
-        '{{ APPLICANT_ADDRESS }}': case.claim.get_applicant_address(),
-        '{{ COLLEGIUM_MEMBERS }}': ', '.join(collegium),
-        '{{ SECRETARY_EMAIL }}': case.secretary.email,
-        '{{ COLLEGIUM_HEAD }}': collegium_head,
-        '{{ SECRETARY_TITLE }}': case.secretary.get_full_name,
-        '{{ SECRETARY_PHONE }}': case.secretary.phone_number or '',
-
-        '{{ DOC_DOWNLOAD_CODE }}': claim_doc.barcode[-10:],  # последние 10 цифр штрих-кода
-    }
-
-
-def get_file_vars_0009(case: Case, document: Document) -> dict:
-    """Возвращает словарь со значениями переменных для формирования документа с кодом 0009 -
-    Повідомлення апелянту про прийняття апеляційної заяви до розгляду"""
-    # Документ обращения
-    claim_doc = Document.objects.get(document_type__code__in=('0001', '0002', '0003', '0004'), claim=case.claim)
-    claim_doc_reg_num = claim_doc.registration_number
-    claim_doc_reg_date = claim_doc.input_date.strftime("%d.%m.%Y")
-
-    # Коллегия
-    collegium = []
-    for item in case.collegiummembership_set.all():
-        collegium.append(item.person.get_full_name_initials())
-    collegium_head = case.collegium_head.get_full_name
-
-    # Подготовительное заседание
-    pre_meeting = case.meeting_set.filter(meeting_type='PRE').first()
-
-    return {
-        '{{ HEADER_PERSON_TITLE }}': case.addressee,
-        '{{ HEADER_PERSON_ADDRESS }}': case.address,
-        '{{ CLAIM_DOC_REG_NUM }}': claim_doc_reg_num,
-        '{{ CLAIM_DOC_REG_DATE }}': claim_doc_reg_date,
-        '{{ OBJ_KIND_TITLE }}': first_lower(case.claim.obj_kind.title),
-        '{{ OBJ_TITLE }}': case.claim.obj_title,
-        '{{ REGISTRATION_NUMBER }}': case.claim.obj_number,
-        '{{ APPELAINT_TITLE }}': case.claim.get_appellant_title(),
-        '{{ APPELAINT_ADDRESS }}': case.claim.get_appellant_address(),
-        '{{ COLLEGIUM_MEMBERS }}': ', '.join(collegium),
-        '{{ SECRETARY_EMAIL }}': case.secretary.email,
-        '{{ COLLEGIUM_HEAD }}': collegium_head,
-        '{{ SECRETARY_TITLE }}': case.secretary.get_full_name,
-        '{{ SECRETARY_PHONE }}': case.secretary.phone_number or '',
-        '{{ PRE_MEETING_DATETIME }}': pre_meeting.datetime.strftime('%d.%m.%Y %H:%M:%S') if pre_meeting else '',
-
-        '{{ DOC_DOWNLOAD_CODE }}': claim_doc.barcode[-10:],  # последние 10 цифр штрих-кода
-    }
+def _render_doc_file(template_path: str, file_vars: dict) -> str:
+    """Заполняет шаблон и сохраняет файл во временный каталог. Возвращает путь к файлу."""
+    docx = docx_template_render(template_path, file_vars)
+    tmp_file_path = get_temp_file_path(get_random_file_name('docx'))
+    docx.save(tmp_file_path)
+    return str(tmp_file_path)
 
 
-def get_file_vars_0010(case: Case, document: Document) -> dict:
-    """Возвращает словарь со значениями переменных для формирования документа с кодом 0010 -
-    Повідомлення власнику про прийняття апеляційної заяви до розгляду"""
-    # Документ обращения
-    claim_doc = Document.objects.get(document_type__code__in=('0001', '0002', '0003', '0004'), claim=case.claim)
-    claim_doc_reg_num = claim_doc.registration_number
-    claim_doc_reg_date = claim_doc.input_date.strftime("%d.%m.%Y")
-
-    # Коллегия
-    collegium = []
-    for item in case.collegiummembership_set.all():
-        collegium.append(item.person.get_full_name_initials())
-    collegium_head = case.collegium_head.get_full_name
-
-    # Подготовительное заседание
-    pre_meeting = case.meeting_set.filter(meeting_type='PRE').first()
-
-    return {
-        '{{ HEADER_PERSON_TITLE }}': case.addressee,
-        '{{ HEADER_PERSON_ADDRESS }}': case.address,
-        '{{ CLAIM_DOC_REG_NUM }}': claim_doc_reg_num,
-        '{{ CLAIM_DOC_REG_DATE }}': claim_doc_reg_date,
-        '{{ OBJ_KIND_TITLE }}': first_lower(case.claim.obj_kind.title),
-        '{{ OBJ_TITLE }}': case.claim.obj_title,
-        '{{ REGISTRATION_NUMBER }}': case.claim.obj_number,
-        '{{ APPELAINT_TITLE }}': case.claim.get_appellant_title(),
-        '{{ APPELAINT_ADDRESS }}': case.claim.get_appellant_address(),
-        '{{ OWNER_TITLE }}': case.claim.get_owner_title(),
-        '{{ OWNER_ADDRESS }}': case.claim.get_owner_address(),
-        '{{ COLLEGIUM_MEMBERS }}': ', '.join(collegium),
-        '{{ SECRETARY_EMAIL }}': case.secretary.email,
-        '{{ COLLEGIUM_HEAD }}': collegium_head,
-        '{{ SECRETARY_TITLE }}': case.secretary.get_full_name,
-        '{{ SECRETARY_PHONE }}': case.secretary.phone_number or '',
-        '{{ PRE_MEETING_DATETIME }}': pre_meeting.datetime.strftime('%d.%m.%Y %H:%M:%S') if pre_meeting else '',
-
-        '{{ DOC_DOWNLOAD_CODE }}': claim_doc.barcode[-10:],  # последние 10 цифр штрих-кода
-    }
+# Пул процессов для заполнения шаблонов (создаётся при первом использовании, если DOCUMENTS_RENDER_WORKERS > 1;
+# скомпилированные шаблоны кешируются в каждом процессе пула)
+_render_pool: Optional[ProcessPoolExecutor] = None
+_render_pool_lock = threading.Lock()
 
 
-def get_file_vars_0011(case: Case, document: Document) -> dict:
-    """Возвращает словарь со значениями переменных для формирования документа с кодом 0011 -
-    Повідомлення апелянту про прийняття заяви про визнання ТМ ДВ до розгляду"""
-
-    # Документ обращения
-    claim_doc = Document.objects.get(document_type__code__in=('0001', '0002', '0003', '0004'), claim=case.claim)
-    claim_doc_reg_num = claim_doc.registration_number
-    claim_doc_reg_date = claim_doc.input_date.strftime("%d.%m.%Y")
-
-    # Коллегия
-    collegium = []
-    for item in case.collegiummembership_set.all():
-        collegium.append(item.person.get_full_name_initials())
-    collegium_head = case.collegium_head.get_full_name
-
-    return {
-        '{{ HEADER_PERSON_TITLE }}': case.addressee,
-        '{{ HEADER_PERSON_ADDRESS }}': case.address,
-        '{{ CLAIM_DOC_REG_NUM }}': claim_doc_reg_num,
-        '{{ CLAIM_DOC_REG_DATE }}': claim_doc_reg_date,
-        '{{ OBJ_KIND_TITLE }}': first_lower(case.claim.obj_kind.title),
-        '{{ OBJ_TITLE }}': case.claim.obj_title,
-        '{{ APP_NUMBER }}': case.claim.obj_number,
-        '{{ APPELAINT_TITLE }}': case.claim.get_appellant_title(),
-        '{{ APPELAINT_ADDRESS }}': case.claim.get_appellant_address(),
-        '{{ COLLEGIUM_MEMBERS }}': ', '.join(collegium),
-        '{{ SECRETARY_EMAIL }}': case.secretary.email,
-        '{{ COLLEGIUM_HEAD }}': collegium_head,
-        '{{ SECRETARY_TITLE }}': case.secretary.get_full_name,
-        '{{ SECRETARY_PHONE }}': case.secretary.phone_number or '',
-
-        '{{ DOC_DOWNLOAD_CODE }}': claim_doc.barcode[-10:],  # последние 10 цифр штрих-кода
-    }
+def _render_pool_init() -> None:
+    # Процессы пула не работают с БД и не должны использовать соединения родительского процесса
+    connections.close_all()
 
 
-def get_file_vars_stopping(case: Case, form_data: dict):
-    """Переменные для формирования файла документа оповещения об остановке рассмотрения дела / признания непригодным."""
-
-    # Документ обращения
-    claim_doc = Document.objects.get(document_type__code__in=('0001', '0002', '0003', '0004'), claim=case.claim)
-    claim_doc_reg_num = claim_doc.registration_number
-    claim_doc_reg_date = claim_doc.input_date.strftime("%d.%m.%Y")
-
-    return {
-        '{{ HEADER_PERSON_TITLE }}': case.addressee,
-        '{{ HEADER_PERSON_ADDRESS }}': case.address,
-        '{{ CLAIM_DOC_REG_NUM }}': claim_doc_reg_num,
-        '{{ CLAIM_DOC_REG_DATE }}': claim_doc_reg_date,
-        '{{ OBJ_KIND_TITLE }}': first_lower(case.claim.obj_kind.title),
-        '{{ OBJ_TITLE }}': case.claim.obj_title,
-        '{{ APP_NUMBER }}': case.claim.obj_number,
-        '{{ REGISTRATION_NUMBER }}': case.claim.obj_number,
-        '{{ APPELAINT_TITLE }}': case.claim.get_appellant_title(),
-        '{{ APPELAINT_ADDRESS }}': case.claim.get_appellant_address(),
-        '{{ APPLICANT_TITLE }}': case.claim.get_applicant_title(),
-        '{{ APPLICANT_ADDRESS }}': case.claim.get_applicant_address(),
-        '{{ COLLEGIUM_HEAD }}': case.collegium_head.get_full_name,
-        '{{ SECRETARY_TITLE }}': case.secretary.get_full_name,
-        '{{ SECRETARY_PHONE }}': case.secretary.phone_number or '',
-        '{{ REASON }}': form_data.get('reason', ''),
-        '{{ CIRCUMSTANCES }}': form_data.get('circumstances', ''),
-    }
-
-
-def get_file_vars_meeting(case: Case, document: Document):
-    """Переменные для формирования файла документа оповещения об назначении заседания."""
-    # Документ обращения
-    claim_doc = Document.objects.get(document_type__code__in=('0001', '0002', '0003', '0004'), claim=case.claim)
-    claim_doc_reg_num = claim_doc.registration_number
-    claim_doc_reg_date = claim_doc.input_date.strftime("%d.%m.%Y")
-
-    return {
-        '{{ HEADER_PERSON_TITLE }}': case.addressee,
-        '{{ HEADER_PERSON_ADDRESS }}': case.address,
-        '{{ CLAIM_DOC_REG_NUM }}': claim_doc_reg_num,
-        '{{ CLAIM_DOC_REG_DATE }}': claim_doc_reg_date,
-        '{{ OBJ_KIND_TITLE }}': first_lower(case.claim.obj_kind.title),
-        '{{ OBJ_TITLE }}': case.claim.obj_title,
-        '{{ APPELAINT_TITLE }}': case.claim.get_appellant_title(),
-        '{{ APPELAINT_ADDRESS }}': case.claim.get_appellant_address(),
-        '{{ COLLEGIUM_HEAD }}': case.collegium_head.get_full_name,
-        '{{ SECRETARY_TITLE }}': case.secretary.get_full_name,
-        '{{ SECRETARY_PHONE }}': case.secretary.phone_number or '',
-        '{{ SECRETARY_EMAIL }}': case.secretary.email,
-        '{{ MEETING_DATETIME }}': case.meeting_set.order_by('-pk').first().datetime.strftime('%d.%m.%Y %H:%M:%S'),
-    }
-
-
-def get_file_vars_meeting_holding(case: Case, document: Document, form_data: dict):
-    """Переменные для формирования документов заседания ап. палаты."""
-    # Документ обращения
-    claim_doc = Document.objects.get(document_type__code__in=('0001', '0002', '0003', '0004'), claim=case.claim)
-    claim_doc_reg_num = claim_doc.registration_number
-    claim_doc_reg_date = claim_doc.input_date.strftime("%d.%m.%Y")
-
-    # Коллегия
-    collegium = []
-    for item in case.collegiummembership_set.filter(is_head=False):
-        collegium.append(item.person)
-
-    # Аппелянт и представитель
-    appellant = case.claim.get_applicant_title()
-    represent = case.claim.get_represent_title()
-    if represent:
-        appellant = f'{appellant} (представник - {represent})'
-
-    return {
-        '{{ CLAIM_DOC_REG_NUM }}': claim_doc_reg_num,
-        '{{ CLAIM_DOC_REG_DATE }}': claim_doc_reg_date,
-        '{{ CASE_NUMBER }}': case.case_number,
-        '{{ OBJ_KIND_TITLE }}': first_lower(case.claim.obj_kind.title),
-        '{{ OBJ_TITLE }}': case.claim.obj_title,
-        '{{ OBJ_NUMBER }}': case.claim.obj_number,
-        '{{ APPELAINT_TITLE }}': appellant,
-        '{{ SECRETARY_TITLE }}': case.secretary.get_full_name,
-        '{{ SECRETARY_TITLE_SHORT }}': case.secretary.get_full_name_initials(),
-        '{{ SECRETARY_PHONE }}': case.secretary.phone_number or '',
-        '{{ SECRETARY_EMAIL }}': case.secretary.email,
-        '{{ MEETING_DATE }}': case.meeting_set.order_by('-pk').first().datetime.strftime('%d.%m.%Y %H:%M:%S'),
-        '{{ COLLEGIUM_HEAD }}': case.collegium_head.get_full_name,
-        '{{ COLLEGIUM_HEAD_SHORT }}': case.collegium_head.get_full_name_initials(),
-        '{{ COLLEGIUM_MEMBERS }}': f'{collegium[0].get_full_name}, {collegium[1].get_full_name}',
-        '{{ COLLEGIUM_MEMBER_1 }}': collegium[0].get_full_name_initials(),
-        '{{ COLLEGIUM_MEMBER_2 }}': collegium[1].get_full_name_initials(),
-
-        '{{ ORDER_DATE }}': form_data['order_date'].strftime('%d.%m.%Y') if form_data.get('order_date') else 'Дата наказу',
-        '{{ ORDER_NUMBER }}': form_data['order_number'] if form_data.get('order_number') else 'Номер наказу',
-        '{{ DIRECTOR_POSITION }}': form_data['signer_position'] if form_data.get('signer_position') else 'Посада підписанта',
-        '{{ DIRECTOR_NAME }}': form_data['signer_name'] if form_data.get('signer_name') else 'ПІБ підписанта',
-    }
-
-
-def get_file_vars_pre_meeting_protocol(case: Case, document: Document):
-    """Переменные для формирования файла документа оповещения об назначении заседания."""
-    # Коллегия
-    collegium = []
-    for item in case.collegiummembership_set.filter(is_head=False):
-        collegium.append(item.person)
-
-    return {
-        '{{ MEETING_DATE }}': case.meeting_set.order_by('-pk').first().datetime.strftime('%d.%m.%Y %H:%M:%S'),
-        '{{ CASE_NUMBER }}': case.case_number,
-        '{{ COLLEGIUM_HEAD }}': case.collegium_head.get_full_name,
-        '{{ COLLEGIUM_MEMBERS }}': f'{collegium[0].get_full_name}, {collegium[1].get_full_name}',
-        '{{ SECRETARY_TITLE }}': case.secretary.get_full_name,
-        '{{ OBJ_NUMBER }}': case.claim.obj_number,
-        '{{ OBJ_KIND_TITLE }}': first_lower(case.claim.obj_kind.title),
-        '{{ OBJ_TITLE }}': case.claim.obj_title,
-        '{{ COLLEGIUM_HEAD_SHORT }}': case.collegium_head.get_full_name_initials(),
-        '{{ COLLEGIUM_MEMBER_1 }}': collegium[0].get_full_name_initials(),
-        '{{ COLLEGIUM_MEMBER_2 }}': collegium[1].get_full_name_initials(),
+def _get_render_pool() -> Optional[ProcessPoolExecutor]:
+    """Возвращает пул процессов для заполнения шаблонов (None - шаблоны заполняются в текущем процессе).
+    Пул не используется внутри транзакции: процессы пула создаются (fork) при его использовании, а соединения с БД
+    перед этим закрываются."""
+    global _render_pool
+    workers = getattr(settings, 'DOCUMENTS_RENDER_WORKERS', 1)
+    # Процессы-демоны не могут создавать дочерние процессы
+    if workers < 2 or multiprocessing.current_process().daemon or transaction.get_connection().in_atomic_block:
+        return None
+    with _render_pool_lock:
+        if _render_pool is None:
+            _render_pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context('fork'), initializer=_render_pool_init
+            )
+        return _render_pool
+
+
+def _render_doc_files(items: List[Tuple[str, dict]]) -> List[str]:
+    """Заполняет шаблоны (пары путь к шаблону - переменные), при наличии пула - параллельно в пуле процессов."""
+    global _render_pool
+    pool = _get_render_pool() if len(items) > 1 else None
+    if pool:
+        # Соединения с БД открываются заново при следующем запросе
+        connections.close_all()
+        try:
+            return list(pool.map(_render_doc_file, *zip(*items)))
+        except BrokenProcessPool:
+            # Процесс пула аварийно завершился - пул пересоздаётся при следующем вызове
+            with _render_pool_lock:
+                _render_pool = None
+    return [_render_doc_file(template_path, file_vars) for template_path, file_vars in items]
+
+
+def create_documents(case_id: int, doc_codes: Iterable[str], user_id: int, signer_id: int = None,
+                     create_signs: bool = False, **kwargs) -> List[Document]:
+    """Создаёт документы ап. дела нескольких типов (пакетно).
+
+    Данные дела, подписанта и типов документов загружаются один раз, шаблоны заполняются параллельно,
+    записи документов, их истории и подписантов (если create_signs) создаются пакетно."""
+    doc_codes = list(doc_codes)
+    if not doc_codes:
+        return []
+
+    case = Case.objects.select_related(
+        'claim',
+        'claim__obj_kind',
+        'claim__claim_kind',
+        'secretary',
+    ).prefetch_related(
+        'collegiummembership_set__person',
+    ).get(pk=case_id)
+    signer = UserModel.objects.get(pk=signer_id) if signer_id else None
+    doc_types = {
+        x.code: x for x in DocumentType.objects.filter(code__in=doc_codes, claim_kinds__id=case.claim.claim_kind_id)
     }
+    for doc_code in doc_codes:
+        if doc_code not in doc_types:
+            raise DocumentType.DoesNotExist(f'DocumentType {doc_code} does not exist')
+
+    # Переменные формируются из общего для всех документов контекста (запросы к БД), шаблоны заполняются
+    # до начала транзакции (при наличии пула - параллельно)
+    context = CaseTemplateContext(case, signer, kwargs.get('form_data'))
+    items = []
+    for doc_code in doc_codes:
+        file_vars = context.get_vars(doc_code)
+        items.append((doc_types[doc_code].template.path, {key: str(val) for key, val in file_vars.items()}))
+    tmp_file_paths = _render_doc_files(items)
+
+    saved_files = []
+    try:
+        with transaction.atomic():
+            # Документы создаются по одному: их id нужны для истории, подписантов и каталогов файлов
+            # (bulk_create не возвращает id в MSSQL)
+            documents = [
+                Document.objects.create(
+                    case=case,
+                    document_type=doc_types[doc_code],
+                    auto_generated=True,
+                    can_be_edited=kwargs.get('can_be_edited', True)
+                ) for doc_code in doc_codes
+            ]
+            DocumentHistory.objects.bulk_create([
+                DocumentHistory(
+                    document=document,
+                    action='Документ додано у систему (створено автоматично)',
+                    user_id=user_id
+                ) for document in documents
+            ])
+
+            for document, tmp_file_path in zip(documents, tmp_file_paths):
+                with open(tmp_file_path, 'rb') as fh:
+                    document.file.save(Path(tmp_file_path).name, ContentFile(fh.read()), save=False)
+                saved_files.append(document.file.name)
+            Document.objects.bulk_update(documents, ['file'])
+
+            if create_signs and signer_id:
+                Sign.objects.bulk_create([Sign(document=document, user_id=signer_id) for document in documents])
+    except Exception:
+        # Файлы документов, записи которых не созданы
+        for name in saved_files:
+            Document._meta.get_field('file').storage.delete(name)
+        raise
+    finally:
+        for tmp_file_path in tmp_file_paths:
+            Path(tmp_file_path).unlink(missing_ok=True)
+
+    # История и подписанты созданы пакетно (без сигналов)
+    case_summary_schedule_refresh(case_id)
+
+    return documents
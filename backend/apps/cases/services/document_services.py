@@ -2,22 +2,34 @@ import datetime
 
 from django.contrib.auth import get_user_model
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, prefetch_related_objects
 from django.utils import timezone
 
 from apps.cases.models import Document, Sign, DocumentHistory, Command, PostalProtocolExchange, EsignProtocolExchange
 from apps.cases.utils import set_cell_border
-from apps.common.utils import (docx_replace, generate_barcode_img, substitute_image_docx)
+from apps.common.docx_patcher import docx_patch
+from apps.common.fragment_cache import fragment_invalidate
+from apps.common.office_converter import office_convert_to_pdf
+from apps.common.utils import generate_barcode_png
 from apps.classifiers.models import DocumentType, CommandType
+from .numerator_services import numerator_next_barcode, numerator_next_reg_number
 
 from typing import List
 from pathlib import Path
-from docx import Document as DocumentWord
-import random
-from typing import Union
-import subprocess
+from docx.oxml import OxmlElement
+from docx.oxml.table import CT_Tbl
+from docx.shared import Cm, Length
+from docx.table import Table
+from docx.text.paragraph import Paragraph
+import functools
+from typing import Dict, Iterable, List, Union
 
 UserModel = get_user_model()
 
+# Поля документа, которые заполняются при регистрации
+REGISTRATION_FIELDS = ('registration_number', 'registration_date', 'barcode')
+
 
 def document_get_by_id(doc_id: int) -> Document:
     """Возвращает документ по его идентификатору."""
@@ -46,16 +58,12 @@ def document_add_sign_info_to_file(doc_id: int,
         # Документ создался во внутреннем модуле
         if internal_document:
             # Присвоение документу номера, штрихкода, даты регистрации в момент подписания
-            document_set_reg_number(doc_id)
-            document_set_barcode(doc_id)
-            document_set_reg_date(doc_id)
-            document.refresh_from_db()
+            document_register(document)
 
         if Path(str(document.file)).suffix == '.docx':
-            # Открытие документа
             docx_file_path = Path(settings.MEDIA_ROOT) / Path(str(document.file))
             docx_with_signs_file_path = docx_file_path.parent / f"{docx_file_path.stem}_signs.docx"
-            docx = DocumentWord(docx_file_path)
+            file_vars, images, append = {}, {}, None
 
             # Документ создался во внутреннем модуле
             if internal_document:
@@ -64,9 +72,7 @@ def document_add_sign_info_to_file(doc_id: int,
                     '{{ DOC_REG_DATE }}': document.registration_date.strftime('%d.%m.%Y'),
                     '{{ DOC_REG_NUM }}': document.registration_number,
                 }
-                docx_replace(docx, file_vars)
-                barcode_file_path = generate_barcode_img(document.barcode)
-                substitute_image_docx(docx, '{{ BARCODE_IMG }}', barcode_file_path, 6)
+                images = {'{{ BARCODE_IMG }}': (generate_barcode_png(document.barcode), Cm(6))}
                 document_add_history(
                     document.pk,
                     'Документу присвоєні номер та штрих-код (автоматично в момент підпису).',
@@ -75,66 +81,88 @@ def document_add_sign_info_to_file(doc_id: int,
 
             # Добавление таблички с информацией о подписях (только если один подписант)
             if document.sign_set.count() == 1:
-                docx.add_paragraph('Підписали:')
-                table = docx.add_table(rows=len(signs), cols=1)
-                for i, sign in enumerate(signs):
-                    cells = table.rows[i].cells
-                    cells[0].paragraphs[0].add_run(
-                        f"{sign['subject']}\n{sign['serial_number']}\n{sign['issuer']}"
-                    )
-                    paragraph_format = cells[0].paragraphs[0].paragraph_format
-                    paragraph_format.space_after = 0
-                    # set_cell_margins(cells[0], top=50, start=50, bottom=50, end=50)
-                    set_cell_border(
-                        cells[0],
-                        top={"sz": 12, "val": "single", "color": "black", "space": "0"},
-                        bottom={"sz": 12, "val": "single", "color": "black", "space": "0"},
-                        start={"sz": 12, "val": "single", "color": "black", "space": "0"},
-                        end={"sz": 12, "val": "single", "color": "black", "space": "0"},
-                    )
+                append = functools.partial(_document_get_signs_info_elements, signs)
                 document_add_history(
                     document.pk,
                     'Створено новий документ з інформацією про підписантів (автоматично)',
                     user_id
                 )
 
-            # Сохранение
-            docx.save(docx_with_signs_file_path)
+            # Создание файла (изменяется только текст документа, остальные части файла копируются)
+            docx_patch(docx_file_path, docx_with_signs_file_path, file_vars, images, append)
 
             if internal_document:
-                # Конвертация в pdf
-                subprocess.call(
-                    ["libreoffice", "--headless", '--convert-to', 'pdf', docx_with_signs_file_path],
-                    cwd=str(Path(docx_with_signs_file_path).parent)
+                # Конвертация в pdf (фоновой задачей)
+                document_schedule_pdf_conversion(
+                    document.pk,
+                    user_id,
+                    str(Path(str(document.file)).parent / docx_with_signs_file_path.name)
                 )
-                document.converted_to_pdf = True
-                document.save()
-                document_add_history(document.pk, 'Конвертовано у pdf (автоматично)', user_id)
+
+
+def _document_get_signs_info_elements(signs: list, width: Length) -> list:
+    """Возвращает абзац и табличку с информацией о подписях для добавления в конец файла документа."""
+    p = OxmlElement('w:p')
+    Paragraph(p, None).add_run('Підписали:')
+
+    tbl = CT_Tbl.new_tbl(len(signs), 1, width)
+    table = Table(tbl, None)
+    for i, sign in enumerate(signs):
+        cells = table.rows[i].cells
+        cells[0].paragraphs[0].add_run(
+            f"{sign['subject']}\n{sign['serial_number']}\n{sign['issuer']}"
+        )
+        paragraph_format = cells[0].paragraphs[0].paragraph_format
+        paragraph_format.space_after = 0
+        # set_cell_margins(cells[0], top=50, start=50, bottom=50, end=50)
+        set_cell_border(
+            cells[0],
+            top={"sz": 12, "val": "single", "color": "black", "space": "0"},
+            bottom={"sz": 12, "val": "single", "color": "black", "space": "0"},
+            start={"sz": 12, "val": "single", "color": "black", "space": "0"},
+            end={"sz": 12, "val": "single", "color": "black", "space": "0"},
+        )
+    return [p, tbl]
+
+
+def document_register(document: Document, fields: Iterable[str] = REGISTRATION_FIELDS) -> None:
+    """Присваивает документу регистрационный номер, дату регистрации и штрихкод (поля fields) одним запросом.
+    Номер и штрихкод выдаёт нумератор."""
+    now = datetime.datetime.now()
+    values = {}
+    if 'registration_number' in fields:
+        values['registration_number'] = numerator_next_reg_number(bool(document.case_id), now)
+    if 'registration_date' in fields:
+        values['registration_date'] = now
+    if 'barcode' in fields:
+        values['barcode'] = numerator_next_barcode()
+    if not values:
+        return
+
+    Document.objects.filter(pk=document.pk).update(updated_at=now, **values)
+    for field, value in values.items():
+        setattr(document, field, value)
+    fragment_invalidate(document)
+
+
+def document_register_missing(document: Document) -> None:
+    """Присваивает документу те из регистрационного номера, даты регистрации и штрихкода, которых у него нет."""
+    document_register(document, [field for field in REGISTRATION_FIELDS if not getattr(document, field)])
 
 
 def document_set_reg_number(doc_id: int) -> None:
     """Присваивает документу регистрационный номер, который возвращает глобальный нумератор."""
-    numbers = ''.join([str(random.randint(0, 9)) for _ in range(5)])
-    document = Document.objects.get(pk=doc_id)
-    if document.case:
-        document.registration_number = f"Вих-{numbers}/2022"
-    else:
-        document.registration_number = f"Вх-{numbers}/2022"
-    document.save()
+    document_register(Document.objects.get(pk=doc_id), ['registration_number'])
 
 
 def document_set_reg_date(doc_id: int) -> None:
     """Присваивает документу дату регистрации."""
-    document = Document.objects.get(pk=doc_id)
-    document.registration_date = datetime.datetime.now()
-    document.save()
+    document_register(Document.objects.get(pk=doc_id), ['registration_date'])
 
 
 def document_set_barcode(doc_id: int) -> None:
     """Присваивает документу штрихкод, который возвращает глобальный нумератор."""
-    document = Document.objects.get(pk=doc_id)
-    document.barcode = ''.join([str(random.randint(0, 9)) for _ in range(32)])
-    document.save()
+    document_register(Document.objects.get(pk=doc_id), ['barcode'])
 
 
 def document_get_signs_info(doc_id: int) -> List[dict]:
@@ -173,6 +201,63 @@ def document_can_be_signed_by_user(document: Union[int, Document], user: UserMod
     return document.claim and document.claim.user_id == user.pk and user.is_applicant
 
 
+def document_get_flags(documents: Iterable[Document], user: UserModel) -> Dict[int, dict]:
+    """Возвращает состояния и права пользователя для набора документов (ключ - id документа).
+    Вычисляется для всех документов сразу: подписи подгружаются одним запросом (если не были подгружены ранее),
+    отправка в АС "Вихідні документи" проверяется одним запросом."""
+    documents = list(documents)
+    if not documents:
+        return {}
+
+    # Подписи документов и данные дела (уже подгруженные связи повторно не запрашиваются)
+    prefetch_related_objects(documents, 'sign_set', 'case')
+
+    # Документы, отправленные в АС "Вихідні документи"
+    sent_to_chancellary_ids = set(
+        Command.objects.filter(
+            document_id__in=[document.pk for document in documents],
+            command_type__command_name='send_to_chancellary'
+        ).values_list('document_id', flat=True)
+    )
+
+    user_is_applicant = None
+    res = {}
+    for document in documents:
+        signs = document.sign_set.all()
+        is_signed = bool(signs) and all(sign.timestamp for sign in signs)
+        signs_count = getattr(document, 'signs_count', None)
+        if signs_count is None:
+            signs_count = len([sign for sign in signs if sign.timestamp])
+        is_case_secretary = bool(document.case) and document.case.secretary_id == user.pk
+
+        # Может ли пользователь подписывать документ (см. document_can_be_signed_by_user)
+        if document.case:
+            user_sign = next((sign for sign in signs if sign.user_id == user.pk), None)
+            can_be_signed = bool(user_sign) and not user_sign.timestamp
+        elif document.claim_id and document.claim.user_id == user.pk:
+            if user_is_applicant is None:
+                user_is_applicant = user.is_applicant
+            can_be_signed = user_is_applicant
+        else:
+            can_be_signed = False
+
+        res[document.pk] = {
+            'is_signed': is_signed,
+            'can_be_signed': can_be_signed,
+            'can_be_updated': is_case_secretary and not document.converted_to_pdf and document.auto_generated
+                and document.can_be_edited and not is_signed,
+            'can_be_deleted': is_case_secretary and not document.auto_generated and not document.barcode,
+            'can_be_sent_to_sign': bool(document.case) and document.auto_generated and not signs
+                and not document.pdf_in_progress,
+            'can_be_sent_to_chancellary': is_case_secretary and is_signed,
+            'sent_to_chancellary': document.pk in sent_to_chancellary_ids,
+            'file_url': document.signed_file_url if signs_count or document.converted_to_pdf else document.file.url,
+            'pdf_status': document.pdf_status,
+        }
+
+    return res
+
+
 def document_get_case_documents_to_sign(case_id: int, user: UserModel) -> list:
     """Возвращает список документов дела, которые ожидают подписания пользователем."""
     documents = Document.objects.filter(
@@ -181,18 +266,18 @@ def document_get_case_documents_to_sign(case_id: int, user: UserModel) -> list:
         case_id=case_id
     ).select_related('document_type').order_by('-created_at')
 
-    res = []
+    return [document_get_to_sign_data(document) for document in documents]
 
-    for document in documents:
-        res.append({
-            'id': document.pk,
-            'document_type': document.document_type.title,
-            'auto_generated': int(document.auto_generated),
-            'file_url': document.file.url,
-            'file_name': Path(document.file.name).name,
-        })
 
-    return res
+def document_get_to_sign_data(document: Document) -> dict:
+    """Возвращает данные документа, ожидающего подписания, для компонента подписания."""
+    return {
+        'id': document.pk,
+        'document_type': document.document_type.title,
+        'auto_generated': int(document.auto_generated),
+        'file_url': document.file.url,
+        'file_name': Path(document.file.name).name,
+    }
 
 
 def document_add_history(doc_id: int, action: str, user_id: int = None) -> None:
@@ -215,21 +300,60 @@ def document_soft_delete(doc_id: int, user: UserModel) -> Union[Document, None]:
     return None
 
 
-def document_convert_original_doc_to_pdf(document: Document, user_id: int) -> None:
-    """Конвертирует оригинальный файл документа в PDF (также ставит метку в БД, что документ конвертирован)."""
-    docx_file_path = Path(settings.MEDIA_ROOT) / Path(str(document.file))
-    subprocess.call(
-        ["libreoffice", "--headless", '--convert-to', 'pdf', docx_file_path],
-        cwd=str(docx_file_path.parent)
-    )
-    # Переименование pdf
-    rename_from = docx_file_path.parent / f"{docx_file_path.stem}.pdf"
-    rename_to = docx_file_path.parent / f"{docx_file_path.stem}_signs.pdf"
-    rename_from.rename(rename_to)
+def document_convert_to_pdf(doc_id: int, user_id: int = None, source: str = None) -> Document:
+    """Конвертирует файл документа в PDF (<имя оригинального файла>_signs.pdf) и ставит метку в БД,
+    что документ конвертирован. source - путь к конвертируемому файлу относительно MEDIA_ROOT
+    (по умолчанию - оригинальный файл документа). Состояние конвертации сохраняется в документе."""
+    document = Document.objects.get(pk=doc_id)
+    Document.objects.filter(pk=doc_id).update(pdf_status=Document.PdfStatus.CONVERTING, pdf_error='')
+
+    file_path = Path(str(document.file))
+    pdf_path = file_path.parent / f"{file_path.stem}_signs.pdf"
+    try:
+        converted_path = office_convert_to_pdf(Path(settings.MEDIA_ROOT) / (source or file_path))
+        # Переименование pdf
+        converted_path.replace(Path(settings.MEDIA_ROOT) / pdf_path)
+    except Exception as e:
+        Document.objects.filter(pk=doc_id).update(pdf_status=Document.PdfStatus.FAILED, pdf_error=str(e))
+        document_add_history(doc_id, 'Помилка конвертації у pdf (автоматично)', user_id)
+        raise
 
     document.converted_to_pdf = True
-    document.save()
-    document_add_history(document.pk, 'Конвертовано у pdf (автоматично)', user_id)
+    document.pdf_status = Document.PdfStatus.DONE
+    document.pdf_file = str(pdf_path)
+    document.pdf_error = ''
+    # Документ загружен до конвертации: сохраняются только её результаты, чтобы не перезаписать изменения,
+    # сделанные за время конвертации
+    document.save(update_fields=['converted_to_pdf', 'pdf_status', 'pdf_file', 'pdf_error', 'updated_at'])
+    document_add_history(doc_id, 'Конвертовано у pdf (автоматично)', user_id)
+    return document
+
+
+def document_schedule_pdf_conversion(doc_id: int, user_id: int = None, source: str = None,
+                                     send_to_sign: bool = False) -> None:
+    """Планирует конвертацию документа в PDF фоновой задачей после фиксации текущей транзакции
+    (см. document_convert_to_pdf). Если send_to_sign, после конвертации документ передаётся на подпись."""
+    Document.objects.filter(pk=doc_id).update(pdf_status=Document.PdfStatus.PENDING, pdf_error='')
+
+    from apps.cases.tasks import document_convert_to_pdf_task
+
+    transaction.on_commit(lambda: document_convert_to_pdf_task.delay(doc_id, user_id, source, send_to_sign))
+
+
+def document_get_pdf_statuses(doc_ids: Iterable[int], user: UserModel) -> List[dict]:
+    """Возвращает состояние конвертации в PDF документов (для ожидания конвертации перед подписанием).
+    Внешним пользователям доступны только документы их обращений и документы, которые они подписывают."""
+    documents = Document.objects.filter(pk__in=doc_ids)
+    if not user.is_internal:
+        documents = documents.filter(Q(claim__user=user) | Q(sign__user=user)).distinct()
+    return [
+        {
+            'id': document.pk,
+            'status': document.pdf_status,
+            'error': document.pdf_error,
+        }
+        for document in documents
+    ]
 
 
 def document_send_to_sign_collegium(document: Document, user_id: int) -> None:
@@ -276,21 +400,14 @@ def document_send_to_director(document: Document, user_id: int) -> None:
     document_add_history(document.pk, 'Документ відправлено на підпис директору організації', user_id)
 
 
-def document_send_to_sign(doc_id: int, user_id: int) -> None:
-    """Создаёт записи для подписи пользователей."""
+def document_send_to_sign(doc_id: int, user_id: int) -> bool:
+    """Создаёт записи для подписи пользователей.
+    Если документ ещё не конвертирован в pdf, планирует конвертацию, после которой документ будет передан
+    на подпись, и возвращает False."""
     document = document_get_by_id(doc_id)
 
-    # Конвертация документа в pdf
-    if not document.converted_to_pdf:
-        document_convert_original_doc_to_pdf(document, user_id)
-
     # Присвоение атрибутов документа
-    if not document.registration_number:
-        document_set_reg_number(document.pk)
-    if not document.barcode:
-        document_set_barcode(document.pk)
-    if not document.registration_date:
-        document_set_reg_date(document.pk)
+    document_register_missing(document)
 
     # Передача на подпись в зависимости от типа подписанта
     sign_methods = {
@@ -298,7 +415,14 @@ def document_send_to_sign(doc_id: int, user_id: int) -> None:
         DocumentType.SignerType.COLLEGIUM_HEAD.value: document_send_to_sign_collegium_head,
         DocumentType.SignerType.DIRECTOR.value: document_send_to_director,
     }
+
+    # Конвертация документа в pdf
+    if not document.converted_to_pdf:
+        document_schedule_pdf_conversion(document.pk, user_id, send_to_sign=True)
+        return False
+
     sign_methods[document.document_type.signer_type](document, user_id)
+    return True
 
 
 def document_send_to_chancellary(pk: int, user_id: int) -> Command:
@@ -0,0 +1,162 @@
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from apps.cases.models import Command, Document, DocumentHistory, EsignProtocolExchange, Sign
+from apps.common.fragment_cache import fragment_invalidate
+from .case_stage_reconcile_services import case_stage_schedule_evaluation
+from .case_summary_services import case_summary_schedule_refresh
+
+from pathlib import Path
+from typing import Optional
+import datetime
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Количество подписей, содержимое которых одновременно загружается из БД
+ESIGN_BODY_CHUNK_SIZE = 20
+
+
+def _external_signs_claim_commands(batch_size: int, started_at: datetime.datetime) -> list:
+    """Блокирует до batch_size необработанных команд (до конца транзакции). Команды, заблокированные
+    другими обработчиками, пропускаются, поэтому параллельные обработчики получают разные команды.
+    Команды, завершившиеся ошибкой после started_at, повторяются только при следующем запуске обработки."""
+    return list(
+        Command.objects.select_for_update(skip_locked=True).filter(
+            command_type__command_name='update_send_to_esign_service',
+            is_done=False,
+        ).exclude(
+            is_error=True,
+            error_datetime__gte=started_at,
+        ).order_by('pk')[:batch_size]
+    )
+
+
+def _external_signs_save_body(protocol: EsignProtocolExchange, path: Path) -> None:
+    with open(path, 'wb') as f:
+        f.write(protocol.esign_body or b'')
+
+
+def external_signs_handle_batch(batch_size: int, started_at: datetime.datetime = None) -> dict:
+    """Обрабатывает пакет команд получения электронных подписей из внешнего сервиса подписания:
+    сохраняет файлы подписей на диск, заполняет данные подписантов и историю документов.
+    Возвращает количество обработанных команд, подписей и ошибок."""
+    report = {'commands': 0, 'signs': 0, 'errors': 0}
+    with transaction.atomic():
+        commands = _external_signs_claim_commands(batch_size, started_at or timezone.now())
+        if not commands:
+            return report
+        commands_by_id = {command.pk: command for command in commands}
+
+        protocols = list(
+            EsignProtocolExchange.objects.filter(
+                command_id__in=commands_by_id
+            ).defer('esign_body').select_related('doc').order_by('pk')
+        )
+        protocols_by_id = {protocol.pk: protocol for protocol in protocols}
+
+        # Подписи, которые ожидают данных от сервиса подписания (по одной на документ)
+        signs = {}
+        for sign in Sign.objects.filter(
+                document_id__in={protocol.doc_id for protocol in protocols},
+                user__isnull=True,
+                timestamp=''
+        ).order_by('-pk'):
+            signs[sign.document_id] = sign
+
+        # Подписи сопоставляются протоколам до записи файлов: команда выполняется целиком или не выполняется совсем
+        # (иначе при повторе уже заполненные подписи команды не были бы найдены)
+        protocol_signs, errors = {}, {}
+        for protocol in protocols:
+            sign = signs.pop(protocol.doc_id, None)
+            if sign is None or protocol.doc is None:
+                errors.setdefault(
+                    protocol.command_id, f"Sign waiting for external service not found: document {protocol.doc_id}"
+                )
+            else:
+                protocol_signs[protocol.pk] = sign
+        done_protocol_ids = [
+            protocol.pk for protocol in protocols
+            if protocol.pk in protocol_signs and protocol.command_id not in errors
+        ]
+
+        # Содержимое подписей загружается из БД частями и записывается на диск без промежуточных копий
+        bodies = EsignProtocolExchange.objects.filter(
+            pk__in=done_protocol_ids
+        ).only('pk', 'esign_body').order_by('pk').iterator(chunk_size=ESIGN_BODY_CHUNK_SIZE)
+
+        updated_signs, history, document_ids, case_ids = [], [], set(), set()
+        for body in bodies:
+            protocol = protocols_by_id[body.pk]
+            sign = protocol_signs[protocol.pk]
+
+            # Сохранение файла цифр. подписи на диск
+            _external_signs_save_body(body, Path(protocol.doc.folder_path) / 'sign.p7s')
+
+            # Заполнение данных подписанта
+            sign.timestamp = str(protocol.date_signed)
+            sign.subject = protocol.signer_name
+            sign.file = str(Path(protocol.doc.file.name).parent / 'sign.p7s')
+            sign.updated_at = timezone.now()
+            updated_signs.append(sign)
+            history.append(DocumentHistory(
+                document_id=protocol.doc_id,
+                action='Отримано цифровий підпис від сервісу підписання документів'
+            ))
+            document_ids.add(protocol.doc_id)
+            case_ids.add(protocol.doc.case_id)
+
+        Sign.objects.bulk_update(updated_signs, ['timestamp', 'subject', 'file', 'updated_at'])
+        DocumentHistory.objects.bulk_create(history)
+
+        now = timezone.now()
+        for command in commands:
+            error = errors.get(command.pk)
+            command.is_done = error is None
+            command.is_error = error is not None
+            command.execution_date = now
+            command.error_datetime = now if error else None
+            command.error_message = error[:1024] if error else None
+        Command.objects.bulk_update(
+            commands, ['is_done', 'is_error', 'execution_date', 'error_datetime', 'error_message']
+        )
+
+        # bulk_update не вызывает сигналы модели подписи
+        for document_id in document_ids:
+            fragment_invalidate(Document(pk=document_id))
+        for case_id in case_ids:
+            case_summary_schedule_refresh(case_id)
+            # Определение стадии дела (одно на дело, после фиксации транзакции)
+            if case_id:
+                case_stage_schedule_evaluation(case_id)
+
+    for command_id, error in errors.items():
+        logger.warning('External sign command %s failed: %s', command_id, error)
+
+    report.update(commands=len(commands), signs=len(updated_signs), errors=len(errors))
+    return report
+
+
+def external_signs_handle(batch_size: int = None, max_batches: Optional[int] = None) -> dict:
+    """Обрабатывает команды получения электронных подписей пакетами, пока они есть (не более max_batches
+    пакетов). Может выполняться параллельно несколькими обработчиками. Возвращает отчёт с производительностью."""
+    batch_size = batch_size or getattr(settings, 'EXTERNAL_SIGNS_BATCH_SIZE', 100)
+    report = {'batches': 0, 'commands': 0, 'signs': 0, 'errors': 0}
+    started_at = timezone.now()
+    start = time.perf_counter()
+    while max_batches is None or report['batches'] < max_batches:
+        batch_report = external_signs_handle_batch(batch_size, started_at)
+        if not batch_report['commands']:
+            break
+        report['batches'] += 1
+        for key, val in batch_report.items():
+            report[key] += val
+        if batch_report['commands'] < batch_size:
+            break
+
+    report['seconds'] = round(time.perf_counter() - start, 3)
+    report['signs_per_second'] = round(report['signs'] / report['seconds'], 1) if report['seconds'] else 0
+    logger.info('External signs handled: %s', report)
+    return report
@@ -0,0 +1,82 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from apps.cases.models import NumeratorCounter
+
+from typing import Dict, List
+import datetime
+import os
+import threading
+
+# Блоки значений, зарезервированные текущим процессом: серия -> [следующее значение, последнее значение]
+_blocks: Dict[str, List[int]] = {}
+_blocks_pid = None
+_blocks_lock = threading.Lock()
+
+
+def _numerator_reserve(series: str, size: int) -> int:
+    """Резервирует в таблице счётчиков size значений серии и возвращает последнее из них.
+    UPDATE блокирует запись счётчика до конца транзакции, поэтому одновременные резервирования не пересекаются."""
+    with transaction.atomic():
+        if not NumeratorCounter.objects.filter(series=series).update(value=F('value') + size):
+            try:
+                with transaction.atomic():
+                    NumeratorCounter.objects.create(series=series, value=size)
+                return size
+            except IntegrityError:
+                # Счётчик серии одновременно создан в другом процессе
+                NumeratorCounter.objects.filter(series=series).update(value=F('value') + size)
+        return NumeratorCounter.objects.filter(series=series).values_list('value', flat=True).get()
+
+
+def numerator_next(series: str, block_size: int = None) -> int:
+    """Возвращает следующее значение серии номеров.
+
+    Значения выдаются из блока, зарезервированного процессом (hi/lo): таблица счётчиков изменяется один раз
+    на NUMERATOR_BLOCK_SIZE значений. Значения уникальны, но значения разных процессов не упорядочены по времени
+    выдачи, а неиспользованные значения блока пропускаются при завершении процесса.
+    Внутри транзакции резервируется одно значение: резервирование блока отменилось бы при её откате,
+    и значения блока были бы выданы повторно. block_size=1 - значения выдаются строго по порядку без пропусков
+    (счётчик изменяется при каждом вызове)."""
+    global _blocks_pid
+
+    size = block_size or getattr(settings, 'NUMERATOR_BLOCK_SIZE', 10)
+    if size == 1 or transaction.get_connection().in_atomic_block:
+        return _numerator_reserve(series, 1)
+
+    with _blocks_lock:
+        if _blocks_pid != os.getpid():
+            # Блоки родительского процесса не используются в дочернем (fork)
+            _blocks.clear()
+            _blocks_pid = os.getpid()
+        block = _blocks.get(series)
+        if block is None or block[0] > block[1]:
+            last = _numerator_reserve(series, size)
+            block = _blocks[series] = [last - size + 1, last]
+        value = block[0]
+        block[0] += 1
+    return value
+
+
+def numerator_next_reg_number(outgoing: bool, date: datetime.datetime = None) -> str:
+    """Возвращает следующий регистрационный номер документа: Вх-00001/2022 (вхідний) или Вих-00001/2022 (вихідний).
+    Нумерация начинается заново каждый год."""
+    year = (date or datetime.datetime.now()).year
+    if outgoing:
+        return f"Вих-{numerator_next(f'reg_number:outgoing:{year}'):05d}/{year}"
+    return f"Вх-{numerator_next(f'reg_number:incoming:{year}'):05d}/{year}"
+
+
+def numerator_next_barcode() -> str:
+    """Возвращает следующий штрихкод документа (32 цифры, сквозная нумерация)."""
+    return str(numerator_next('barcode')).zfill(32)
+
+
+def numerator_next_case_number(obj_kind_abbr: str, claim_kind_abbr: str, date: datetime.datetime = None) -> str:
+    """Возвращает следующий номер дела: {вид ОПІВ}-{вид звернення}-{год}{месяц}-{номер}.
+    Нумерация ведётся отдельно для каждого вида ОПІВ и вида звернення и начинается заново каждый месяц.
+    Номера дел выдаются строго по порядку, без блоков процессов."""
+    date = date or datetime.datetime.now()
+    prefix = f"{obj_kind_abbr}-{claim_kind_abbr}-{date.year}{date.month}"
+    return f"{prefix}-{numerator_next(f'case_number:{prefix}', block_size=1):03d}"
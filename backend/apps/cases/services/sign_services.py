@@ -1,9 +1,16 @@
 from django.contrib.auth import get_user_model
 from django.conf import settings
-from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.core.files.uploadedfile import InMemoryUploadedFile, UploadedFile
+from django.db import transaction
+from django.utils import timezone
 
-from apps.cases.models import Sign, Document
+from apps.cases.models import Sign, Document, DocumentHistory
+from apps.common.fragment_cache import fragment_invalidate
+from .document_services import document_can_be_signed_by_user
+from .case_stage_reconcile_services import case_stage_schedule_evaluation
+from .case_summary_services import case_summary_schedule_refresh
 from pathlib import Path
+from typing import Dict, List, Tuple
 from urllib.parse import unquote
 
 
@@ -25,9 +32,14 @@ def sign_create(data: dict) -> Sign:
     return sign
 
 
+def sign_get_p7s_path(document: Document, user: UserModel) -> Path:
+    """Возвращает путь к файлу цифровой подписи пользователя (относительно MEDIA_ROOT)."""
+    return Path(unquote(f"{document.file}_{user.pk}.p7s"))
+
+
 def sign_create_p7s(blob: InMemoryUploadedFile, document: Document, user: UserModel) -> Path:
     """Сохранение цифровой подписи на диск"""
-    relative_path = Path(unquote(f"{document.file}_{user.pk}.p7s"))
+    relative_path = sign_get_p7s_path(document, user)
     sign_destination = Path(settings.MEDIA_ROOT) / relative_path
 
     with open(sign_destination, 'wb+') as destination:
@@ -42,3 +54,83 @@ def sign_update(data: dict) -> Sign:
     qs = Sign.objects.filter(user=data['user'], document=data['document'])
     qs.update(**data)
     return qs.first()
+
+
+def sign_upload_internal_bulk(items: List[Tuple[int, UploadedFile, dict]], user: UserModel) -> Dict[int, dict]:
+    """Сохраняет цифровые подписи пользователя для нескольких документов (document_id, файл .p7s, данные подписи).
+    Данные подписей и история документов записываются в БД одной транзакцией, определение стадии планируется
+    один раз на дело. Возвращает результат для каждого документа: {'success': 1} или {'error': 1, 'message': ...}."""
+    documents = Document.objects.select_related('case', 'claim').prefetch_related('sign_set').in_bulk(
+        [document_id for document_id, _, _ in items]
+    )
+    res, signed, tmp_paths = {}, [], []
+    for document_id, blob, sign_info in items:
+        document = documents.get(document_id)
+        # Может ли пользователь подписывать файл
+        if not document or not document_can_be_signed_by_user(document, user):
+            res[document_id] = {'error': 1, 'message': 'Ви не можете підписувати цей файл.'}
+            continue
+        # Цифровая подпись записывается на диск во временный файл, который заменяет файл подписи
+        # только после фиксации транзакции
+        relative_path = sign_get_p7s_path(document, user)
+        tmp_path = Path(settings.MEDIA_ROOT) / relative_path.with_name(f"{relative_path.name}.tmp")
+        sign_upload(blob, tmp_path)
+        tmp_paths.append(tmp_path)
+        signed.append((document, relative_path, sign_info))
+
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            signs = {
+                sign.document_id: sign for sign in Sign.objects.filter(
+                    user=user, document_id__in=[document.pk for document, _, _ in signed]
+                )
+            }
+            new_signs = []
+            for document, relative_path, sign_info in signed:
+                sign = signs.get(document.pk)
+                if sign is None:
+                    # Документ обращения подписывается без созданной заранее записи (как в upload_sign_external_task)
+                    sign = Sign(document=document, user=user)
+                    new_signs.append(sign)
+                sign.file = str(relative_path)
+                sign.file_signed = document.signed_file
+                sign.subject = sign_info['subject']
+                sign.serial_number = sign_info['serial']
+                sign.issuer = sign_info['issuer']
+                sign.timestamp = sign_info['timestamp']
+                sign.updated_at = now
+                res[document.pk] = {'success': 1}
+            Sign.objects.bulk_update(
+                signs.values(), ['file', 'file_signed', 'subject', 'serial_number', 'issuer', 'timestamp', 'updated_at']
+            )
+            Sign.objects.bulk_create(new_signs)
+            DocumentHistory.objects.bulk_create([
+                DocumentHistory(
+                    document_id=document.pk,
+                    action=f"Документ підписано КЕП (підписувач: {sign_info['subject']}, {sign_info['serial']})",
+                    user_id=user.pk
+                ) for document, _, sign_info in signed
+            ])
+    except Exception:
+        for tmp_path in tmp_paths:
+            tmp_path.unlink(missing_ok=True)
+        raise
+
+    def replace_files():
+        for tmp_path in tmp_paths:
+            tmp_path.replace(tmp_path.with_suffix(''))
+
+    transaction.on_commit(replace_files)
+
+    # bulk_update не вызывает сигналы модели подписи
+    for document, _, _ in signed:
+        fragment_invalidate(document)
+    for case_id in {document.case_id for document, _, _ in signed}:
+        case_summary_schedule_refresh(case_id)
+        # Проверка, какой стадии соответствует дело (фоновой задачей, один раз на дело)
+        if case_id:
+            case_stage_schedule_evaluation(case_id, user.pk)
+
+    return res
+
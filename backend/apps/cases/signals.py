@@ -1,9 +1,86 @@
-from django.db.models.signals import post_delete
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from .models import Document
+from .models import Case, CaseStageStep, Document, Sign, CollegiumMembership
+from .services.case_summary_services import (case_summary_schedule_refresh, case_summary_update_claim_kind_title,
+                                             case_summary_update_obj_kind_title, case_summary_update_stage_step,
+                                             case_summary_update_user_names)
+from apps.common.fragment_cache import fragment_invalidate
+from apps.classifiers.models import ClaimKind, ObjKind
+from apps.filling.models import Claim
 import shutil
 
+UserModel = get_user_model()
+
 
 @receiver(post_delete, sender=Document)
 def delete_document_folder_hook(sender, instance, using, **kwargs):
     shutil.rmtree(instance.folder_path, ignore_errors=True)
+
+
+@receiver(post_save, sender=Case)
+@receiver(post_delete, sender=Case)
+@receiver(post_save, sender=Document)
+@receiver(post_delete, sender=Document)
+def invalidate_fragments_hook(sender, instance, **kwargs):
+    fragment_invalidate(instance)
+
+
+@receiver(post_save, sender=Sign)
+@receiver(post_delete, sender=Sign)
+def invalidate_sign_document_fragments_hook(sender, instance, **kwargs):
+    if instance.document_id:
+        fragment_invalidate(Document(pk=instance.document_id))
+
+
+@receiver(post_save, sender=Case)
+def case_summary_case_hook(sender, instance, **kwargs):
+    case_summary_schedule_refresh(instance.pk)
+
+
+@receiver(post_save, sender=Document)
+@receiver(post_delete, sender=Document)
+@receiver(post_save, sender=CollegiumMembership)
+@receiver(post_delete, sender=CollegiumMembership)
+def case_summary_case_relation_hook(sender, instance, **kwargs):
+    case_summary_schedule_refresh(instance.case_id)
+
+
+@receiver(post_save, sender=Sign)
+@receiver(post_delete, sender=Sign)
+def case_summary_sign_hook(sender, instance, **kwargs):
+    case_summary_schedule_refresh(
+        Document.objects.filter(pk=instance.document_id).values_list('case_id', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Claim)
+def case_summary_claim_hook(sender, instance, **kwargs):
+    case_summary_schedule_refresh(
+        Case.objects.filter(claim_id=instance.pk).values_list('pk', flat=True).first()
+    )
+
+
+# Сводные данные содержат копии ФИО пользователей и названий из справочников
+
+@receiver(post_save, sender=UserModel)
+def case_summary_user_hook(sender, instance, update_fields=None, **kwargs):
+    # Вход пользователя сохраняет только last_login
+    if update_fields and not {'last_name', 'first_name', 'middle_name'} & set(update_fields):
+        return
+    case_summary_update_user_names(instance)
+
+
+@receiver(post_save, sender=ObjKind)
+def case_summary_obj_kind_hook(sender, instance, **kwargs):
+    case_summary_update_obj_kind_title(instance)
+
+
+@receiver(post_save, sender=ClaimKind)
+def case_summary_claim_kind_hook(sender, instance, **kwargs):
+    case_summary_update_claim_kind_title(instance)
+
+
+@receiver(post_save, sender=CaseStageStep)
+def case_summary_stage_step_hook(sender, instance, **kwargs):
+    case_summary_update_stage_step(instance)
@@ -1,28 +1,29 @@
 from django.conf import settings
-from django.utils import timezone
 
 from core.celery import app
 
 from pathlib import Path
+from typing import Optional, Union
 from urllib.parse import unquote
-import io
 
 from apps.users import services as users_services
-from .services import sign_services, document_services
-from apps.common.utils import base64_to_file
+from .services import sign_services, document_services, case_stage_reconcile_services, external_sign_services
+from apps.common.file_spool import file_spool_receive
 from apps.filling import services as filling_services
-from apps.cases.models import Command, Sign
 
 
 @app.task
-def upload_sign_external_task(document_id: int, sign_file_base_64: str, sign_info: dict, cert_data: dict) -> dict:
-    """Создаёт на диске файл с цифровой подписью и записывает информацию о подписи в БД."""
-    user = users_services.user_get_or_create_from_cert(cert_data)
+def upload_sign_external_task(document_id: int, sign_file: Union[dict, str], sign_info: dict,
+                              user_or_cert: Union[int, dict]) -> dict:
+    """Создаёт на диске файл с цифровой подписью и записывает информацию о подписи в БД.
+    sign_file - ссылка на файл подписи в спуле или (для задач, поставленных ранее) его содержимое в base64.
+    user_or_cert - id пользователя или (для задач, поставленных ранее) данные его сертификата ЭЦП."""
+    user = users_services.user_get_for_task(user_or_cert)
     document = document_services.document_get_by_id(document_id)
     if document and document_services.document_can_be_signed_by_user(document.pk, user):
         relative_path = Path(unquote(f"{document.file}_{user.pk}.p7s"))
         sign_destination = Path(settings.MEDIA_ROOT) / relative_path
-        base64_to_file(sign_file_base_64, sign_destination)
+        file_spool_receive(sign_file, sign_destination)
         sign_data = {
             'document': document,
             'file': str(relative_path),
@@ -45,44 +46,59 @@ def upload_sign_external_task(document_id: int, sign_file_base_64: str, sign_inf
         # Обновление статуса заявки
         filling_services.claim_set_status_if_all_docs_signed(document.claim_id)
 
+        # Определение стадии дела (документы обращения не относятся к делу)
+        if document.case_id:
+            case_stage_reconcile_services.case_stage_schedule_evaluation(document.case_id, user.pk)
+
         return {'success': 1}
 
     return {'success': 0}
 
 
 @app.task
-def handle_external_signs():
-    """Получает электронные подписи из внешнего сервиса подписания и обрабатывает их."""
-    # Выборка всех необработанных команд
-    commands = Command.objects.filter(command_type__command_name='update_send_to_esign_service', is_done=False)
-
-    # Обработка цифровых подписей
-    for command in commands:
-        for protocol in command.esignprotocolexchange_set.all():
-            # Сохранение файла цифр. подписи на диск
-            binary_io = io.BytesIO(protocol.esign_body)
-            p7s_path_absolute = str(Path(protocol.doc.folder_path) / 'sign.p7s')
-            p7s_path_relative = str(Path(protocol.doc.file.name).parent / 'sign.p7s')
-
-            with open(p7s_path_absolute, "wb") as f:
-                f.write(binary_io.read())
-
-            # Заполнение данных подписанта
-            sign = Sign.objects.get(
-                document_id=protocol.doc_id,
-                user__isnull=True,
-                timestamp=''
-            )
-            sign.timestamp = str(protocol.date_signed)
-            sign.subject = protocol.signer_name
-            sign.file = p7s_path_relative
-            sign.save()
-            document_services.document_add_history(
-                protocol.doc_id,
-                'Отримано цифровий підпис від сервісу підписання документів'
-            )
-
-        command.is_done = True
-        command.is_error = False
-        command.execution_date = timezone.now()
-        command.save()
+def handle_external_signs(batch_size: int = None, max_batches: int = None) -> dict:
+    """Получает электронные подписи из внешнего сервиса подписания и обрабатывает их пакетами.
+    Возвращает отчёт о количестве обработанных подписей и производительности."""
+    return external_sign_services.external_signs_handle(batch_size, max_batches)
+
+
+@app.task(queue=getattr(settings, 'DOCUMENTS_CONVERSION_QUEUE', 'celery'))
+def document_convert_to_pdf_task(document_id: int, user_id: int = None, source: str = None,
+                                 send_to_sign: bool = False) -> str:
+    """Конвертирует документ в PDF (см. document_schedule_pdf_conversion) и возвращает состояние конвертации.
+    Если send_to_sign, после конвертации передаёт документ на подпись и планирует определение стадии дела."""
+    document = document_services.document_convert_to_pdf(document_id, user_id, source)
+    if send_to_sign and not document.sign_set.exists():
+        document_services.document_send_to_sign(document.pk, user_id)
+        if document.case_id:
+            case_stage_reconcile_services.case_stage_schedule_evaluation(document.case_id, user_id)
+    return document.pdf_status
+
+
+@app.task(bind=True, max_retries=None)
+def case_evaluate_stage_task(self, case_id: int, user_id: int = None) -> Optional[dict]:
+    """Определяет стадию ап. дела и выполняет сопутствующие стадиям действия (см. case_stage_schedule_evaluation).
+    Если стадия этого дела уже определяется другой задачей, задача повторяется позже."""
+    if not case_stage_reconcile_services.case_stage_evaluation_lock_acquire(case_id):
+        raise self.retry(countdown=getattr(settings, 'CASE_STAGE_EVALUATION_DELAY', 5))
+    try:
+        return case_stage_reconcile_services.case_stage_evaluate(case_id, user_id)
+    finally:
+        case_stage_reconcile_services.case_stage_evaluation_lock_release(case_id)
+
+
+@app.task
+def reconcile_cases_stages_task(dry_run: bool = False, batch_size: int = 100) -> int:
+    """Распределяет сверку стадий активных ап. дел по задачам, обрабатывающим пакеты дел.
+    Возвращает количество пакетов."""
+    case_ids = case_stage_reconcile_services.case_stage_reconcile_get_ids()
+    chunks = [case_ids[i:i + batch_size] for i in range(0, len(case_ids), batch_size)]
+    for chunk in chunks:
+        reconcile_cases_stages_chunk_task.delay(chunk, dry_run)
+    return len(chunks)
+
+
+@app.task
+def reconcile_cases_stages_chunk_task(case_ids: list, dry_run: bool = False) -> dict:
+    """Сверяет стадии пакета ап. дел и возвращает отчёт."""
+    return case_stage_reconcile_services.case_stage_reconcile(case_ids, dry_run)
@@ -0,0 +1,58 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from apps.cases.models import Case, Document, DocumentHistory, Sign
+from apps.cases.services import create_document_service
+from apps.classifiers.models import ClaimKind, DocumentType, ObjKind
+from apps.filling.models import Claim
+
+from pathlib import Path
+from unittest import mock
+import shutil
+import tempfile
+
+
+class CreateDocumentsTests(TestCase):
+    templates_path = Path(__file__).resolve().parents[4] / 'fixtures' / 'files' / 'templates'
+
+    def setUp(self) -> None:
+        self.media_root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.media_root, True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        template = next(self.templates_path.glob('*.docx'))
+        (self.media_root / 'doc-templates').mkdir()
+        shutil.copy(template, self.media_root / 'doc-templates' / 'template.docx')
+
+        self.user = get_user_model().objects.create_user(email='secretary@user.com', password='foo')
+        obj_kind = ObjKind.objects.create(title='Винахід')
+        claim_kind = ClaimKind.objects.create(title='Заперечення', obj_kind=obj_kind)
+        claim = Claim.objects.create(obj_kind=obj_kind, claim_kind=claim_kind, obj_number='a202200001',
+                                     obj_title='Назва', status=3)
+        self.case = Case.objects.create(case_number='case-1', claim=claim)
+        for code in ('9001', '9002'):
+            doc_type = DocumentType.objects.create(title=code, code=code, template='doc-templates/template.docx')
+            doc_type.claim_kinds.add(claim_kind)
+
+    def test_documents_are_created_with_history_signs_and_files(self) -> None:
+        documents = create_document_service.create_documents(
+            self.case.pk, ['9001', '9002'], self.user.pk, signer_id=self.user.pk, create_signs=True
+        )
+
+        self.assertEqual([x.document_type.code for x in documents], ['9001', '9002'])
+        for document in Document.objects.filter(pk__in=[x.pk for x in documents]):
+            self.assertEqual(Path(document.file.name).parent.name, str(document.pk))
+            self.assertTrue((self.media_root / document.file.name).exists())
+        self.assertEqual(DocumentHistory.objects.filter(document__in=documents, user_id=self.user.pk).count(), 2)
+        self.assertEqual(Sign.objects.filter(document__in=documents, user=self.user).count(), 2)
+
+    def test_files_are_removed_on_rollback(self) -> None:
+        with mock.patch.object(Sign.objects, 'bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                create_document_service.create_documents(
+                    self.case.pk, ['9001', '9002'], self.user.pk, signer_id=self.user.pk, create_signs=True
+                )
+        self.assertFalse(Document.objects.filter(case=self.case).exists())
+        self.assertEqual([x for x in (self.media_root / 'documents').rglob('*') if x.is_file()], [])
@@ -0,0 +1,53 @@
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from apps.cases.models import Document, NumeratorCounter
+from apps.cases.services import numerator_services
+from apps.cases.services.document_services import document_register, document_register_missing
+
+import datetime
+
+
+@override_settings(NUMERATOR_BLOCK_SIZE=5)
+class NumeratorBlockTests(TransactionTestCase):
+    def setUp(self) -> None:
+        numerator_services._blocks.clear()
+
+    def test_values_are_reserved_by_blocks(self) -> None:
+        self.assertEqual([numerator_services.numerator_next('test') for _ in range(7)], [1, 2, 3, 4, 5, 6, 7])
+        self.assertEqual(NumeratorCounter.objects.get(series='test').value, 10)
+
+        # Блок другого процесса
+        numerator_services._blocks.clear()
+        self.assertEqual(numerator_services.numerator_next('test'), 11)
+
+    def test_case_numbers_are_not_reserved_by_blocks(self) -> None:
+        date = datetime.datetime(2022, 11, 1)
+        self.assertEqual(numerator_services.numerator_next_case_number('В', 'З', date), 'В-З-202211-001')
+        numerator_services._blocks.clear()
+        self.assertEqual(numerator_services.numerator_next_case_number('В', 'З', date), 'В-З-202211-002')
+
+
+class NumeratorTests(TestCase):
+    def test_values_inside_transaction_are_reserved_one_by_one(self) -> None:
+        self.assertEqual([numerator_services.numerator_next('test') for _ in range(3)], [1, 2, 3])
+        self.assertEqual(NumeratorCounter.objects.get(series='test').value, 3)
+
+    def test_formats(self) -> None:
+        date = datetime.datetime(2022, 11, 1)
+        self.assertEqual(numerator_services.numerator_next_reg_number(False, date), 'Вх-00001/2022')
+        self.assertEqual(numerator_services.numerator_next_reg_number(True, date), 'Вих-00001/2022')
+        self.assertEqual(numerator_services.numerator_next_reg_number(True, date), 'Вих-00002/2022')
+        self.assertEqual(numerator_services.numerator_next_case_number('В', 'З', date), 'В-З-202211-001')
+        self.assertEqual(numerator_services.numerator_next_case_number('Т', 'З', date), 'Т-З-202211-001')
+        self.assertEqual(numerator_services.numerator_next_barcode(), '1'.zfill(32))
+
+    def test_document_register(self) -> None:
+        document = Document.objects.create(file='test_file', barcode='123')
+        document_register_missing(document)
+        document.refresh_from_db()
+        self.assertRegex(document.registration_number, r'Вх-00001/\d{4}')
+        self.assertIsNotNone(document.registration_date)
+        self.assertEqual(document.barcode, '123')
+
+        document_register(document, ['barcode'])
+        self.assertEqual(Document.objects.get(pk=document.pk).barcode, '1'.zfill(32))
@@ -0,0 +1,42 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.test import TestCase
+
+from apps.cases.models import Document
+from apps.cases.services import document_services
+
+from unittest import mock
+
+
+class DocumentPdfConversionTests(TestCase):
+    def test_conversion_is_scheduled_after_commit(self):
+        document = Document.objects.create(file='test_file.docx')
+        with mock.patch('apps.cases.tasks.document_convert_to_pdf_task.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                document_services.document_schedule_pdf_conversion(document.pk, None, send_to_sign=True)
+                delay.assert_not_called()
+        delay.assert_called_once_with(document.pk, None, None, True)
+
+        document.refresh_from_db()
+        self.assertTrue(document.pdf_in_progress)
+        user = get_user_model().objects.create_user(email='internal@user.com', password='foo')
+        self.assertEqual(
+            document_services.document_get_pdf_statuses([document.pk], user),
+            [{'id': document.pk, 'status': Document.PdfStatus.PENDING, 'error': ''}]
+        )
+
+    def test_statuses_of_other_users_documents_are_not_returned(self):
+        document = Document.objects.create(file='test_file.docx')
+        applicant = get_user_model().objects.create_user(email='applicant@user.com', password='foo')
+        applicant.groups.add(Group.objects.get_or_create(name='Заявник')[0])
+        self.assertEqual(document_services.document_get_pdf_statuses([document.pk], applicant), [])
+
+    def test_failed_conversion_is_saved(self):
+        document = Document.objects.create(file='test_file.docx')
+        with mock.patch.object(document_services, 'office_convert_to_pdf', side_effect=OSError('no office')):
+            with self.assertRaises(OSError):
+                document_services.document_convert_to_pdf(document.pk)
+        document.refresh_from_db()
+        self.assertEqual(document.pdf_status, Document.PdfStatus.FAILED)
+        self.assertEqual(document.pdf_error, 'no office')
+        self.assertFalse(document.converted_to_pdf)
@@ -21,7 +21,7 @@ class ServicesTest(TestCase):
         services.document_set_reg_number(new_doc.id)
         changed_doc = Document.objects.get(pk=new_doc.id)
         self.assertIsNotNone(changed_doc.registration_number)
-        self.assertRegex(changed_doc.registration_number, r"Вх-\d{5}/2022")
+        self.assertRegex(changed_doc.registration_number, r"Вх-\d{5}/\d{4}")
 
     @override_settings(DEBUG=True)
     def test_document_set_barcode(self):
@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+
+from apps.cases.models import Case, Document, DocumentHistory, Sign
+from apps.cases.services import sign_services
+
+from pathlib import Path
+from unittest import mock
+import tempfile
+
+
+class SignUploadInternalBulkTests(TestCase):
+    def setUp(self) -> None:
+        media_root = Path(tempfile.mkdtemp())
+        (media_root / 'case').mkdir()
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = get_user_model().objects.create_user(email='signer@user.com', password='foo')
+        self.case = Case.objects.create(case_number='case-1')
+        self.documents = [Document.objects.create(case=self.case, file=f'case/doc{i}.pdf') for i in range(3)]
+        for document in self.documents[:2]:
+            Sign.objects.create(document=document, user=self.user)
+
+    sign_info = {'subject': 'Підписувач', 'serial': '0001', 'issuer': 'АЦСК', 'timestamp': '2022-01-01'}
+
+    def test_signs_are_saved_in_bulk(self) -> None:
+        items = [(document.pk, SimpleUploadedFile('blob', b'p7s'), self.sign_info) for document in self.documents]
+        with mock.patch.object(sign_services, 'case_stage_schedule_evaluation') as schedule_evaluation:
+            with self.captureOnCommitCallbacks(execute=True):
+                res = sign_services.sign_upload_internal_bulk(items, self.user)
+
+        self.assertEqual(res[self.documents[0].pk], {'success': 1})
+        self.assertEqual(res[self.documents[1].pk], {'success': 1})
+        # Пользователь не передан на подпись третьего документа
+        self.assertEqual(res[self.documents[2].pk]['error'], 1)
+
+        signs = Sign.objects.filter(user=self.user).order_by('document_id')
+        self.assertEqual([x.timestamp for x in signs], ['2022-01-01', '2022-01-01'])
+        self.assertEqual(DocumentHistory.objects.filter(user=self.user).count(), 2)
+        schedule_evaluation.assert_called_once_with(self.case.pk, self.user.pk)
+        self.assertEqual(
+            sorted(x.name for x in (Path(settings.MEDIA_ROOT) / 'case').iterdir()),
+            [f'doc0.pdf_{self.user.pk}.p7s', f'doc1.pdf_{self.user.pk}.p7s']
+        )
+
+    def test_files_are_removed_on_rollback(self) -> None:
+        items = [(self.documents[0].pk, SimpleUploadedFile('blob', b'p7s'), self.sign_info)]
+        with mock.patch.object(DocumentHistory.objects, 'bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                sign_services.sign_upload_internal_bulk(items, self.user)
+        self.assertEqual(list((Path(settings.MEDIA_ROOT) / 'case').iterdir()), [])
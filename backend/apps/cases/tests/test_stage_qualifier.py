@@ -0,0 +1,191 @@
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+
+from apps.cases.models import Case, CaseStage, CaseStageStep
+from apps.cases.services.case_stage_step_change_action_service import CaseDocumentFacts, CaseStageStepQualifier
+from apps.cases.services.case_stage_reconcile_services import (case_stage_reconcile, case_stage_reconcile_one,
+                                                               case_stage_schedule_evaluation)
+
+from types import SimpleNamespace
+from unittest import mock
+import datetime
+import itertools
+
+
+class FakeManager:
+    """Заменяет менеджер связанных объектов (document_set, meeting_set и т.д.) списком объектов."""
+
+    def __init__(self, items: list):
+        self.items = items
+
+    def all(self):
+        return self
+
+    def filter(self, **kwargs):
+        return self
+
+    def select_related(self, *args):
+        return self
+
+    def prefetch_related(self, *args):
+        return self
+
+    def order_by(self, *args):
+        return self
+
+    def first(self):
+        return self.items[0] if self.items else None
+
+    def exists(self):
+        return bool(self.items)
+
+    def count(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+def make_facts(docs_signed: bool) -> CaseDocumentFacts:
+    """Документы дела, каждый из которых передан на подпись главе АП."""
+    sign = {'timestamp': '2022-01-01' if docs_signed else '', 'groups': {'Голова Апеляційної палати'}}
+    return CaseDocumentFacts(
+        [{'pk': pk, 'code': code, 'signs': [sign]} for pk, code in enumerate(('0005', '0028', '0027', '0001'))]
+    )
+
+
+def make_case(code: int, has_collegium: bool, accepted: list, published: bool) -> SimpleNamespace:
+    meetings = []
+    if accepted:
+        invitations = [SimpleNamespace(accepted_at='2022-01-01' if x else None) for x in accepted]
+        meetings.append(SimpleNamespace(invitation_set=FakeManager(invitations)))
+    return SimpleNamespace(
+        pk=1,
+        stage_step=SimpleNamespace(code=code),
+        claim=SimpleNamespace(claim_kind_id=1),
+        collegiummembership_set=FakeManager([object()] if has_collegium else []),
+        meeting_set=FakeManager(meetings),
+        published=published,
+    )
+
+
+def get_stage_step_exhaustive(qualifier: CaseStageStepQualifier, case, facts: CaseDocumentFacts) -> int:
+    """Прежний алгоритм: проверка всех стадий от старшей к младшей."""
+    qualifier.case = case
+    qualifier._facts = facts
+    for stage in sorted(qualifier.stages_checks.keys(), reverse=True):
+        if qualifier.stages_checks[stage]():
+            return stage
+    return 0
+
+
+class CaseStageStepQualifierTests(SimpleTestCase):
+    codes = [1000, 2000, 2001, 2002, 2003, 2004, 2005, 2006, 3000, 3001, 3002, 4000, 5000, 6000, 7000, 8000]
+
+    def test_transitions_match_exhaustive_check(self) -> None:
+        scenarios = itertools.product(
+            self.codes,
+            [True, False],  # документы подписаны
+            [True, False],  # коллегия сформирована
+            [[], [False, False], [True, False], [True, True]],  # приглашения на заседание
+            [True, False],  # дело опубликовано
+            [[], [{'code': '0001'}], [{'code': '9999'}]],  # типы документов, которые должны присутствовать
+        )
+        qualifier = CaseStageStepQualifier()
+        for code, docs_signed, has_collegium, accepted, published, doc_types in scenarios:
+            case = make_case(code, has_collegium, accepted, published)
+            facts = make_facts(docs_signed)
+            with mock.patch.multiple(
+                    'apps.classifiers.services',
+                    get_doc_types_for_consideration=mock.Mock(return_value=doc_types),
+                    get_doc_types_for_pre_meeting_protocol=mock.Mock(return_value=doc_types),
+                    get_doc_types_for_meeting=mock.Mock(return_value=doc_types),
+                    get_doc_types_for_meeting_holding=mock.Mock(return_value=doc_types),
+            ):
+                with self.subTest(code=code, docs_signed=docs_signed, has_collegium=has_collegium,
+                                  accepted=accepted, published=published, doc_types=doc_types):
+                    self.assertEqual(
+                        qualifier.get_stage_step(case, facts),
+                        get_stage_step_exhaustive(qualifier, case, facts)
+                    )
+
+    def test_only_outgoing_transitions_are_checked(self) -> None:
+        qualifier = CaseStageStepQualifier()
+        case = make_case(2004, True, [], False)
+        with mock.patch('apps.classifiers.services.get_doc_types_for_consideration', return_value=[{'code': '9999'}]):
+            self.assertEqual(qualifier.get_stage_step(case, make_facts(False)), 0)
+        self.assertEqual([x[1] for x in qualifier.timings], [3000, 2005])
+
+
+class CaseDocumentFactsTests(SimpleTestCase):
+    def test_facts(self) -> None:
+        head = {'Заступник голови Апеляційної палати'}
+        facts = CaseDocumentFacts([
+            {'pk': 2, 'code': '0027', 'signs': [{'timestamp': '2022-01-01', 'groups': set()}]},
+            {'pk': 1, 'code': '0027', 'signs': [{'timestamp': '', 'groups': set()}]},
+            {'pk': 3, 'code': '0005', 'signs': [{'timestamp': '2022-01-01', 'groups': head},
+                                                {'timestamp': '', 'groups': set()}]},
+            {'pk': 4, 'code': '0001', 'signs': []},
+        ])
+        self.assertEqual(facts.codes, {'0027', '0005', '0001'})
+        self.assertEqual(facts.codes_sent_to_sign, {'0027', '0005'})
+        self.assertEqual(facts.codes_signed, {'0027'})
+        self.assertEqual(facts.codes_signed_by_head, {'0005'})
+        # Первый документ 0027 ещё не подписан
+        self.assertFalse(facts.first_document_is_signed('0027'))
+        self.assertFalse(facts.first_document_is_signed('0028'))
+
+
+class CaseStageReconcileTests(TestCase):
+    def setUp(self) -> None:
+        stage = CaseStage.objects.create(title='Рішення', number=5)
+        steps = {
+            code: CaseStageStep.objects.create(title=str(code), stage=stage, code=code) for code in (1000, 7000, 8000)
+        }
+        published = datetime.datetime.now()
+        self.case = Case.objects.create(case_number='case-1', stage_step=steps[7000], published=published)
+        # Не сверяются: новое дело и дело, рассмотрение которого прекращено
+        Case.objects.create(case_number='case-2', stage_step=steps[1000])
+        Case.objects.create(case_number='case-3', stage_step=steps[7000], published=published, stopped=True)
+
+    def test_dry_run_does_not_change_stage(self) -> None:
+        report = case_stage_reconcile(dry_run=True)
+        self.assertEqual(report['total'], 1)
+        self.assertEqual(report['changes'], [
+            {'case_id': self.case.pk, 'case_number': 'case-1', 'stage_from': 7000, 'steps': [8000]}
+        ])
+        self.case.refresh_from_db()
+        self.assertEqual(self.case.stage_step.code, 7000)
+
+    def test_reconcile(self) -> None:
+        report = case_stage_reconcile()
+        self.assertEqual(report['errors'], [])
+        self.assertEqual(report['changes'][0]['steps'], [8000])
+        self.case.refresh_from_db()
+        self.assertEqual(self.case.stage_step.code, 8000)
+        self.assertTrue(self.case.stopped)
+
+    def test_deleted_case(self) -> None:
+        self.assertIsNone(case_stage_reconcile_one(self.case.pk + 1))
+
+
+class CaseStageScheduleEvaluationTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_evaluations_are_coalesced(self) -> None:
+        with mock.patch('apps.cases.tasks.case_evaluate_stage_task.apply_async') as apply_async:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                case_stage_schedule_evaluation(1, 2)
+                case_stage_schedule_evaluation(1, 3)
+                case_stage_schedule_evaluation(2)
+        self.assertEqual(len(callbacks), 3)
+        self.assertEqual([x.args[0] for x in apply_async.call_args_list], [(1, 2), (2, None)])
+
+    def test_rolled_back_transaction_does_not_suppress_evaluation(self) -> None:
+        with mock.patch('apps.cases.tasks.case_evaluate_stage_task.apply_async') as apply_async:
+            with self.captureOnCommitCallbacks(execute=False):
+                case_stage_schedule_evaluation(1, 2)
+            with self.captureOnCommitCallbacks(execute=True):
+                case_stage_schedule_evaluation(1, 3)
+        self.assertEqual([x.args[0] for x in apply_async.call_args_list], [(1, 3)])
@@ -0,0 +1,28 @@
+from django.test import SimpleTestCase
+
+from apps.cases.services.case_template_context_service import CaseTemplateContext, DOC_TYPES_VARS, VARS
+
+from types import SimpleNamespace
+from unittest import mock
+
+
+class CaseTemplateContextTests(SimpleTestCase):
+    def test_vars_refer_to_context_attributes(self) -> None:
+        attrs = set(VARS.values())
+        for doc_vars in DOC_TYPES_VARS.values():
+            attrs.update(doc_vars.values())
+        for attr in attrs:
+            self.assertTrue(hasattr(CaseTemplateContext, attr), attr)
+
+    def test_values_are_resolved_once(self) -> None:
+        case = SimpleNamespace(case_number='case-1', addressee='Адресат', address='Адреса', claim=None)
+        context = CaseTemplateContext(case, form_data={'reason': 'Причина'})
+        claim_doc = SimpleNamespace(registration_number='1', input_date=mock.Mock(), barcode='123456789012')
+        claim_doc.input_date.strftime.return_value = '01.01.2022'
+        with mock.patch('apps.cases.models.Document.objects.get', return_value=claim_doc) as get:
+            self.assertEqual(context.claim_doc_reg_num, '1')
+            self.assertEqual(context.claim_doc_reg_date, '01.01.2022')
+            self.assertEqual(context.doc_download_code, '3456789012')
+        get.assert_called_once()
+        self.assertEqual(context.reason, 'Причина')
+        self.assertEqual(context.order_number, 'Номер наказу')
@@ -1,7 +1,14 @@
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 
+from apps.cases.models import Case, CaseStage, CaseStageStep, CaseSummary, CollegiumMembership
+from apps.cases.services import case_services, case_detail_context_service
+from apps.classifiers.models import ObjKind, ClaimKind
+from apps.filling.models import Claim, ClaimField
+
 
 class CasesListNonAuthTests(TestCase):
     def test_cases_list_requires_authorization(self) -> None:
@@ -29,3 +36,138 @@ class CasesListTests(TestCase):
         resp = self.client.get(reverse('cases-list'))
         self.assertEqual(resp.status_code, 200)
         self.assertTemplateUsed(resp, 'cases/list/index.html')
+
+
+class CasesApiKeysetTests(TestCase):
+    def setUp(self) -> None:
+        UserModel = get_user_model()
+        UserModel.objects.create_user('user@user.com', 'secret')
+        self.client.login(email='user@user.com', password='secret')
+        # Список дел строится по сводным данным, которые обновляются после фиксации транзакции
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(5):
+                Case.objects.create(case_number=f'case-{i}')
+
+    def test_cases_api_keyset_pages_do_not_overlap(self) -> None:
+        resp = self.client.get('/api/cases/', {'format': 'json', 'mode': 'keyset', 'length': 3})
+        self.assertEqual(resp.status_code, 200)
+        first_page = resp.json()
+        self.assertEqual(first_page['count'], 5)
+        self.assertEqual(len(first_page['results']), 3)
+        self.assertIsNotNone(first_page['next'])
+
+        resp = self.client.get(first_page['next'])
+        second_page = resp.json()
+        self.assertEqual(second_page['count'], 5)
+        self.assertEqual(len(second_page['results']), 2)
+        self.assertIsNone(second_page['next'])
+
+        ids = [x['id'] for x in first_page['results'] + second_page['results']]
+        self.assertEqual(len(set(ids)), 5)
+
+    def test_cases_api_keyset_filter_me(self) -> None:
+        resp = self.client.get('/api/cases/', {'format': 'json', 'mode': 'keyset', 'users': 'me'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()['count'], 0)
+
+
+class CaseQsProfilesTests(TestCase):
+    def setUp(self) -> None:
+        self.case = Case.objects.create(case_number='case-1')
+
+    def test_case_get_one_with_each_profile(self) -> None:
+        for profile in case_services.CASE_QS_PROFILES:
+            self.assertEqual(case_services.case_get_one(self.case.pk, profile), self.case)
+
+    def test_permission_profile_uses_single_query(self) -> None:
+        with self.assertNumQueries(1):
+            case = case_services.case_get_one(self.case.pk, 'permission')
+            self.assertEqual(case.case_number, 'case-1')
+
+
+class CaseDetailQueryBudgetTests(TestCase):
+    # Максимальное количество запросов к БД при открытии страницы ап. дела
+    query_budget = 25
+
+    def setUp(self) -> None:
+        UserModel = get_user_model()
+        self.user = UserModel.objects.create_user('user@user.com', 'secret')
+        self.client.login(email='user@user.com', password='secret')
+
+        obj_kind = ObjKind.objects.create(title='Винахід')
+        claim_kind = ClaimKind.objects.create(title='Заперечення', obj_kind=obj_kind)
+        ClaimField.objects.create(title='Номер заявки', input_id='app_number', claim_kind=claim_kind, stage=3)
+        claim = Claim.objects.create(
+            obj_kind=obj_kind,
+            claim_kind=claim_kind,
+            obj_number='a202200001',
+            obj_title='Назва',
+            status=3,
+            json_data='{"app_number": "a202200001"}',
+        )
+        stage = CaseStage.objects.create(title='Підготовка', number=2)
+        stage_step = CaseStageStep.objects.create(title='Прийнято в роботу', stage=stage, code=2000)
+        self.case = Case.objects.create(case_number='case-1', claim=claim, stage_step=stage_step)
+
+    def test_case_detail_context_queries(self) -> None:
+        case = case_services.case_get_one(self.case.pk, 'detail')
+        # Стадии и поля обращения, всё остальное подгружено профилем 'detail'
+        with self.assertNumQueries(2):
+            context = case_detail_context_service.CaseDetailContext(case, self.user).build()
+        self.assertEqual(context['claim']['claim_data']['case_number'], 'case-1')
+        self.assertEqual(context['documents_to_sign'], [])
+        self.assertFalse(context['case_has_unsigned_docs'])
+
+    def test_case_detail_page_query_budget(self) -> None:
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(reverse('cases-detail', kwargs={'pk': self.case.pk}))
+        self.assertEqual(resp.status_code, 200)
+        self.assertLessEqual(len(queries), self.query_budget)
+
+
+class CaseSummaryTests(TestCase):
+    def setUp(self) -> None:
+        UserModel = get_user_model()
+        self.user = UserModel.objects.create_user('user@user.com', 'secret', last_name='Іванов', first_name='Іван')
+        stage = CaseStage.objects.create(title='Підготовка', number=2)
+        self.stage_step = CaseStageStep.objects.create(title='Прийнято в роботу', stage=stage, code=2000)
+
+    def test_case_summary_follows_case_changes(self) -> None:
+        with self.captureOnCommitCallbacks(execute=True):
+            case = Case.objects.create(case_number='case-1')
+        self.assertEqual(CaseSummary.objects.get(pk=case.pk).case_number, 'case-1')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            case.stage_step = self.stage_step
+            case.save()
+            CollegiumMembership.objects.create(case=case, person=self.user, is_head=True)
+
+        summary = CaseSummary.objects.get(pk=case.pk)
+        self.assertEqual(summary.stage_code, 2000)
+        self.assertEqual(summary.collegium_head_name, self.user.get_full_name)
+
+    def test_case_summary_follows_user_and_classifier_changes(self) -> None:
+        with self.captureOnCommitCallbacks(execute=True):
+            case = Case.objects.create(case_number='case-1', stage_step=self.stage_step, secretary=self.user)
+            CollegiumMembership.objects.create(case=case, person=self.user, is_head=True)
+
+        self.user.last_name = 'Нове прізвище'
+        self.user.save()
+        self.stage_step.title = 'Нова назва'
+        self.stage_step.save()
+
+        summary = CaseSummary.objects.get(pk=case.pk)
+        self.assertEqual(summary.secretary_name, self.user.get_full_name)
+        self.assertEqual(summary.collegium_head_name, self.user.get_full_name)
+        self.assertEqual(summary.stage_title, 'Нова назва')
+
+    def test_case_summary_rebuild(self) -> None:
+        Case.objects.create(case_number='case-1', stage_step=self.stage_step)
+        Case.objects.create(case_number='case-2')
+        self.assertEqual(CaseSummary.objects.count(), 0)
+
+        self.assertEqual(case_services.case_summary_rebuild(), 2)
+        self.assertEqual(
+            set(CaseSummary.objects.values_list('case_number', flat=True)),
+            {'case-1', 'case-2'}
+        )
@@ -9,6 +9,7 @@ urlpatterns = [
     path('update/<int:pk>/', views.CaseUpdateView.as_view(), name='cases_update'),
     path('upload-sign-external/<int:document_id>/', views.upload_sign_external, name='upload-sign-external'),
     path('upload-sign-internal/<int:document_id>/', views.upload_sign_internal, name='upload-sign-internal'),
+    path('upload-signs-internal/', views.upload_signs_internal, name='upload-signs-internal'),
     path('document-signs-info/<int:document_id>/', views.document_signs_info, name='document-signs-info'),
     path('document-history/<int:document_id>/', views.document_history, name='document-history'),
     path('take_to_work/<int:pk>/', views.take_to_work, name='cases_take_to_work'),
@@ -26,6 +27,7 @@ urlpatterns = [
         views.create_files_with_signs_info,
         name='cases_create_files_with_signs_info'
     ),
+    path('documents-pdf-status/', views.documents_pdf_status, name='documents_pdf_status'),
     path(
         'consider-for-acceptance/<int:pk>/',
         views.CaseConsiderForAcceptance.as_view(),
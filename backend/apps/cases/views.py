@@ -16,15 +16,16 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from django_renderpdf.views import PDFView
 
-from apps.users import services as users_services
-from apps.common.utils import files_to_base64
+from apps.common.file_spool import files_to_spool
 from apps.common.decorators import group_required
 
-from .services import case_services, document_services, sign_services, case_stage_step_change_action_service
+from .services import (case_services, document_services, sign_services, case_stage_step_change_action_service,
+                       case_detail_context_service)
 from apps.filling import services as filling_services
 from .models import Case, Document
 from .permissions import HasAccessToCase
-from .serializers import DocumentSerializer, CaseSerializer, CaseHistorySerializer
+from .pagination import CaseKeysetPagination
+from .serializers import DocumentSerializer, CaseSummarySerializer, CaseHistorySerializer
 from apps.common.mixins import LoginRequiredMixin
 from .tasks import upload_sign_external_task
 from .forms import (CaseUpdateForm, CaseCreateCollegiumForm, CaseAcceptForConsiderationForm, DocumentAddForm,
@@ -41,12 +42,22 @@ def cases_list(request):
 
 
 class CasesViewSet(viewsets.ReadOnlyModelViewSet):
-    """Возвращает JSON с документами дела."""
-    serializer_class = CaseSerializer
+    """Возвращает JSON со списком дел (по сводным данным ап. дел).
+    При параметре mode=keyset используется keyset-пагинация (параметры cursor и length)."""
+    serializer_class = CaseSummarySerializer
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.request.GET.get('mode') == 'keyset':
+                self._paginator = CaseKeysetPagination()
+            else:
+                self._paginator = super().paginator
+        return self._paginator
 
     def get_queryset(self):
-        all_cases = case_services.case_get_all_qs()
-        return case_services.case_filter_dt_list(
+        all_cases = case_services.case_summary_get_list_qs()
+        return case_services.case_summary_filter_dt_list(
             all_cases,
             self.request.user.id,
             self.request.GET.get('users'),
@@ -61,17 +72,12 @@ class CaseDetailView(LoginRequiredMixin, DetailView):
     template_name = 'cases/detail/index.html'
 
     def get_queryset(self):
-        return case_services.case_get_all_qs()
+        return case_services.case_get_qs('detail')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['stages'] = case_services.case_get_stages(self.object.pk)
-        context['claim'] = filling_services.claim_get_data_by_id(self.object.claim.pk)
-        # Документы, которые должен подписать пользователь
-        context['documents_to_sign'] = document_services.document_get_case_documents_to_sign(
-            self.object.pk, self.request.user
-        )
-        context['case_has_unsigned_docs'] = self.object.has_unsigned_docs
+        # Стадии, данные обращения, документы, которые должен подписать пользователь
+        context.update(case_detail_context_service.CaseDetailContext(self.object, self.request.user).build())
         return context
 
 
@@ -83,7 +89,10 @@ class CaseUpdateView(UpdateView):
     template_name = 'cases/update/index.html'
 
     def get_queryset(self):
-        return case_services.case_get_all_active_qs().filter(secretary=self.request.user, stage_step__code__gte=2000)
+        return case_services.case_get_qs('documents').filter(
+            secretary=self.request.user,
+            stage_step__code__gte=2000
+        ).exclude(stopped=True)
 
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
@@ -100,7 +109,7 @@ class CaseUpdateView(UpdateView):
 def take_to_work(request, pk: int):
     """Принимает дело в работу и переадресовывает на страницу деталей дела."""
     # Проверка какому стадии соответствует дело, смена стадии, выполнение сопутствующих стадии операций
-    case = case_services.case_get_one(pk)
+    case = case_services.case_get_one(pk, 'stage')
     stage_set_service = case_stage_step_change_action_service.CaseSetActualStageStepService(
         case_stage_step_change_action_service.CaseStageStepQualifier(),
         case,
@@ -116,13 +125,13 @@ def take_to_work(request, pk: int):
 @login_required
 def upload_sign_external(request, document_id: int):
     """Загружает на сервер информацию о цифровой подписи документа."""
-    files_base64 = files_to_base64(request.FILES)
+    files = files_to_spool(request.FILES)
 
     task = upload_sign_external_task.delay(
         document_id,
-        files_base64['blob'][0]['content'],
+        files['blob'][0],
         json.loads(request.POST['sign_info']),
-        users_services.certificate_get_data(request.session['cert_id']),
+        request.user.pk,
     )
     return JsonResponse(
         {
@@ -133,40 +142,11 @@ def upload_sign_external(request, document_id: int):
 
 def upload_sign_internal(request, document_id: int):
     """Загружает цифровую подпись на диск и создаёт запись в БД."""
-    document = document_services.document_get_by_id(document_id)
-    # Может ли пользователь подписывать файл
-    if document_services.document_can_be_signed_by_user(document.pk, request.user):
-        # Сохранение цифровой подписи на диск
-        relative_path = sign_services.sign_create_p7s(request.FILES['blob'], document, request.user)
-
-        # Создание записи в БД
-        sign_info = json.loads(request.POST['sign_info'])
-        sign_data = {
-            'document': document,
-            'file': str(relative_path),
-            'file_signed': document.signed_file,
-            'user': request.user,
-            'subject': sign_info['subject'],
-            'serial_number': sign_info['serial'],
-            'issuer': sign_info['issuer'],
-            'timestamp': sign_info['timestamp'],
-        }
-        sign_services.sign_update(sign_data)
-        document_services.document_add_history(
-            document.pk,
-            f"Документ підписано КЕП (підписувач: {sign_info['subject']}, {sign_info['serial']})",
-            request.user.pk
-        )
-
-        # Проверка какому стадии соответствует дело, смена стадии, выполнение сопутствующих стадии операций
-        stage_set_service = case_stage_step_change_action_service.CaseSetActualStageStepService(
-            case_stage_step_change_action_service.CaseStageStepQualifier(),
-            document.case,
-            request,
-            NotificationService([DbChannel()])
-        )
-        stage_set_service.execute()
-
+    res = sign_services.sign_upload_internal_bulk(
+        [(document_id, request.FILES['blob'], json.loads(request.POST['sign_info']))],
+        request.user
+    )[document_id]
+    if res.get('success'):
         return JsonResponse(
             {
                 "success": 1,
@@ -182,6 +162,40 @@ def upload_sign_internal(request, document_id: int):
         )
 
 
+@require_POST
+@login_required
+def upload_signs_internal(request):
+    """Загружает на диск цифровые подписи нескольких документов и создаёт записи в БД.
+    sign_info - JSON {id документа: данные подписи}, файл подписи документа - blob_<id документа>."""
+    try:
+        signs_info = json.loads(request.POST['sign_info'])
+        document_ids = [int(document_id) for document_id in signs_info]
+        if not all(
+                isinstance(sign_info, dict) and {'subject', 'serial', 'issuer', 'timestamp'} <= sign_info.keys()
+                for sign_info in signs_info.values()
+        ):
+            raise ValueError
+    except (KeyError, ValueError, TypeError, AttributeError):
+        return JsonResponse({'error': 1, 'message': 'Некоректні дані підписів.'}, status=400)
+
+    items = []
+    res = {}
+    for document_id, sign_info in zip(document_ids, signs_info.values()):
+        blob = request.FILES.get(f"blob_{document_id}")
+        if blob is None:
+            res[document_id] = {'error': 1, 'message': 'Файл з цифровим підписом не завантажено.'}
+        else:
+            items.append((document_id, blob, sign_info))
+    res.update(sign_services.sign_upload_internal_bulk(items, request.user))
+
+    return JsonResponse(
+        {
+            "success": int(all(x.get('success') for x in res.values())),
+            "documents": res,
+        }
+    )
+
+
 class DocumentsViewSet(viewsets.ReadOnlyModelViewSet):
     """Возвращает JSON с документами дела."""
     serializer_class = DocumentSerializer
@@ -226,7 +240,7 @@ class CaseCreateCollegium(UpdateView):
     template_name = 'cases/create_collegium/index.html'
 
     def get_queryset(self):
-        return case_services.case_get_all_qs().filter(secretary=self.request.user, stage_step__code=2001)
+        return case_services.case_get_qs('documents').filter(secretary=self.request.user, stage_step__code=2001)
 
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
@@ -246,7 +260,7 @@ class CaseConsiderForAcceptance(UpdateView):
 
     def get_queryset(self):
         # Функция доступна только на стадии 2003 "Розпорядження підписано. Очікує на прийняття до розгляду."
-        return case_services.case_get_all_qs().filter(
+        return case_services.case_get_qs('documents').filter(
             secretary=self.request.user,
             stage_step__code=2003,
             stopped=False,
@@ -283,7 +297,7 @@ class CasePausingView(UpdateView):
 
     def get_queryset(self):
         # Функция доступна когда сформирована коллегия
-        return case_services.case_get_all_qs().filter(
+        return case_services.case_get_qs('documents').filter(
             secretary=self.request.user,
             stage_step__code__gte=2003,
             paused=False,
@@ -311,7 +325,7 @@ class CaseStoppingView(UpdateView):
 
     def get_queryset(self):
         # Функция доступна когда сформирована коллегия
-        return case_services.case_get_all_qs().filter(
+        return case_services.case_get_qs('documents').filter(
             secretary=self.request.user,
             paused=False,
             stopped=False
@@ -361,18 +375,30 @@ def create_files_with_signs_info(request, case_id):
                 status=400
             )
 
+    # Файлы конвертируются в pdf фоновыми задачами, состояние конвертации возвращает documents_pdf_status
     return JsonResponse(
         {
-            "success": 1
+            "success": 1,
+            "documents": [document['id'] for document in documents],
         }
     )
 
 
+@login_required
+def documents_pdf_status(request):
+    """Возвращает состояние конвертации в pdf документов (GET-параметр ids - id документов через запятую)."""
+    try:
+        doc_ids = [int(x) for x in request.GET.get('ids', '').split(',') if x]
+    except ValueError:
+        raise Http404
+    return JsonResponse({'documents': document_services.document_get_pdf_statuses(doc_ids, request.user)})
+
+
 @group_required('Секретар')
 def case_create_pre_meeting_protocol(request, pk: int):
     """Создаёт документ протокола о предварительном заседании."""
     # Получение дела
-    case = case_services.case_get_all_qs().filter(
+    case = case_services.case_get_qs('permission').filter(
         secretary=request.user,
         stopped=False,
         paused=False,
@@ -405,7 +431,7 @@ class CaseMeetingView(UpdateView):
 
     def get_queryset(self):
         # Функция доступна когда сформирована коллегия
-        return case_services.case_get_all_qs().filter(
+        return case_services.case_get_qs('documents').filter(
             secretary=self.request.user,
             paused=False,
             stopped=False,
@@ -437,7 +463,7 @@ class CaseInfoPDFView(LoginRequiredMixin, PDFView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['case'] = case_services.case_get_one(kwargs['pk'])
+        context['case'] = case_services.case_get_one(kwargs['pk'], 'detail')
         context['claim'] = filling_services.claim_get_data_by_id(context['case'].claim.pk)
         context['documents'] = case_services.case_get_documents_qs(kwargs['pk'])
         return context
@@ -446,7 +472,7 @@ class CaseInfoPDFView(LoginRequiredMixin, PDFView):
 @group_required('Секретар')
 def case_publish_to_website(request, pk: int):
     """Публикует ап. дело на веб-сайте (фактически делает его доступным в API)."""
-    case = case_services.case_get_all_qs().filter(
+    case = case_services.case_get_qs('stage').filter(
         pk=pk
     ).first()
 
@@ -496,7 +522,7 @@ class DocumentAddView(LoginRequiredMixin, CreateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['case'] = case_services.case_get_all_qs().filter(
+        context['case'] = case_services.case_get_qs('permission').filter(
             secretary=self.request.user,
             stopped=False,
             pk=self.kwargs['pk']
@@ -570,12 +596,20 @@ def document_send_to_sign(request, pk: int):
     # Получение документа
     document = document_services.document_get_by_id(pk)
 
-    # Проверка, не созданы ли записи для подписи и является ли пользователь секретарём дела
-    if document.sign_set.count() or document.case.secretary_id != request.user.id:
+    # Проверка, не созданы ли записи для подписи (или не конвертируется ли документ перед передачей на подпись)
+    # и является ли пользователь секретарём дела
+    if document.sign_set.count() or document.pdf_in_progress or document.case.secretary_id != request.user.id:
         raise Http404
 
     # Создание записей для подписи
-    document_services.document_send_to_sign(document.pk, request.user.id)
+    if not document_services.document_send_to_sign(document.pk, request.user.id):
+        # Документ будет передан на подпись фоновой задачей после конвертации в pdf
+        messages.add_message(
+            request,
+            messages.INFO,
+            'Документ конвертується у pdf і буде переданий на підпис після конвертації.'
+        )
+        return redirect('cases-detail', pk=document.case.pk)
 
     # Проверка какому стадии соответствует дело, смена стадии, выполнение сопутствующих стадии операций
     stage_set_service = case_stage_step_change_action_service.CaseSetActualStageStepService(
@@ -0,0 +1,268 @@
+from docx.image.image import Image as DocxImage
+from docx.opc.constants import NAMESPACE, RELATIONSHIP_TYPE as RT
+from docx.oxml import OxmlElement, element_class_lookup
+from docx.oxml.ns import qn
+from docx.oxml.shape import CT_Inline
+from docx.shared import Cm, Length
+from lxml import etree
+
+from .docx_template import docx_normalize_paragraph
+
+from pathlib import Path, PurePosixPath
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+import re
+import shutil
+import zipfile
+
+# Размер фрагмента при потоковом чтении частей файла .docx
+CHUNK_SIZE = 1024 * 1024
+
+# Ширина текста страницы, если в документе нет параметров раздела
+DEFAULT_BLOCK_WIDTH = Cm(16.5)
+
+# Количество элементов верхнего уровня основной части документа, которые записываются за один раз
+BATCH_SIZE = 500
+
+# Части в уже сжатых форматах копируются без повторного сжатия (повторное сжатие - основные затраты копирования)
+STORED_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif')
+
+# Идентификаторы добавляемых изображений (wp:docPr) - заведомо больше идентификаторов, которые назначает Word
+SHAPE_ID_BASE = 100000
+
+_XMLNS_RE = re.compile(r' xmlns(?::([\w.-]+))?="([^"]*)"')
+
+# Функция, возвращающая элементы для добавления в конец документа (по ширине текста страницы)
+AppendCallback = Callable[[Length], Iterable[etree._Element]]
+
+
+def _rels_part_name(part_name: str) -> str:
+    """Возвращает имя части со связями части part_name (word/document.xml -> word/_rels/document.xml.rels)."""
+    path = PurePosixPath(part_name)
+    return str(path.parent / '_rels' / f"{path.name}.rels").lstrip('./')
+
+
+def _get_main_part_name(zin: zipfile.ZipFile) -> str:
+    """Возвращает имя основной части документа (обычно word/document.xml)."""
+    rels = etree.fromstring(zin.read('_rels/.rels'))
+    for rel in rels:
+        if rel.get('Type') == RT.OFFICE_DOCUMENT:
+            return rel.get('Target').lstrip('/')
+    return 'word/document.xml'
+
+
+def _strip_xmlns(declarations: str, nsmap: dict) -> str:
+    """Удаляет объявления пространств имён, уже объявленные в корневом элементе (nsmap)."""
+    return _XMLNS_RE.sub(lambda m: '' if nsmap.get(m.group(1)) == m.group(2) else m.group(0), declarations)
+
+
+class _DocxImage:
+    """Изображение, которое вставляется вместо переменной."""
+
+    def __init__(self, var: str, blob: bytes, height: Optional[Length], index: int, media_dir: PurePosixPath):
+        image = DocxImage.from_blob(blob)
+        self.var = var
+        self.blob = blob
+        self.ext = image.ext
+        self.content_type = image.content_type
+        self.cx, self.cy = image.scaled_dimensions(None, height)
+        self.rel_id = f"rIdPatch{index}"
+        self.part_name = str(media_dir / f"patch_image{index}.{image.ext}")
+        self.filename = f"image{index}.{image.ext}"
+        self.shape_id = SHAPE_ID_BASE + index
+
+    def new_run(self):
+        """Возвращает новый фрагмент текста (w:r) с изображением."""
+        r = OxmlElement('w:r')
+        r.add_drawing(CT_Inline.new_pic_inline(self.shape_id, self.rel_id, self.filename, self.cx, self.cy))
+        return r
+
+
+class DocxPatcher:
+    """Изменяет файл .docx без загрузки всего документа.
+
+    Части файла (изображения, стили и т.д.) копируются потоком без изменений. Основная часть документа
+    (word/document.xml) читается инкрементальным парсером: каждый элемент верхнего уровня (абзац, таблица)
+    после разбора изменяется, записывается в результат и удаляется из памяти.
+    Добавляемые изображения записываются отдельными частями со связями с основной частью."""
+
+    def __init__(self, data: Dict[str, str] = None, images: Dict[str, Tuple[bytes, Optional[Length]]] = None,
+                 append: AppendCallback = None):
+        self.data = {key: str(val) for key, val in (data or {}).items()}
+        self.images_data = images or {}
+        self.append = append
+        self.images: List[_DocxImage] = []
+
+    def patch(self, src: Union[str, Path], dst: Union[str, Path]) -> None:
+        with zipfile.ZipFile(src) as zin, zipfile.ZipFile(dst, 'w', zipfile.ZIP_DEFLATED) as zout:
+            names = set(zin.namelist())
+            main_part_name = _get_main_part_name(zin)
+            rels_part_name = _rels_part_name(main_part_name)
+            self._prepare_images(zin, names, main_part_name, rels_part_name)
+
+            for info in zin.infolist():
+                out_info = zipfile.ZipInfo(info.filename, info.date_time)
+                out_info.compress_type = info.compress_type
+                if info.filename.lower().endswith(STORED_EXTENSIONS):
+                    out_info.compress_type = zipfile.ZIP_STORED
+                out_info.external_attr = info.external_attr
+                if info.filename == main_part_name:
+                    with zin.open(info) as f_in, zout.open(out_info, 'w') as f_out:
+                        self._patch_document(f_in, f_out)
+                elif info.filename == rels_part_name and self.images:
+                    zout.writestr(out_info, self._patch_rels(zin.read(info)))
+                elif info.filename == '[Content_Types].xml' and self.images:
+                    zout.writestr(out_info, self._patch_content_types(zin.read(info)))
+                else:
+                    with zin.open(info) as f_in, zout.open(out_info, 'w') as f_out:
+                        shutil.copyfileobj(f_in, f_out, CHUNK_SIZE)
+
+            if self.images and rels_part_name not in names:
+                zout.writestr(rels_part_name, self._patch_rels(None))
+            for image in self.images:
+                zout.writestr(image.part_name, image.blob, zipfile.ZIP_STORED)
+
+    def _prepare_images(self, zin: zipfile.ZipFile, names: set, main_part_name: str, rels_part_name: str) -> None:
+        """Назначает добавляемым изображениям имена частей и идентификаторы связей."""
+        rel_ids = set()
+        if rels_part_name in names:
+            rel_ids = {rel.get('Id') for rel in etree.fromstring(zin.read(rels_part_name))}
+        media_dir = PurePosixPath(main_part_name).parent / 'media'
+
+        index = 0
+        for var, (blob, height) in self.images_data.items():
+            index += 1
+            image = _DocxImage(var, blob, height, index, media_dir)
+            while image.rel_id in rel_ids or image.part_name in names:
+                index += 1
+                image = _DocxImage(var, blob, height, index, media_dir)
+            self.images.append(image)
+
+    def _patch_rels(self, xml: Optional[bytes]) -> bytes:
+        rels = etree.fromstring(xml) if xml else etree.Element(
+            f"{{{NAMESPACE.OPC_RELATIONSHIPS}}}Relationships", nsmap={None: NAMESPACE.OPC_RELATIONSHIPS}
+        )
+        for image in self.images:
+            etree.SubElement(rels, f"{{{NAMESPACE.OPC_RELATIONSHIPS}}}Relationship", {
+                'Id': image.rel_id,
+                'Type': RT.IMAGE,
+                'Target': f"media/{PurePosixPath(image.part_name).name}",
+            })
+        return etree.tostring(rels, xml_declaration=True, encoding='UTF-8', standalone=True)
+
+    def _patch_content_types(self, xml: bytes) -> bytes:
+        types = etree.fromstring(xml)
+        extensions = {item.get('Extension', '').lower() for item in types}
+        for image in self.images:
+            if image.ext not in extensions:
+                etree.SubElement(types, f"{{{NAMESPACE.OPC_CONTENT_TYPES}}}Default", {
+                    'Extension': image.ext,
+                    'ContentType': image.content_type,
+                })
+                extensions.add(image.ext)
+        return etree.tostring(types, xml_declaration=True, encoding='UTF-8', standalone=True)
+
+    def _patch_paragraph(self, p) -> None:
+        """Заменяет переменные абзаца значениями и изображениями."""
+        if '{{' not in ''.join(r.text for r in p.r_lst):
+            return
+        docx_normalize_paragraph(p)
+        for r in p.r_lst:
+            text = r.text
+            if '{{' not in text:
+                continue
+            new_text = text
+            for key, val in self.data.items():
+                new_text = new_text.replace(key, val)
+            images = [image for image in self.images if image.var in new_text]
+            for image in images:
+                new_text = new_text.replace(image.var, '')
+            if new_text != text:
+                r.text = new_text
+            # Изображения вставляются сразу после фрагмента текста, в котором была переменная
+            for image in reversed(images):
+                r.addnext(image.new_run())
+
+    def _get_append_elements(self, sect_pr) -> List[etree._Element]:
+        if not self.append:
+            return []
+        width = DEFAULT_BLOCK_WIDTH
+        if sect_pr is not None and sect_pr.page_width is not None:
+            width = Length(sect_pr.page_width - (sect_pr.left_margin or 0) - (sect_pr.right_margin or 0))
+        return list(self.append(width))
+
+    def _patch_document(self, f_in, f_out) -> None:
+        """Потоково обрабатывает основную часть документа."""
+        parser = etree.XMLPullParser(events=('end',))
+        parser.set_element_class_lookup(element_class_lookup)
+        body_tag = qn('w:body')
+        sect_pr_tag = qn('w:sectPr')
+        root = body = batch = None
+        appended = False
+
+        def write(text: str) -> None:
+            f_out.write(text.encode('utf-8'))
+
+        def flush() -> None:
+            """Записывает накопленные элементы. Элементы записываются пакетом в составе элемента-контейнера
+            с пространствами имён корневого элемента, чтобы не объявлять их в каждом элементе."""
+            if len(batch):
+                xml = etree.tostring(batch, encoding='unicode')
+                write(xml[xml.index('>') + 1:xml.rindex('<')])
+                batch.clear()
+
+        def add(elem) -> None:
+            # Элемент переносится в контейнер (и удаляется из разобранного документа)
+            batch.append(elem)
+            if len(batch) >= BATCH_SIZE:
+                flush()
+
+        def start_tag(elem) -> str:
+            empty = etree.Element(elem.tag, dict(elem.attrib), nsmap=elem.nsmap)
+            return etree.tostring(empty, encoding='unicode')[:-2].rstrip() + '>'
+
+        def end_tag(elem) -> str:
+            return f"</{elem.prefix}:{etree.QName(elem).localname}>" if elem.prefix else f"</{elem.tag}>"
+
+        write('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\r\n')
+        for chunk in iter(lambda: f_in.read(CHUNK_SIZE), b''):
+            parser.feed(chunk)
+            for _, elem in parser.read_events():
+                if root is None:
+                    root = elem.getroottree().getroot()
+                    batch = etree.Element(root.tag, nsmap=root.nsmap)
+                    write(start_tag(root))
+
+                parent = elem.getparent()
+                if body is None and (elem.tag == body_tag or parent is not None and parent.tag == body_tag):
+                    flush()
+                    body = elem if elem.tag == body_tag else parent
+                    write(_strip_xmlns(start_tag(body), root.nsmap))
+
+                if elem is root:
+                    flush()
+                    write(end_tag(root))
+                elif elem is body:
+                    if not appended:
+                        for item in self._get_append_elements(None):
+                            add(item)
+                    flush()
+                    write(end_tag(body))
+                elif parent is body or parent is root:
+                    if elem.tag == sect_pr_tag and parent is body:
+                        # Добавляемые элементы размещаются перед параметрами последнего раздела документа
+                        for item in self._get_append_elements(elem):
+                            add(item)
+                        appended = True
+                    if '{{' in ''.join(elem.itertext()):
+                        for p in elem.iter(qn('w:p')):
+                            self._patch_paragraph(p)
+                    add(elem)
+        parser.close()
+
+
+def docx_patch(src: Union[str, Path], dst: Union[str, Path], data: Dict[str, str] = None,
+               images: Dict[str, Tuple[bytes, Optional[Length]]] = None, append: AppendCallback = None) -> None:
+    """Создаёт копию файла .docx src в dst, заменив переменные значениями data (ключи - переменные вместе
+    со скобками) и изображениями images (переменная -> (содержимое изображения, высота)), и добавив в конец
+    документа элементы, которые возвращает append (по ширине текста страницы)."""
+    DocxPatcher(data, images, append).patch(src, dst)
@@ -0,0 +1,123 @@
+from docx import Document as PyDocxDocument
+from docx.oxml.ns import qn
+from docx.text.paragraph import Paragraph
+
+from .utils import docx_replace_paragraph
+
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+import re
+import threading
+
+# Переменная шаблона: {{ NAME }}
+PLACEHOLDER_RE = re.compile(r'\{\{[^{}]*\}\}')
+
+
+class CompiledDocxTemplate:
+    """Скомпилированный шаблон .docx.
+
+    При компиляции шаблон разбирается один раз: переменные, разбитые Word на несколько фрагментов текста (w:r),
+    собираются в один фрагмент, запоминаются номера фрагментов с переменными и абзацы, в которых они находятся.
+    Заполнение шаблона - загрузка нормализованного файла и замена текста только в запомненных фрагментах."""
+    content: bytes
+    runs: List[int]
+    paragraphs: List[int]
+
+    def __init__(self, path: Union[str, Path]):
+        doc = PyDocxDocument(str(path))
+        body = doc.element.body
+
+        for p in body.iter(qn('w:p')):
+            docx_normalize_paragraph(p)
+
+        self.runs = [i for i, r in enumerate(body.iter(qn('w:r'))) if '{{' in r.text]
+        self.paragraphs = [i for i, p in enumerate(body.iter(qn('w:p'))) if '{{' in _paragraph_text(p)]
+
+        stream = BytesIO()
+        doc.save(stream)
+        self.content = stream.getvalue()
+
+    def render(self, data: Dict[str, str]) -> PyDocxDocument:
+        """Возвращает документ, заполненный значениями переменных (ключи data - переменные вместе со скобками)."""
+        doc = PyDocxDocument(BytesIO(self.content))
+        body = doc.element.body
+        data = {key: str(val) for key, val in data.items()}
+
+        runs = list(body.iter(qn('w:r')))
+        for i in self.runs:
+            r = runs[i]
+            text = r.text
+            new_text = text
+            for key, val in data.items():
+                if key in new_text:
+                    new_text = new_text.replace(key, val)
+            if new_text != text:
+                r.text = new_text
+
+        # Ключи, которые не совпадают с переменной целиком (например, переменная с пробелом после неё),
+        # заменяются прежним способом
+        paragraphs = list(body.iter(qn('w:p')))
+        for i in self.paragraphs:
+            p = paragraphs[i]
+            text = _paragraph_text(p)
+            rest = {key: val for key, val in data.items() if key in text}
+            if rest:
+                docx_replace_paragraph(Paragraph(p, None), rest)
+
+        return doc
+
+
+def _paragraph_text(p) -> str:
+    return ''.join(r.text for r in p.r_lst)
+
+
+def docx_normalize_paragraph(p) -> None:
+    """Переносит каждую переменную абзаца (элемент w:p) целиком во фрагмент текста, в котором она начинается."""
+    runs = p.r_lst
+    texts = [r.text for r in runs]
+    paragraph_text = ''.join(texts)
+    if '{{' not in paragraph_text:
+        return
+
+    # Номер фрагмента, которому принадлежит каждый символ текста абзаца
+    owners = [i for i, text in enumerate(texts) for _ in text]
+    for match in PLACEHOLDER_RE.finditer(paragraph_text):
+        owner = owners[match.start()]
+        for k in range(match.start(), match.end()):
+            owners[k] = owner
+
+    new_texts = [''] * len(runs)
+    for char, owner in zip(paragraph_text, owners):
+        new_texts[owner] += char
+
+    for r, text, new_text in zip(runs, texts, new_texts):
+        if text != new_text:
+            r.text = new_text
+
+
+# Скомпилированные шаблоны: путь к файлу -> (время изменения и размер файла, шаблон)
+_templates: Dict[str, Tuple[Tuple[float, int], CompiledDocxTemplate]] = {}
+_templates_lock = threading.Lock()
+
+
+def docx_template_get(path: Union[str, Path]) -> CompiledDocxTemplate:
+    """Возвращает скомпилированный шаблон .docx (компилируется повторно только при изменении файла)."""
+    path = str(path)
+    stat = Path(path).stat()
+    version = (stat.st_mtime, stat.st_size)
+
+    with _templates_lock:
+        cached = _templates.get(path)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    template = CompiledDocxTemplate(path)
+    with _templates_lock:
+        _templates[path] = (version, template)
+    return template
+
+
+def docx_template_render(path: Union[str, Path], data: Dict[str, str]) -> PyDocxDocument:
+    """Заполняет шаблон .docx значениями переменных."""
+    return docx_template_get(path).render(data)
@@ -0,0 +1,124 @@
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.utils.datastructures import MultiValueDict
+
+from .utils import base64_to_file, base64_to_temp_file
+
+from pathlib import Path
+from typing import Optional, Union
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+
+# Размер фрагмента при записи и чтении файлов спула
+CHUNK_SIZE = 1024 * 1024
+
+# Идентификатор файла в спуле (uuid4.hex): не допускает выхода за пределы каталога спула
+_SPOOL_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+class FileSpoolError(Exception):
+    """Файл отсутствует в спуле (удалён по истечении срока хранения) или повреждён."""
+
+
+def file_spool_get_dir() -> Path:
+    """Возвращает каталог спула (общий для веб-сервера и обработчиков Celery)."""
+    path = Path(getattr(settings, 'FILE_SPOOL_DIR', Path(tempfile.gettempdir()) / 'file_spool'))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _file_spool_path(spool_id: str) -> Path:
+    if not _SPOOL_ID_RE.match(spool_id or ''):
+        raise FileSpoolError(f"Invalid spool id: {spool_id!r}")
+    return file_spool_get_dir() / spool_id
+
+
+def file_spool_put(file: UploadedFile) -> dict:
+    """Записывает загруженный файл в спул по частям и возвращает ссылку на него для передачи задаче Celery:
+    {'name': имя файла, 'spool_id': идентификатор в спуле, 'size': размер, 'sha256': контрольная сумма}."""
+    spool_id = uuid.uuid4().hex
+    path = _file_spool_path(spool_id)
+    tmp_path = path.with_suffix('.tmp')
+    checksum = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, 'wb') as f:
+            for chunk in file.chunks(CHUNK_SIZE):
+                checksum.update(chunk)
+                size += len(chunk)
+                f.write(chunk)
+        # Файл появляется в спуле только целиком
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return {'name': file.name, 'spool_id': spool_id, 'size': size, 'sha256': checksum.hexdigest()}
+
+
+def files_to_spool(request_files: MultiValueDict) -> dict:
+    """Записывает request.FILES в спул. Возвращает ссылки на файлы: {поле формы: [ссылка на файл, ...]}."""
+    return {key: [file_spool_put(file) for file in request_files.getlist(key)] for key in request_files}
+
+
+def _file_spool_verify(path: Path, handle: dict) -> None:
+    checksum = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            checksum.update(chunk)
+            size += len(chunk)
+    if size != handle['size'] or checksum.hexdigest() != handle['sha256']:
+        raise FileSpoolError(f"Spool file {handle['spool_id']} is corrupted")
+
+
+def file_spool_take(handle: dict, destination: Path = None) -> Path:
+    """Забирает файл из спула по ссылке (file_spool_put): проверяет размер и контрольную сумму и перемещает файл
+    в destination (по умолчанию - во временный каталог). После этого файл в спуле недоступен."""
+    path = _file_spool_path(handle['spool_id'])
+    if not path.exists():
+        raise FileSpoolError(f"Spool file {handle['spool_id']} not found")
+    _file_spool_verify(path, handle)
+
+    if destination is None:
+        destination = Path(tempfile.gettempdir()) / handle['spool_id']
+    destination = Path(destination)
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    shutil.move(str(path), str(destination))
+    return destination
+
+
+def file_spool_receive(data: Union[dict, str], destination: Path = None) -> Path:
+    """Сохраняет переданный задаче файл в destination (по умолчанию - во временный каталог) и возвращает путь к нему.
+
+    data - ссылка на файл в спуле (file_spool_put) или содержимое файла в base64 (строка или словарь с ключом
+    content) - в таком виде файлы передавались задачам, поставленным в очередь до перехода на спул."""
+    if isinstance(data, dict) and 'spool_id' in data:
+        return file_spool_take(data, destination)
+
+    content = data['content'] if isinstance(data, dict) else data
+    if destination is None:
+        return base64_to_temp_file(content)
+    base64_to_file(content, Path(destination))
+    return Path(destination)
+
+
+def file_spool_clear(ttl: Optional[int] = None) -> int:
+    """Удаляет из спула файлы старше ttl секунд (по умолчанию FILE_SPOOL_TTL) - файлы, которые не забрали задачи.
+    Возвращает количество удалённых файлов."""
+    ttl = ttl if ttl is not None else getattr(settings, 'FILE_SPOOL_TTL', 24 * 60 * 60)
+    expires = time.time() - ttl
+    removed = 0
+    for path in file_spool_get_dir().iterdir():
+        try:
+            if path.is_file() and path.stat().st_mtime < expires:
+                path.unlink()
+                removed += 1
+        except FileNotFoundError:
+            # Файл одновременно забран задачей
+            pass
+    return removed
@@ -0,0 +1,108 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models
+from django.template.loader import render_to_string
+
+from collections import OrderedDict
+from typing import Any, Iterable, Optional
+import hashlib
+import threading
+import time
+
+
+class LRUCache:
+    """Ограниченный по количеству записей кеш в памяти процесса (вытесняются давно не использованные записи)."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+# Первый уровень кеша фрагментов - память процесса, второй - кеш Django (общий для всех процессов)
+local_cache = LRUCache(getattr(settings, 'FRAGMENT_CACHE_MAX_ENTRIES', 5000))
+# Версии фрагментов объектов, прочитанные из кеша Django: ключ версии -> (версия, время истечения)
+local_versions = LRUCache(getattr(settings, 'FRAGMENT_CACHE_MAX_ENTRIES', 5000))
+
+
+def fragment_version_key(obj: models.Model) -> str:
+    """Возвращает ключ версии фрагментов объекта в кеше Django."""
+    return f"fragment_version:{obj._meta.label_lower}:{obj.pk}"
+
+
+def fragment_get_version(obj: models.Model) -> int:
+    """Возвращает версию фрагментов объекта. Версия хранится в памяти процесса FRAGMENT_CACHE_VERSION_TTL секунд,
+    поэтому повторные отрисовки фрагмента не обращаются к кешу Django. Сохранение объекта меняет ключ фрагмента
+    сразу (через updated_at), а fragment_invalidate в других процессах учитывается не позже, чем через этот срок."""
+    key = fragment_version_key(obj)
+    now = time.monotonic()
+    item = local_versions.get(key)
+    if item is not None and item[1] > now:
+        return item[0]
+
+    version = cache.get(key, 0)
+    local_versions.set(key, (version, now + getattr(settings, 'FRAGMENT_CACHE_VERSION_TTL', 5)))
+    return version
+
+
+def fragment_get_key(template_name: str, obj: models.Model, vary: Iterable[Any] = ()) -> str:
+    """Возвращает ключ фрагмента: шаблон, объект, его версия и дата изменения,
+    а также значения, от которых зависит HTML (например, права пользователя)."""
+    updated_at = getattr(obj, 'updated_at', None)
+    raw = '|'.join([
+        template_name,
+        obj._meta.label_lower,
+        str(obj.pk),
+        str(fragment_get_version(obj)),
+        updated_at.isoformat() if updated_at else '',
+        repr(tuple(vary)),
+    ])
+    return f"fragment:{hashlib.md5(raw.encode('utf-8')).hexdigest()}"
+
+
+def fragment_render(template_name: str, obj: models.Model, context: dict, vary: Iterable[Any] = ()) -> str:
+    """Возвращает HTML шаблона для объекта, используя кеш фрагментов.
+    В vary передаются все значения (кроме полей самого объекта), от которых зависит результат."""
+    key = fragment_get_key(template_name, obj, vary)
+
+    html = local_cache.get(key)
+    if html is not None:
+        return html
+
+    html = cache.get(key)
+    if html is None:
+        html = render_to_string(template_name, context)
+        cache.set(key, html, getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 60 * 60 * 24))
+    local_cache.set(key, html)
+
+    return html
+
+
+def fragment_invalidate(obj: models.Model) -> None:
+    """Делает недействительными все фрагменты объекта (увеличивает версию фрагментов объекта)."""
+    key = fragment_version_key(obj)
+    try:
+        version = cache.incr(key)
+    except ValueError:
+        version = 1
+        cache.set(key, version, None)
+    # Текущий процесс использует новую версию сразу
+    local_versions.set(key, (version, time.monotonic() + getattr(settings, 'FRAGMENT_CACHE_VERSION_TTL', 5)))
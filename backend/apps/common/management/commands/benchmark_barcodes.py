@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+
+from barcode import Code128
+from barcode.writer import ImageWriter
+from docx import Document as PyDocxDocument
+from PIL import Image
+
+from apps.common.utils import (BARCODE_OPTIONS, generate_barcode_png, get_random_file_name, get_temp_file_path,
+                               substitute_image_docx)
+
+import os
+import random
+import time
+
+
+class Command(BaseCommand):
+    help = 'Compares barcode rendering through temporary files with in-memory rendering (with and without cache)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=100)
+
+    def _legacy(self, barcode: str) -> None:
+        """Прежний способ: изображение сохраняется во временный файл, поворачивается и читается из файла."""
+        file_path = get_temp_file_path(get_random_file_name('.jpg'))
+        with open(file_path, "wb") as f:
+            Code128(barcode, writer=ImageWriter()).write(f, options=BARCODE_OPTIONS)
+        im = Image.open(file_path)
+        im = im.rotate(90, expand=True)
+        im.save(file_path)
+        self._insert(file_path)
+        os.remove(file_path)
+
+    @staticmethod
+    def _insert(image) -> None:
+        doc = PyDocxDocument()
+        doc.add_table(rows=1, cols=1).rows[0].cells[0].paragraphs[0].text = '{{ BARCODE_IMG }}'
+        substitute_image_docx(doc, '{{ BARCODE_IMG }}', image, 6)
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        barcodes = [''.join(str(random.randint(0, 9)) for _ in range(32)) for _ in range(repeat)]
+
+        started = time.perf_counter()
+        for barcode in barcodes:
+            self._legacy(barcode)
+        legacy = (time.perf_counter() - started) / repeat
+
+        started = time.perf_counter()
+        for barcode in barcodes:
+            self._insert(generate_barcode_png(barcode))
+        in_memory = (time.perf_counter() - started) / repeat
+
+        # Повторная вставка тех же штрих-кодов (например, повторное подписание) - изображения берутся из кеша
+        started = time.perf_counter()
+        for barcode in barcodes:
+            self._insert(generate_barcode_png(barcode))
+        cached = (time.perf_counter() - started) / repeat
+
+        self.stdout.write(
+            f'temp files: {legacy * 1000:.1f} ms, in memory: {in_memory * 1000:.1f} ms, '
+            f'in memory (cached): {cached * 1000:.1f} ms'
+        )
+        self.stdout.write(self.style.SUCCESS('Finished'))
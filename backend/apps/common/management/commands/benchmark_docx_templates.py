@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from docx import Document as PyDocxDocument
+
+from apps.common.docx_template import PLACEHOLDER_RE, docx_template_get
+from apps.common.utils import docx_replace
+
+from pathlib import Path
+import time
+
+
+class Command(BaseCommand):
+    help = 'Compares docx_replace with compiled docx templates on the templates in fixtures/files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=str(Path(settings.FIXTURES_PATH) / 'files' / 'templates'))
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        for path in sorted(Path(options['path']).glob('*.docx')):
+            # Значения всех переменных шаблона
+            doc = PyDocxDocument(str(path))
+            text = '\n'.join(p.text for p in doc.paragraphs)
+            text += '\n'.join(c.text for t in doc.tables for r in t.rows for c in r.cells)
+            data = {key: f'Значення {i}' for i, key in enumerate(sorted(set(PLACEHOLDER_RE.findall(text))))}
+
+            started = time.perf_counter()
+            for _ in range(repeat):
+                docx_replace(PyDocxDocument(str(path)), data)
+            legacy = (time.perf_counter() - started) / repeat
+
+            started = time.perf_counter()
+            docx_template_get(path)
+            compile_time = time.perf_counter() - started
+
+            started = time.perf_counter()
+            for _ in range(repeat):
+                docx_template_get(path).render(data)
+            compiled = (time.perf_counter() - started) / repeat
+
+            self.stdout.write(
+                f'{path.name}: variables: {len(data)}, docx_replace: {legacy * 1000:.1f} ms, '
+                f'compiled: {compiled * 1000:.1f} ms (compilation {compile_time * 1000:.1f} ms), '
+                f'x{legacy / compiled:.1f}'
+            )
+
+        self.stdout.write(self.style.SUCCESS('Finished'))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from apps.common.office_converter import office_convert_to_pdf, office_converter_metrics
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import shutil
+import tempfile
+import time
+
+
+class Command(BaseCommand):
+    help = 'Converts a document to PDF several times with the office converter pool and prints the pool metrics'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--concurrency', type=int, default=2)
+
+    def handle(self, *args, **options):
+        src = Path(options['path'])
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # Каждая конвертация - отдельная копия файла, чтобы результаты не перезаписывали друг друга
+            files = []
+            for i in range(options['repeat']):
+                path = Path(tmp_dir) / f"{src.stem}_{i}{src.suffix}"
+                shutil.copy(src, path)
+                files.append(path)
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+                list(executor.map(office_convert_to_pdf, files))
+            elapsed = time.perf_counter() - started
+
+        self.stdout.write(f'{len(files)} documents in {elapsed:.1f} s ({len(files) / elapsed:.2f} documents/s)')
+        for key, val in office_converter_metrics().items():
+            self.stdout.write(f'{key}: {val}')
+        self.stdout.write(self.style.SUCCESS('Finished'))
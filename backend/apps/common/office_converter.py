@@ -0,0 +1,476 @@
+from django.conf import settings
+
+from pathlib import Path
+from typing import List, Optional, Union
+import atexit
+import hashlib
+import logging
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+try:
+    import uno
+    from com.sun.star.beans import PropertyValue
+except ImportError:
+    uno = None
+
+logger = logging.getLogger(__name__)
+
+
+class OfficeConverterError(Exception):
+    """Ошибка конвертации документа офисным пакетом."""
+
+
+class OfficeConverterTimeout(OfficeConverterError):
+    """Конвертация документа не завершилась за отведённое время."""
+
+
+def _property(name: str, value) -> 'PropertyValue':
+    prop = PropertyValue()
+    prop.Name = name
+    prop.Value = value
+    return prop
+
+
+class OfficeWorker:
+    """Процесс офисного пакета (LibreOffice) с собственным каталогом профиля.
+
+    Если доступен модуль uno, процесс запускается один раз и принимает документы через именованный канал,
+    поэтому запуск офисного пакета не повторяется для каждого документа. Без модуля uno каждый документ
+    конвертируется отдельным запуском с профилем работника (профили разных работников не конфликтуют)."""
+    process: Optional[subprocess.Popen] = None
+    desktop = None
+
+    def __init__(self, index: int, binary: str, profile_dir: Path, timeout: int):
+        self.index = index
+        self.binary = binary
+        self.profile_dir = profile_dir
+        self.timeout = timeout
+        self.pipe_name = f"office_converter_{os.getpid()}_{index}"
+        self.restarts = 0
+
+    def _get_args(self) -> List[str]:
+        return [
+            self.binary,
+            f"-env:UserInstallation={self.profile_dir.resolve().as_uri()}",
+            '--headless',
+            '--invisible',
+            '--nologo',
+            '--nodefault',
+            '--nolockcheck',
+            '--norestore',
+        ]
+
+    def start(self) -> None:
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        if uno is None:
+            return
+        self.process = subprocess.Popen(
+            self._get_args() + [f"--accept=pipe,name={self.pipe_name};urp;StarOffice.ComponentContext"],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        self.desktop = self._connect()
+
+    def _connect(self):
+        """Подключается к запущенному процессу (ожидает, пока процесс не начнёт принимать подключения)."""
+        local_ctx = uno.getComponentContext()
+        resolver = local_ctx.ServiceManager.createInstanceWithContext('com.sun.star.bridge.UnoUrlResolver', local_ctx)
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                ctx = resolver.resolve(f"uno:pipe,name={self.pipe_name};urp;StarOffice.ComponentContext")
+                return ctx.ServiceManager.createInstanceWithContext('com.sun.star.frame.Desktop', ctx)
+            except Exception as e:
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    raise OfficeConverterError(f"Worker {self.index}: office process is not available") from e
+                time.sleep(0.2)
+
+    def stop(self) -> None:
+        if self.desktop is not None:
+            try:
+                self.desktop.terminate()
+            except Exception:
+                pass
+            self.desktop = None
+        if self.process is not None:
+            try:
+                self.process.wait(5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+            self.process = None
+
+    def restart(self) -> None:
+        self.restarts += 1
+        self.stop()
+        self.start()
+
+    def convert_to_pdf(self, src: Path, outdir: Path) -> Path:
+        """Конвертирует файл src в PDF (outdir/<имя файла src>.pdf)."""
+        dst = outdir / f"{src.stem}.pdf"
+        if uno is None:
+            self._convert_cli(src, outdir)
+        else:
+            self._convert_uno(src, dst)
+        if not dst.exists():
+            raise OfficeConverterError(f"Worker {self.index}: {src} was not converted")
+        return dst
+
+    def _convert_cli(self, src: Path, outdir: Path) -> None:
+        try:
+            subprocess.run(
+                self._get_args() + ['--convert-to', 'pdf', '--outdir', str(outdir), str(src)],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                timeout=self.timeout,
+                check=True,
+            )
+        except subprocess.TimeoutExpired as e:
+            raise OfficeConverterTimeout(f"Worker {self.index}: conversion of {src} timed out") from e
+        except subprocess.CalledProcessError as e:
+            raise OfficeConverterError(f"Worker {self.index}: conversion of {src} failed") from e
+
+    def _convert_uno(self, src: Path, dst: Path) -> None:
+        if self.process is None or self.process.poll() is not None:
+            self.restart()
+
+        # Зависший процесс завершается по истечении времени ожидания, что прерывает вызов uno
+        expired = threading.Event()
+        process = self.process
+
+        def kill():
+            expired.set()
+            process.kill()
+
+        timer = threading.Timer(self.timeout, kill)
+        timer.start()
+        try:
+            doc = self.desktop.loadComponentFromURL(
+                uno.systemPathToFileUrl(str(src.resolve())), '_blank', 0, (_property('Hidden', True),)
+            )
+            try:
+                doc.storeToURL(
+                    uno.systemPathToFileUrl(str(dst.resolve())), (_property('FilterName', 'writer_pdf_Export'),)
+                )
+            finally:
+                doc.close(True)
+        except Exception as e:
+            if expired.is_set():
+                raise OfficeConverterTimeout(f"Worker {self.index}: conversion of {src} timed out") from e
+            raise OfficeConverterError(f"Worker {self.index}: conversion of {src} failed") from e
+        finally:
+            timer.cancel()
+
+
+class _OfficeJob:
+    """Задание на конвертацию в очереди пула."""
+
+    def __init__(self, src: Path, outdir: Path):
+        self.src = src
+        self.outdir = outdir
+        self.queued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.cancelled = False
+        self.result: Optional[Path] = None
+        self.error: Optional[Exception] = None
+
+
+class OfficeConverterPool:
+    """Пул процессов офисного пакета, получающих задания на конвертацию из общей очереди.
+    Каждый процесс обслуживается отдельным потоком; после ошибки или превышения времени процесс перезапускается."""
+
+    def __init__(self, workers: int, timeout: int, binary: str, profiles_dir: Path):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._busy = 0
+        self._stats = {
+            'completed': 0,
+            'failed': 0,
+            'timeouts': 0,
+            'wait_time': 0.0,
+            'convert_time': 0.0,
+            'convert_time_max': 0.0,
+        }
+        self.profiles_dir = profiles_dir
+        self.workers = [OfficeWorker(i, binary, profiles_dir / f"worker_{i}", timeout) for i in range(workers)]
+        self._threads = [
+            threading.Thread(target=self._run, args=(worker,), name=f"office-converter-{worker.index}", daemon=True)
+            for worker in self.workers
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _run(self, worker: OfficeWorker) -> None:
+        try:
+            worker.start()
+        except Exception:
+            # Процесс будет перезапущен при получении задания
+            logger.exception('Office converter worker %s failed to start', worker.index)
+
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            if job.cancelled:
+                continue
+
+            started = time.perf_counter()
+            with self._lock:
+                self._busy += 1
+            try:
+                job.result = worker.convert_to_pdf(job.src, job.outdir)
+            except Exception as e:
+                job.error = e
+                logger.warning('Office converter worker %s: %s, restarting', worker.index, e)
+                try:
+                    worker.restart()
+                except Exception:
+                    logger.exception('Office converter worker %s failed to restart', worker.index)
+            finally:
+                self._record(job, started)
+                job.done.set()
+
+        worker.stop()
+
+    def _record(self, job: _OfficeJob, started: float) -> None:
+        finished = time.perf_counter()
+        convert_time = finished - started
+        with self._lock:
+            self._busy -= 1
+            if job.error is None:
+                self._stats['completed'] += 1
+            else:
+                self._stats['failed'] += 1
+                if isinstance(job.error, OfficeConverterTimeout):
+                    self._stats['timeouts'] += 1
+            self._stats['wait_time'] += started - job.queued_at
+            self._stats['convert_time'] += convert_time
+            self._stats['convert_time_max'] = max(self._stats['convert_time_max'], convert_time)
+        logger.debug(
+            'Office converter: %s converted in %.2f s (waited %.2f s, queue depth %s)',
+            job.src.name, convert_time, started - job.queued_at, self._queue.qsize()
+        )
+
+    def convert_to_pdf(self, src: Path, outdir: Path, timeout: float = None) -> Path:
+        """Ставит файл в очередь на конвертацию в PDF и ожидает результат."""
+        job = _OfficeJob(src, outdir)
+        self._queue.put(job)
+        if not job.done.wait(timeout):
+            job.cancelled = True
+            raise OfficeConverterTimeout(f"{src} was not converted in {timeout} s")
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def get_metrics(self) -> dict:
+        """Возвращает метрики пула: глубину очереди, занятость, количество заданий и время ожидания/конвертации."""
+        with self._lock:
+            stats = dict(self._stats)
+            busy = self._busy
+        processed = stats['completed'] + stats['failed']
+        return {
+            'workers': len(self.workers),
+            'busy': busy,
+            'queue_depth': self._queue.qsize(),
+            'completed': stats['completed'],
+            'failed': stats['failed'],
+            'timeouts': stats['timeouts'],
+            'restarts': sum(worker.restarts for worker in self.workers),
+            'wait_time_avg': stats['wait_time'] / processed if processed else 0,
+            'convert_time_avg': stats['convert_time'] / processed if processed else 0,
+            'convert_time_max': stats['convert_time_max'],
+        }
+
+    def shutdown(self) -> None:
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        shutil.rmtree(self.profiles_dir, ignore_errors=True)
+
+
+class OfficeConversionCache:
+    """Кеш результатов конвертации на диске. Ключ - хеш содержимого исходного файла и версии офисного пакета,
+    поэтому повторная конвертация того же файла заменяется ссылкой на файл кеша (или его копированием).
+    Размер каталога кеша ограничен: при превышении удаляются давно не использованные файлы."""
+
+    def __init__(self, path: Path, max_size: int, version: str):
+        self.path = path
+        self.max_size = max_size
+        self.version = version
+        self._lock = threading.Lock()
+        self._size: Optional[int] = None
+        self._stats = {'hits': 0, 'misses': 0, 'stored': 0, 'evicted': 0}
+
+    def get_key(self, src: Path) -> str:
+        digest = hashlib.sha256()
+        with open(src, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        digest.update(f"|{self.version}|pdf".encode('utf-8'))
+        return digest.hexdigest()
+
+    def _get_path(self, key: str) -> Path:
+        return self.path / key[:2] / f"{key}.pdf"
+
+    def fetch(self, key: str, dst: Path) -> bool:
+        """Создаёт файл dst из кеша. Возвращает False, если результата конвертации нет в кеше."""
+        cached_path = self._get_path(key)
+        try:
+            # Время изменения файла кеша - время последнего использования (для вытеснения)
+            os.utime(cached_path)
+            dst.unlink(missing_ok=True)
+            try:
+                os.link(cached_path, dst)
+            except OSError:
+                shutil.copyfile(cached_path, dst)
+        except FileNotFoundError:
+            self._count('misses')
+            return False
+        self._count('hits')
+        return True
+
+    def store(self, key: str, src: Path) -> None:
+        """Сохраняет результат конвертации в кеш."""
+        cached_path = self._get_path(key)
+        cached_path.parent.mkdir(parents=True, exist_ok=True)
+        # Запись во временный файл и переименование: другие процессы не получат недописанный файл
+        tmp_path = cached_path.parent / f"{key}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(src, tmp_path)
+        tmp_path.replace(cached_path)
+
+        with self._lock:
+            self._stats['stored'] += 1
+            if self._size is not None:
+                self._size += cached_path.stat().st_size
+            if self._size is None or self._size > self.max_size:
+                self._evict()
+
+    def _evict(self) -> None:
+        """Удаляет давно не использованные файлы, пока размер кеша превышает max_size."""
+        files = []
+        for path in self.path.glob('*/*.pdf'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        self._size = sum(size for _, size, _ in files)
+
+        for _, size, path in sorted(files):
+            if self._size <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            self._size -= size
+            self._stats['evicted'] += 1
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def get_metrics(self) -> dict:
+        """Возвращает метрики кеша: попадания, промахи, долю попаданий, сохранённые и вытесненные файлы."""
+        with self._lock:
+            stats = dict(self._stats)
+        requests = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / requests if requests else 0
+        stats['size'] = self._size
+        return stats
+
+
+def office_converter_get_version(binary: str) -> str:
+    """Возвращает версию офисного пакета (входит в ключ кеша, чтобы после обновления файлы конвертировались заново)."""
+    try:
+        res = subprocess.run([binary, '--version'], capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.TimeoutExpired):
+        return binary
+    return res.stdout.strip() or binary
+
+
+# Пул создаётся при первой конвертации (отдельно в каждом процессе веб-сервера и Celery)
+_pool: Optional[OfficeConverterPool] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+_cache: Optional[OfficeConversionCache] = None
+_cache_lock = threading.Lock()
+
+
+def office_converter_get_pool() -> OfficeConverterPool:
+    global _pool, _pool_pid
+
+    with _pool_lock:
+        # Потоки пула не наследуются дочерними процессами (fork), поэтому в новом процессе создаётся новый пул
+        if _pool is None or _pool_pid != os.getpid():
+            profiles_dir = getattr(settings, 'OFFICE_CONVERTER_PROFILES_DIR', None) or tempfile.gettempdir()
+            _pool = OfficeConverterPool(
+                workers=getattr(settings, 'OFFICE_CONVERTER_WORKERS', 2),
+                timeout=getattr(settings, 'OFFICE_CONVERTER_TIMEOUT', 120),
+                binary=getattr(settings, 'OFFICE_CONVERTER_BINARY', 'libreoffice'),
+                profiles_dir=Path(profiles_dir) / f"office_converter_{os.getpid()}",
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def office_converter_shutdown() -> None:
+    """Останавливает процессы офисного пакета текущего процесса."""
+    global _pool
+
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown()
+        _pool = None
+
+
+atexit.register(office_converter_shutdown)
+
+
+def office_converter_get_cache() -> Optional[OfficeConversionCache]:
+    """Возвращает кеш результатов конвертации (None, если каталог кеша не задан в настройках)."""
+    global _cache
+
+    path = getattr(settings, 'OFFICE_CONVERTER_CACHE_DIR', None)
+    if not path:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = OfficeConversionCache(
+                Path(path),
+                getattr(settings, 'OFFICE_CONVERTER_CACHE_MAX_SIZE', 1024 * 1024 * 1024),
+                office_converter_get_version(getattr(settings, 'OFFICE_CONVERTER_BINARY', 'libreoffice')),
+            )
+        return _cache
+
+
+def office_convert_to_pdf(src: Union[str, Path], outdir: Union[str, Path] = None, timeout: float = None) -> Path:
+    """Конвертирует файл в PDF с помощью пула процессов офисного пакета (или берёт результат из кеша).
+    Результат - файл <имя файла src>.pdf в каталоге outdir (по умолчанию - в каталоге файла src)."""
+    src = Path(src)
+    outdir = Path(outdir) if outdir else src.parent
+
+    cache = office_converter_get_cache()
+    if cache is None:
+        return office_converter_get_pool().convert_to_pdf(src, outdir, timeout)
+
+    key = cache.get_key(src)
+    dst = outdir / f"{src.stem}.pdf"
+    if cache.fetch(key, dst):
+        return dst
+    dst = office_converter_get_pool().convert_to_pdf(src, outdir, timeout)
+    cache.store(key, dst)
+    return dst
+
+
+def office_converter_metrics() -> dict:
+    """Возвращает метрики пула процессов офисного пакета и кеша конвертации текущего процесса."""
+    metrics = office_converter_get_pool().get_metrics()
+    cache = office_converter_get_cache()
+    if cache is not None:
+        metrics['cache'] = cache.get_metrics()
+    return metrics
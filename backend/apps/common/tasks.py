@@ -0,0 +1,8 @@
+from core.celery import app
+from .file_spool import file_spool_clear
+
+
+@app.task
+def clear_file_spool_task(ttl: int = None) -> int:
+    """Удаляет из спула файлы, которые не забрали задачи за время хранения (FILE_SPOOL_TTL)."""
+    return file_spool_clear(ttl)
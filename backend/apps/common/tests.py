@@ -1,3 +1,266 @@
-from django.test import TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
 
-# Create your tests here.
+from docx import Document as PyDocxDocument
+
+from apps.cases.models import Case
+from apps.common.docx_patcher import docx_patch
+from apps.common.docx_template import PLACEHOLDER_RE, docx_template_get
+from apps.common.file_spool import (FileSpoolError, file_spool_clear, file_spool_get_dir, file_spool_put,
+                                    file_spool_receive)
+from apps.common.fragment_cache import LRUCache, fragment_get_key, fragment_invalidate, fragment_render
+from apps.common.utils import docx_set_font, generate_barcode_png, substitute_image_docx
+from apps.common.office_converter import (OfficeConversionCache, OfficeConverterError, OfficeConverterPool,
+                                          OfficeWorker)
+
+from docx.oxml import OxmlElement
+from docx.shared import Cm, Pt
+from docx.text.paragraph import Paragraph
+
+from pathlib import Path
+from unittest import mock
+import base64
+import os
+import tempfile
+import time
+import zipfile
+
+
+class LRUCacheTests(TestCase):
+    def test_least_recently_used_entry_is_evicted(self) -> None:
+        lru = LRUCache(2)
+        lru.set('a', '1')
+        lru.set('b', '2')
+        lru.get('a')
+        lru.set('c', '3')
+        self.assertEqual(lru.get('a'), '1')
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(lru.get('c'), '3')
+
+
+class FragmentCacheTests(TestCase):
+    template_name = 'cases/_partials/case_number_link.html'
+
+    def setUp(self) -> None:
+        self.case = Case.objects.create(case_number='case-1')
+
+    def test_fragment_key_changes_on_save(self) -> None:
+        key = fragment_get_key(self.template_name, self.case)
+        self.assertEqual(key, fragment_get_key(self.template_name, self.case))
+        self.case.save()
+        self.assertNotEqual(key, fragment_get_key(self.template_name, self.case))
+
+    def test_fragment_key_changes_on_invalidate_and_vary(self) -> None:
+        key = fragment_get_key(self.template_name, self.case)
+        self.assertNotEqual(key, fragment_get_key(self.template_name, self.case, vary=(True,)))
+        fragment_invalidate(self.case)
+        self.assertNotEqual(key, fragment_get_key(self.template_name, self.case))
+
+    def test_fragment_render(self) -> None:
+        html = fragment_render(self.template_name, self.case, {'case': self.case})
+        self.assertIn('case-1', html)
+        self.assertEqual(html, fragment_render(self.template_name, self.case, {'case': self.case}))
+
+    def test_repeat_render_does_not_read_shared_cache(self) -> None:
+        fragment_render(self.template_name, self.case, {'case': self.case})
+        with mock.patch('apps.common.fragment_cache.cache') as shared_cache:
+            fragment_render(self.template_name, self.case, {'case': self.case})
+        shared_cache.get.assert_not_called()
+
+
+class DocxTemplateTests(TestCase):
+    templates_path = Path(__file__).resolve().parents[3] / 'fixtures' / 'files' / 'templates'
+
+    def test_render_replaces_all_variables(self) -> None:
+        for path in self.templates_path.glob('*.docx'):
+            with self.subTest(template=path.name):
+                template = docx_template_get(path)
+                self.assertIs(template, docx_template_get(path))
+
+                doc = PyDocxDocument(str(path))
+                text = '\n'.join(p.text for p in doc.paragraphs)
+                text += '\n'.join(c.text for t in doc.tables for r in t.rows for c in r.cells)
+                data = {key: f'Значення {i}' for i, key in enumerate(set(PLACEHOLDER_RE.findall(text)))}
+
+                rendered = template.render(data)
+                rendered_text = '\n'.join(p.text for p in rendered.paragraphs)
+                rendered_text += '\n'.join(c.text for t in rendered.tables for r in t.rows for c in r.cells)
+                self.assertNotIn('{{', rendered_text)
+                for val in data.values():
+                    self.assertIn(val, rendered_text)
+
+
+class DocxSetFontTests(TestCase):
+    def test_font_is_set_by_styles(self) -> None:
+        doc = PyDocxDocument()
+        doc.add_paragraph('Заголовок', style='Heading 1')
+        run = doc.add_paragraph().add_run('Текст')
+        run.font.name = 'Arial'
+        run.font.size = Pt(20)
+
+        docx_set_font(doc, 'Times New Roman', Pt(12))
+
+        normal = doc.styles['Normal']
+        self.assertEqual((normal.font.name, normal.font.size), ('Times New Roman', Pt(12)))
+        self.assertEqual({p.style.name for p in doc.paragraphs}, {'Normal'})
+        self.assertEqual({(r.font.name, r.font.size) for p in doc.paragraphs for r in p.runs}, {(None, None)})
+
+
+class OfficeConverterPoolTests(TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.pool = OfficeConverterPool(workers=2, timeout=5, binary='libreoffice', profiles_dir=self.tmp_dir)
+
+    def tearDown(self) -> None:
+        self.pool.shutdown()
+
+    def test_failed_worker_is_restarted(self) -> None:
+        def convert_to_pdf(worker, src, outdir):
+            if src.name == 'broken.docx':
+                raise OfficeConverterError('broken')
+            return outdir / f"{src.stem}.pdf"
+
+        with mock.patch.object(OfficeWorker, 'convert_to_pdf', autospec=True, side_effect=convert_to_pdf):
+            self.assertEqual(
+                self.pool.convert_to_pdf(Path('doc.docx'), self.tmp_dir), self.tmp_dir / 'doc.pdf'
+            )
+            with self.assertRaises(OfficeConverterError):
+                self.pool.convert_to_pdf(Path('broken.docx'), self.tmp_dir)
+
+        metrics = self.pool.get_metrics()
+        self.assertEqual(metrics['completed'], 1)
+        self.assertEqual(metrics['failed'], 1)
+        self.assertEqual(metrics['restarts'], 1)
+        self.assertEqual(metrics['queue_depth'], 0)
+        # Каждый процесс использует собственный каталог профиля
+        self.assertEqual(len({worker.profile_dir for worker in self.pool.workers}), 2)
+
+
+class OfficeConversionCacheTests(TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.cache = OfficeConversionCache(self.tmp_dir / 'cache', max_size=25, version='7.3')
+
+    def convert(self, name: str, content: bytes) -> bool:
+        """Имитирует конвертацию с кешем; возвращает True, если результат взят из кеша."""
+        src = self.tmp_dir / f"{name}.docx"
+        src.write_bytes(content)
+        key = self.cache.get_key(src)
+        dst = self.tmp_dir / f"{name}.pdf"
+        if self.cache.fetch(key, dst):
+            return True
+        dst.write_bytes(b'%PDF ' + content)
+        self.cache.store(key, dst)
+        return False
+
+    def test_repeat_conversion_is_served_from_cache(self) -> None:
+        self.assertFalse(self.convert('a', b'doc-a'))
+        # Имя файла не входит в ключ кеша, только содержимое
+        self.assertTrue(self.convert('b', b'doc-a'))
+        self.assertEqual((self.tmp_dir / 'b.pdf').read_bytes(), b'%PDF doc-a')
+        self.assertNotEqual(
+            self.cache.get_key(self.tmp_dir / 'a.docx'),
+            OfficeConversionCache(self.cache.path, 25, '7.4').get_key(self.tmp_dir / 'a.docx')
+        )
+        metrics = self.cache.get_metrics()
+        self.assertEqual((metrics['hits'], metrics['misses']), (1, 1))
+        self.assertEqual(metrics['hit_ratio'], 0.5)
+
+    def test_cache_size_is_bounded(self) -> None:
+        for i in range(3):
+            self.convert(f"doc{i}", f"doc-{i}".encode())
+        self.assertLessEqual(self.cache.get_metrics()['size'], 25)
+        self.assertEqual(self.cache.get_metrics()['evicted'], 1)
+
+
+class BarcodeTests(TestCase):
+    def test_barcode_is_inserted_without_temp_files(self) -> None:
+        tmp_dir = tempfile.mkdtemp()
+        doc = PyDocxDocument()
+        doc.add_table(rows=1, cols=1).rows[0].cells[0].paragraphs[0].text = 'Штрихкод: {{ BARCODE_IMG }}'
+
+        with mock.patch.object(tempfile, 'tempdir', tmp_dir):
+            png = generate_barcode_png('12345678901234567890123456789012')
+            substitute_image_docx(doc, '{{ BARCODE_IMG }}', png, 6)
+
+        self.assertEqual(os.listdir(tmp_dir), [])
+        self.assertEqual(len(doc.inline_shapes), 1)
+        # Изображение повёрнуто (вертикальный штрих-код) и закешировано
+        self.assertGreater(doc.inline_shapes[0].height, doc.inline_shapes[0].width)
+        self.assertIs(png, generate_barcode_png('12345678901234567890123456789012'))
+
+
+class DocxPatcherTests(TestCase):
+    def test_patch(self) -> None:
+        tmp_dir = Path(tempfile.mkdtemp())
+        src = tmp_dir / 'src.docx'
+        doc = PyDocxDocument()
+        paragraph = doc.add_paragraph()
+        paragraph.add_run('Номер: {{ DOC_')
+        paragraph.add_run('REG_NUM }}').bold = True
+        doc.add_table(rows=1, cols=1).rows[0].cells[0].paragraphs[0].text = '{{ BARCODE_IMG }}'
+        doc.save(str(src))
+
+        def append(width):
+            p = OxmlElement('w:p')
+            Paragraph(p, None).add_run('Підписали:')
+            return [p]
+
+        dst = tmp_dir / 'dst.docx'
+        docx_patch(
+            src,
+            dst,
+            {'{{ DOC_REG_NUM }}': 'Вих-12345/2022'},
+            {'{{ BARCODE_IMG }}': (generate_barcode_png('12345678901234567890123456789012'), Cm(6))},
+            append
+        )
+
+        result = PyDocxDocument(str(dst))
+        self.assertEqual(result.paragraphs[0].text, 'Номер: Вих-12345/2022')
+        self.assertEqual(result.paragraphs[-1].text, 'Підписали:')
+        self.assertEqual(len(result.inline_shapes), 1)
+        self.assertEqual(round(result.inline_shapes[0].height.cm), 6)
+        # Части, которые не изменялись, скопированы без изменений
+        with zipfile.ZipFile(src) as zin, zipfile.ZipFile(dst) as zout:
+            self.assertEqual(zin.read('word/styles.xml'), zout.read('word/styles.xml'))
+
+
+class FileSpoolTests(TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        settings_override = override_settings(FILE_SPOOL_DIR=self.tmp_dir / 'spool', FILE_SPOOL_TTL=60)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_file_is_passed_by_reference(self) -> None:
+        handle = file_spool_put(SimpleUploadedFile('claim.docx', b'content'))
+        self.assertEqual(handle['name'], 'claim.docx')
+        self.assertNotIn('content', handle)
+
+        path = file_spool_receive(handle, self.tmp_dir / 'dst' / 'claim.docx')
+        self.assertEqual(path.read_bytes(), b'content')
+        self.assertEqual(list(file_spool_get_dir().iterdir()), [])
+        with self.assertRaises(FileSpoolError):
+            file_spool_receive(handle)
+
+    def test_corrupted_file_is_rejected(self) -> None:
+        handle = file_spool_put(SimpleUploadedFile('claim.docx', b'content'))
+        (file_spool_get_dir() / handle['spool_id']).write_bytes(b'c0ntent')
+        with self.assertRaises(FileSpoolError):
+            file_spool_receive(handle)
+        with self.assertRaises(FileSpoolError):
+            file_spool_receive(dict(handle, spool_id='../../etc/passwd'))
+
+    def test_base64_content_is_accepted(self) -> None:
+        content = base64.b64encode(b'content').decode()
+        self.assertEqual(file_spool_receive({'name': 'claim.docx', 'content': content}).read_bytes(), b'content')
+        self.assertEqual(file_spool_receive(content, self.tmp_dir / 'sign.p7s').read_bytes(), b'content')
+
+    def test_clear(self) -> None:
+        old = file_spool_put(SimpleUploadedFile('old.docx', b'old'))
+        new = file_spool_put(SimpleUploadedFile('new.docx', b'new'))
+        expired = time.time() - 120
+        os.utime(file_spool_get_dir() / old['spool_id'], (expired, expired))
+
+        self.assertEqual(file_spool_clear(), 1)
+        self.assertEqual([x.name for x in file_spool_get_dir().iterdir()], [new['spool_id']])
@@ -1,11 +1,14 @@
-from django.utils.datastructures import MultiValueDict
-
 from barcode import Code128
 from barcode.writer import ImageWriter
-from PIL import Image
-from docx.shared import Cm
+from docx.enum.style import WD_STYLE_TYPE
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from docx.shared import Cm, Length
 
+from io import BytesIO
 from pathlib import Path
+from typing import Union
+import functools
 import uuid
 import tempfile
 import base64
@@ -20,86 +23,92 @@ def docx_replace(doc, data: dict):
                 for paragraph in cell.paragraphs:
                     paragraphs.append(paragraph)
     for p in paragraphs:
-        for key_name, val in data.items():
-            if key_name in p.text:
-                inline = p.runs
-                # Replace strings and retain the same style.
-                # The text to be replaced can be split over several runs so
-                # search through, identify which runs need to have text replaced
-                # then replace the text in those identified
-                started = False
-                key_index = 0
-                # found_runs is a list of (inline index, index of match, length of match)
-                found_runs = list()
-                found_all = False
-                replace_done = False
-                for i in range(len(inline)):
-
-                    # case 1: found in single run so short circuit the replace
-                    if key_name in inline[i].text and not started:
-                        found_runs.append((i, inline[i].text.find(key_name), len(key_name)))
-                        text = inline[i].text.replace(key_name, str(val))
-                        inline[i].text = text
-                        replace_done = True
+        docx_replace_paragraph(p, data)
+
+
+def docx_replace_paragraph(p, data: dict):
+    """Заменяет переменные в абзаце файла .docx"""
+    for key_name, val in data.items():
+        if key_name in p.text:
+            inline = p.runs
+            # Replace strings and retain the same style.
+            # The text to be replaced can be split over several runs so
+            # search through, identify which runs need to have text replaced
+            # then replace the text in those identified
+            started = False
+            key_index = 0
+            # found_runs is a list of (inline index, index of match, length of match)
+            found_runs = list()
+            found_all = False
+            replace_done = False
+            for i in range(len(inline)):
+
+                # case 1: found in single run so short circuit the replace
+                if key_name in inline[i].text and not started:
+                    found_runs.append((i, inline[i].text.find(key_name), len(key_name)))
+                    text = inline[i].text.replace(key_name, str(val))
+                    inline[i].text = text
+                    replace_done = True
+                    found_all = True
+                    break
+
+                if key_name[key_index] not in inline[i].text and not started:
+                    # keep looking ...
+                    continue
+
+                # case 2: search for partial text, find first run
+                if key_name[key_index] in inline[i].text and inline[i].text[-1] in key_name and not started:
+                    # check sequence
+                    start_index = inline[i].text.find(key_name[key_index])
+                    check_length = len(inline[i].text)
+                    for text_index in range(start_index, check_length):
+                        if inline[i].text[text_index] != key_name[key_index]:
+                            # no match so must be false positive
+                            break
+                    if key_index == 0:
+                        started = True
+                    chars_found = check_length - start_index
+                    key_index += chars_found
+                    found_runs.append((i, start_index, chars_found))
+                    if key_index != len(key_name):
+                        continue
+                    else:
+                        # found all chars in key_name
                         found_all = True
                         break
 
-                    if key_name[key_index] not in inline[i].text and not started:
-                        # keep looking ...
-                        continue
-
-                    # case 2: search for partial text, find first run
-                    if key_name[key_index] in inline[i].text and inline[i].text[-1] in key_name and not started:
-                        # check sequence
-                        start_index = inline[i].text.find(key_name[key_index])
-                        check_length = len(inline[i].text)
-                        for text_index in range(start_index, check_length):
-                            if inline[i].text[text_index] != key_name[key_index]:
-                                # no match so must be false positive
-                                break
-                        if key_index == 0:
-                            started = True
-                        chars_found = check_length - start_index
-                        key_index += chars_found
-                        found_runs.append((i, start_index, chars_found))
-                        if key_index != len(key_name):
-                            continue
+                # case 2: search for partial text, find subsequent run
+                if key_name[key_index] in inline[i].text and started and not found_all:
+                    # check sequence
+                    chars_found = 0
+                    check_length = len(inline[i].text)
+                    for text_index in range(0, check_length):
+                        if inline[i].text[text_index] == key_name[key_index]:
+                            key_index += 1
+                            chars_found += 1
                         else:
-                            # found all chars in key_name
-                            found_all = True
-                            break
-
-                    # case 2: search for partial text, find subsequent run
-                    if key_name[key_index] in inline[i].text and started and not found_all:
-                        # check sequence
-                        chars_found = 0
-                        check_length = len(inline[i].text)
-                        for text_index in range(0, check_length):
-                            if inline[i].text[text_index] == key_name[key_index]:
-                                key_index += 1
-                                chars_found += 1
-                            else:
-                                break
-                        # no match so must be end
-                        found_runs.append((i, 0, chars_found))
-                        if key_index == len(key_name):
-                            found_all = True
                             break
+                    # no match so must be end
+                    found_runs.append((i, 0, chars_found))
+                    if key_index == len(key_name):
+                        found_all = True
+                        break
 
-                if found_all and not replace_done:
-                    for i, item in enumerate(found_runs):
-                        index, start, length = [t for t in item]
-                        if i == 0:
-                            text = inline[index].text.replace(inline[index].text[start:start + length], str(val))
-                            inline[index].text = text
-                        else:
-                            text = inline[index].text.replace(inline[index].text[start:start + length], '')
-                            inline[index].text = text
-                # print(p.text)
-
-
-def substitute_image_docx(doc, image_var: str, image_path: Path, height: int = None) -> None:
-    """Заменяет текст на изображение в файле .docx"""
+            if found_all and not replace_done:
+                for i, item in enumerate(found_runs):
+                    index, start, length = [t for t in item]
+                    if i == 0:
+                        text = inline[index].text.replace(inline[index].text[start:start + length], str(val))
+                        inline[index].text = text
+                    else:
+                        text = inline[index].text.replace(inline[index].text[start:start + length], '')
+                        inline[index].text = text
+            # print(p.text)
+
+
+def substitute_image_docx(doc, image_var: str, image: Union[Path, bytes], height: int = None) -> None:
+    """Заменяет текст на изображение в файле .docx (image - путь к файлу изображения или его содержимое)."""
+    image = BytesIO(image) if isinstance(image, bytes) else str(image)
     for table in doc.tables:
         for row in table.rows:
             for cell in row.cells:
@@ -109,9 +118,46 @@ def substitute_image_docx(doc, image_var: str, image_path: Path, height: int = N
                         # --- then append a run containing the image ---
                         run = paragraph.add_run()
                         if height:
-                            run.add_picture(str(image_path), height=Cm(6))
+                            run.add_picture(image, height=Cm(height))
                         else:
-                            run.add_picture(str(image_path))
+                            run.add_picture(image)
+
+
+def _set_rpr_font(rpr, font_name: str, size: Length) -> None:
+    """Задаёт шрифт и размер в свойствах текста (элемент w:rPr) вместо прежних, в т.ч. шрифтов темы."""
+    rpr._remove_rFonts()
+    rpr._remove_sz()
+    rfonts = rpr._add_rFonts()
+    rfonts.set(qn('w:ascii'), font_name)
+    rfonts.set(qn('w:hAnsi'), font_name)
+    rpr.sz_val = size
+
+
+def docx_set_font(doc, font_name: str, size: Length) -> None:
+    """Устанавливает шрифт всего документа .docx на уровне стилей: в свойствах по умолчанию и в стиле абзаца
+    по умолчанию (Normal). У абзацев основного текста удаляются стиль абзаца, шрифт и размер, заданные явно,
+    поэтому они наследуют шрифт из стиля. Фрагменты текста по отдельности не обрабатываются."""
+    styles = doc.styles.element
+    doc_defaults = styles.find(qn('w:docDefaults'))
+    if doc_defaults is None:
+        doc_defaults = OxmlElement('w:docDefaults')
+        styles.insert(0, doc_defaults)
+    rpr_default = doc_defaults.find(qn('w:rPrDefault'))
+    if rpr_default is None:
+        rpr_default = OxmlElement('w:rPrDefault')
+        doc_defaults.insert(0, rpr_default)
+    rpr = rpr_default.find(qn('w:rPr'))
+    if rpr is None:
+        rpr = OxmlElement('w:rPr')
+        rpr_default.append(rpr)
+    _set_rpr_font(rpr, font_name, size)
+
+    style = doc.styles.default(WD_STYLE_TYPE.PARAGRAPH)
+    if style is not None:
+        _set_rpr_font(style.element.get_or_add_rPr(), font_name, size)
+
+    for el in doc.element.body.xpath('./w:p/w:pPr/w:pStyle | ./w:p/w:r/w:rPr/w:rFonts | ./w:p/w:r/w:rPr/w:sz'):
+        el.getparent().remove(el)
 
 
 def qdict_to_dict(qdict):
@@ -124,21 +170,6 @@ def qdict_to_dict(qdict):
     return {k: v[0] if len(v) == 1 else v for k, v in qdict.lists()}
 
 
-def files_to_base64(request_files: MultiValueDict) -> dict:
-    """Конвертирует request.FILES в строки base64"""
-    res = {}
-    for key in request_files:
-        res[key] = []
-        files = request_files.getlist(key)
-        for file in files:
-            f = file.file
-            file_bytes = f.read()
-            file_bytes_base64 = base64.b64encode(file_bytes)
-            file_bytes_base64_str = file_bytes_base64.decode('utf-8')  # this is a str
-            res[key].append({'name': file.name, 'content': file_bytes_base64_str})
-    return res
-
-
 def base64_to_temp_file(base64_str: str) -> Path:
     """Сохраняет файл (строка base64) во временный каталог."""
     file_bytes_base64 = base64_str.encode('utf-8')
@@ -180,23 +211,23 @@ def first_lower(s):
     return s[0].lower() + s[1:]
 
 
-def generate_barcode_img(barcode: str, rotate_to: int = 90) -> Path:
-    """Генерирует изображение штрих-кода и сохраняет его во временный каталог."""
-    file_path = get_temp_file_path(get_random_file_name('.jpg'))
-    with open(file_path, "wb") as f:
-        Code128(
-            barcode,
-            writer=ImageWriter()
-        ).write(
-            f,
-            options={"font_size": 5, "text_distance": 1.7, "module_height": 8}
-        )
+# Параметры изображения штрих-кода документа
+BARCODE_OPTIONS = {"font_size": 5, "text_distance": 1.7, "module_height": 8}
 
+
+@functools.lru_cache(maxsize=256)
+def _generate_barcode_png(barcode: str, rotate_to: int, options: tuple) -> bytes:
+    image = Code128(barcode, writer=ImageWriter()).render(dict(options))
     # Поворот изображения
     if rotate_to:
-        im = Image.open(file_path)
-        im = im.rotate(rotate_to, expand=True)
-        im.show()
-        im.save(file_path)
+        image = image.rotate(rotate_to, expand=True)
+    stream = BytesIO()
+    image.save(stream, format='PNG')
+    return stream.getvalue()
+
 
-    return file_path
+def generate_barcode_png(barcode: str, rotate_to: int = 90, options: dict = None) -> bytes:
+    """Генерирует изображение штрих-кода в формате PNG в памяти (без временных файлов).
+    Изображения кешируются по значению штрих-кода и параметрам изображения."""
+    options = BARCODE_OPTIONS if options is None else options
+    return _generate_barcode_png(barcode, rotate_to, tuple(sorted(options.items())))
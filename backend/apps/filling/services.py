@@ -4,6 +4,7 @@ from django.http.request import QueryDict
 from django.db.models import Prefetch, Count, Q
 from django.db.models.query import QuerySet
 from django.conf import settings
+from django.core.files.base import ContentFile
 
 from elasticsearch import Elasticsearch
 from elasticsearch_dsl import Search, Q as Q_Es
@@ -16,9 +17,12 @@ from apps.classifiers.models import DocumentType, ClaimPersonType
 from apps.cases.models import Document, Sign
 from apps.cases.services import document_services
 from .models import ClaimField, Claim, Appellant, Person
-from apps.common.utils import docx_replace, base64_to_temp_file, get_random_file_name, get_temp_file_path
+from apps.common.file_spool import file_spool_receive
+from apps.common.utils import docx_set_font, get_random_file_name
+from apps.common.docx_template import docx_template_render
 
 from typing import List, Type, Union, Iterable
+from io import BytesIO
 from pathlib import Path
 from distutils.dir_util import copy_tree
 import json
@@ -79,7 +83,7 @@ def claim_create(post_data: QueryDict, files_data: dict, user: UserModel, intern
                 file_data = files_data[field.input_id][0]
 
                 # Сохранение файла во временный каталог
-                tmp_file_path = base64_to_temp_file(file_data['content'])
+                tmp_file_path = file_spool_receive(file_data)
 
                 # Сохранение файла в постоянный каталог и в БД
                 doc.assign_file(tmp_file_path, file_data['name'])
@@ -106,7 +110,7 @@ def claim_create(post_data: QueryDict, files_data: dict, user: UserModel, intern
                     document_services.document_add_history(doc.pk, 'Документ додано у систему', user.pk)
 
                     # Сохранение файла во временный каталог
-                    tmp_file_path = base64_to_temp_file(file_data['content'])
+                    tmp_file_path = file_spool_receive(file_data)
 
                     # Сохранение файла в постоянный каталог и в БД
                     doc.assign_file(tmp_file_path, file_data['name'])
@@ -171,7 +175,7 @@ def claim_edit(сlaim_id: int, post_data: dict, files_data: MultiValueDict, user
                 file_data = files_data[field.input_id][0]
 
                 # Сохранение файла во временный каталог
-                tmp_file_path = base64_to_temp_file(file_data['content'])
+                tmp_file_path = file_spool_receive(file_data)
 
                 # Сохранение файла в постоянный каталог и в БД
                 doc.assign_file(tmp_file_path, file_data['name'])
@@ -189,7 +193,7 @@ def claim_edit(сlaim_id: int, post_data: dict, files_data: MultiValueDict, user
                     document_services.document_add_history(doc.pk, 'Документ додано у систему', user.pk)
 
                     # Сохранение файла во временный каталог
-                    tmp_file_path = base64_to_temp_file(file_data['content'])
+                    tmp_file_path = file_spool_receive(file_data)
 
                     # Сохранение файла в постоянный каталог и в БД
                     doc.assign_file(tmp_file_path, file_data['name'])
@@ -273,7 +277,7 @@ def claim_get_stages_details(claim: Claim) -> dict:
         },
     }
 
-    claim_data = json.loads(claim.json_data)
+    claim_data = claim.data
     for field in fields:
         try:
             if claim_data[field.input_id]:
@@ -376,30 +380,36 @@ def claim_get_data_by_id(claim_id: int, user: UserModel = None, **kwargs) -> dic
     else:
         claim = Claim.objects.filter(pk=claim_id, **kwargs).first()
     if claim:
-        res = {
-            'claim_data': {
-                'id': claim.pk,
-                'obj_number': claim.obj_number,
-                'obj_kind': claim.obj_kind.title,
-                'obj_kind_id': claim.obj_kind.id,
-                'claim_kind': claim.claim_kind.title,
-                'claim_kind_id': claim.claim_kind.id,
-                'status_verbal': claim.get_status_display(),
-                'status': claim.status,
-                'submission_date': claim.submission_date.strftime('%d.%m.%Y %H:%M:%S') if claim.submission_date else '',
-                'internal_claim': int(claim.internal_claim)
-            },
-            'stages': claim_get_stages_details(claim),
-            'documents': claim_get_documents(claim_id)
-        }
-
-        if claim.status == 3:
-            res['claim_data']['case_number'] = claim.case.case_number
-
-        return res
+        return claim_get_data(claim)
     return {}
 
 
+def claim_get_data(claim: Claim, with_documents: bool = True) -> dict:
+    """Возвращает данные загруженного обращения (без документов, если with_documents=False)."""
+    res = {
+        'claim_data': {
+            'id': claim.pk,
+            'obj_number': claim.obj_number,
+            'obj_kind': claim.obj_kind.title,
+            'obj_kind_id': claim.obj_kind.id,
+            'claim_kind': claim.claim_kind.title,
+            'claim_kind_id': claim.claim_kind.id,
+            'status_verbal': claim.get_status_display(),
+            'status': claim.status,
+            'submission_date': claim.submission_date.strftime('%d.%m.%Y %H:%M:%S') if claim.submission_date else '',
+            'internal_claim': int(claim.internal_claim)
+        },
+        'stages': claim_get_stages_details(claim),
+    }
+    if with_documents:
+        res['documents'] = claim_get_documents(claim.pk)
+
+    if claim.status == 3:
+        res['claim_data']['case_number'] = claim.case.case_number
+
+    return res
+
+
 def claim_copy_docs_to_external_server(claim_id: int) -> None:
     """Копирует документы с внутреннего сервера на внешний """
     documents = Document.objects.filter(claim_id=claim_id)
@@ -569,36 +579,19 @@ def document_create_main_claim_doc_file(claim: Claim, base_doc: Document) -> Doc
     """Создаёт документ файл обращения."""
     doc_type = DocumentType.objects.filter(claim_kinds__id=claim.claim_kind.pk, create_with_claim=True).first()
     if doc_type:
-        f_header = open(doc_type.template.path, 'rb')
-        doc_header = PyDocxDocument(f_header)
-
         doc_data_to_replace = document_get_data_for_main_claim_doc_file(claim.pk)
-        docx_replace(doc_header, doc_data_to_replace)
-
-        tmp_file_name = get_random_file_name('docx')
-        tmp_file_path = get_temp_file_path(tmp_file_name)
+        doc_header = docx_template_render(doc_type.template.path, doc_data_to_replace)
 
-        doc_header.save(tmp_file_path)
-
-        master = doc_header
-        composer = Composer(master)
-
-        f = open(base_doc.file.path, 'rb')
-        doc_body = PyDocxDocument(f)
-        # doc_body = PyDocxDocument(base_doc.file)
-        composer.append(doc_body)
-        composer.save(tmp_file_path)
-        f.close()
-        f_header.close()
+        # Документ собирается в памяти: заголовок из шаблона, тело - загруженный файл
+        composer = Composer(doc_header)
+        with open(base_doc.file.path, 'rb') as f:
+            composer.append(PyDocxDocument(f))
 
         # Поставить всему документу 12-й размер шрифта и Times New Roman
-        input_doc = PyDocxDocument(tmp_file_path)
-        for paragraph in input_doc.paragraphs:
-            paragraph.style = input_doc.styles['Normal']
-            for run in paragraph.runs:
-                run.font.name = 'Times New Roman'
-                run.font.size = Pt(12)
-        input_doc.save(tmp_file_path)
+        docx_set_font(composer.doc, 'Times New Roman', Pt(12))
+
+        stream = BytesIO()
+        composer.save(stream)
 
         doc = Document.objects.create(
             claim=claim,
@@ -607,7 +600,7 @@ def document_create_main_claim_doc_file(claim: Claim, base_doc: Document) -> Doc
             claim_document=True,
             auto_generated=1
         )
-        doc.assign_file(tmp_file_path)
+        doc.file.save(get_random_file_name('docx'), ContentFile(stream.getvalue()))
 
         return doc
 
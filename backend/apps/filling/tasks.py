@@ -6,6 +6,7 @@ from apps.cases.services import case_services
 from apps.users import services as users_services
 from apps.classifiers import services as classifiers_services
 
+from typing import Union
 import os
 import time
 
@@ -56,9 +57,9 @@ def get_filling_form_data_task() -> dict:
 
 
 @app.task
-def create_claim_task(post_data, files_data, cert_data: dict) -> dict:
+def create_claim_task(post_data, files_data, user_or_cert: Union[int, dict]) -> dict:
     """Создаёт обращение (вызывается из внешнего модуля)."""
-    user = users_services.user_get_or_create_from_cert(cert_data)
+    user = users_services.user_get_for_task(user_or_cert)
     claim = filling_services.claim_create(post_data, files_data, user)
     return {'claim_url': claim.get_absolute_url()}
 
@@ -72,9 +73,9 @@ def create_claim_task_internal(post_data, files_data, user_id: int) -> dict:
 
 
 @app.task
-def edit_claim_task(claim_id, post_data, files_data, cert_data: dict) -> dict:
+def edit_claim_task(claim_id, post_data, files_data, user_or_cert: Union[int, dict]) -> dict:
     """Редактирует обращение."""
-    user = users_services.user_get_or_create_from_cert(cert_data)
+    user = users_services.user_get_for_task(user_or_cert)
     claim = filling_services.claim_edit(claim_id, post_data, files_data, user)
     return {'claim_url': claim.get_absolute_url()}
 
@@ -88,10 +89,10 @@ def edit_claim_task_internal(claim_id, post_data, files_data, user_id: int) -> d
 
 
 @app.task
-def get_claim_data_task(claim_id: int, cert_data: dict, **kwargs) -> dict:
+def get_claim_data_task(claim_id: int, user_or_cert: Union[int, dict], **kwargs) -> dict:
     """Возвращает данные обращения пользователя."""
     # Получение данных обращения
-    user = users_services.user_get_or_create_from_cert(cert_data)
+    user = users_services.user_get_for_task(user_or_cert)
     claim = filling_services.claim_get_data_by_id(claim_id, user, **kwargs)
 
     # Копирование документов обращения
@@ -111,9 +112,9 @@ def get_claim_data_task_internal(claim_id: int, user_id: int, **kwargs) -> dict:
 
 
 @app.task
-def get_claim_status(claim_id: int, cert_data: dict) -> dict:
+def get_claim_status(claim_id: int, user_or_cert: Union[int, dict]) -> dict:
     """Возвращает данные статуса обращения пользователя."""
-    user = users_services.user_get_or_create_from_cert(cert_data)
+    user = users_services.user_get_for_task(user_or_cert)
     claim = filling_services.claim_get_user_claims_qs(user).filter(pk=claim_id).first()
 
     if claim:
@@ -129,9 +130,9 @@ def get_claim_status(claim_id: int, cert_data: dict) -> dict:
 
 
 @app.task
-def delete_claim_task(claim_id: int, cert_data: dict) -> dict:
+def delete_claim_task(claim_id: int, user_or_cert: Union[int, dict]) -> dict:
     """Удаляет обращение пользователя."""
-    user = users_services.user_get_or_create_from_cert(cert_data)
+    user = users_services.user_get_for_task(user_or_cert)
     claim = filling_services.claim_get_user_claims_qs(user).filter(pk=claim_id, status__lt=3).first()
     if claim:
         claim.delete()
@@ -151,8 +152,8 @@ def delete_claim_task_internal(claim_id: int, user_id: int) -> dict:
 
 
 @app.task
-def create_case_task(claim_id: int, cert_data: dict) -> dict:
-    user = users_services.user_get_or_create_from_cert(cert_data)
+def create_case_task(claim_id: int, user_or_cert: Union[int, dict]) -> dict:
+    user = users_services.user_get_for_task(user_or_cert)
     case = case_services.case_create_from_claim(claim_id, user)
     if case:
         return {'success': 1, 'case_number': case.case_number}
@@ -169,10 +170,10 @@ def create_case_task_internal(claim_id: int, user_id: int) -> dict:
 
 
 @app.task
-def get_claim_list_task(cert_data: dict) -> list:
+def get_claim_list_task(user_or_cert: Union[int, dict]) -> list:
     """Возвращает список обращений пользователя."""
     res = []
-    user = users_services.user_get_or_create_from_cert(cert_data)
+    user = users_services.user_get_for_task(user_or_cert)
     claims = filling_services.claim_get_user_claims_qs(user).order_by('-created_at')
     for claim in claims:
         item = {
@@ -217,9 +218,9 @@ def get_claim_list_task_internal(user_id: int) -> list:
 
 
 @app.task
-def create_files_with_signs_info_task(cert_data: dict, claim_id: int, signs: list) -> bool:
+def create_files_with_signs_info_task(user_or_cert: Union[int, dict], claim_id: int, signs: list) -> bool:
     """Создаёт файлы документов с информацией о цифровой подписи."""
-    user = users_services.user_get_or_create_from_cert(cert_data)
+    user = users_services.user_get_for_task(user_or_cert)
     claim = filling_services.claim_get_user_claims_qs(user).filter(pk=claim_id, status__in=[1, 2]).first()
 
     if claim:
@@ -19,7 +19,7 @@ from .tasks import (get_app_data_from_es_task, get_filling_form_data_task, creat
                     edit_claim_task_internal, delete_claim_task, delete_claim_task_internal, create_case_task,
                     create_case_task_internal, get_claim_status, get_claim_list_task, get_claim_list_task_internal,
                     create_files_with_signs_info_task)
-from apps.common.utils import files_to_base64
+from apps.common.file_spool import files_to_spool
 
 import json
 
@@ -37,7 +37,7 @@ class MyClaimsListView(LoginRequiredMixin, TemplateView):
             )
         else:
             task = get_claim_list_task.delay(
-                users_services.certificate_get_data(self.request.session['cert_id'])
+                self.request.user.pk
             )
 
         context['task_id'] = task.id
@@ -60,14 +60,14 @@ class CreateClaimView(LoginRequiredMixin, View):
         if self.internal_claim:
             task = create_claim_task_internal.delay(
                 post_data,
-                files_to_base64(request.FILES),
+                files_to_spool(request.FILES),
                 request.user.pk,
             )
         else:
             task = create_claim_task.delay(
                 post_data,
-                files_to_base64(request.FILES),
-                users_services.certificate_get_data(self.request.session['cert_id'])
+                files_to_spool(request.FILES),
+                self.request.user.pk
             )
 
         return JsonResponse(
@@ -93,7 +93,7 @@ class ClaimDetailView(LoginRequiredMixin, TemplateView):
         else:
             task = get_claim_data_task.delay(
                 kwargs['pk'],
-                users_services.certificate_get_data(self.request.session['cert_id'])
+                self.request.user.pk
             )
         context['task_id'] = task.id
         context['internal_claim'] = self.internal_claim
@@ -105,7 +105,7 @@ def claim_status(request, pk):
     """Возвращает статус заявки в формате JSON."""
     task = get_claim_status.delay(
         pk,
-        users_services.certificate_get_data(request.session['cert_id'])
+        request.user.pk
     )
 
     return JsonResponse(
@@ -124,7 +124,7 @@ def claim_delete(request, pk):
     else:
         task = delete_claim_task.delay(
             pk,
-            users_services.certificate_get_data(request.session['cert_id'])
+            request.user.pk
         )
 
     return JsonResponse(
@@ -149,7 +149,7 @@ class ClaimUpdateView(LoginRequiredMixin, View):
         else:
             task = get_claim_data_task.delay(
                 kwargs['pk'],
-                users_services.certificate_get_data(self.request.session['cert_id']),
+                self.request.user.pk,
                 status__lt=3
             )
 
@@ -171,15 +171,15 @@ class ClaimUpdateView(LoginRequiredMixin, View):
             task = edit_claim_task_internal.delay(
                 self.kwargs['pk'],
                 post_data,
-                files_to_base64(request.FILES),
+                files_to_spool(request.FILES),
                 request.user.pk,
             )
         else:
             task = edit_claim_task.delay(
                 self.kwargs['pk'],
                 post_data,
-                files_to_base64(request.FILES),
-                users_services.certificate_get_data(self.request.session['cert_id'])
+                files_to_spool(request.FILES),
+                self.request.user.pk
             )
 
         return JsonResponse({'task_id': task.id})
@@ -197,7 +197,7 @@ def case_create(request, claim_id):
     else:
         task = create_case_task.delay(
             claim_id,
-            users_services.certificate_get_data(request.session['cert_id'])
+            request.user.pk
         )
 
     return JsonResponse({'task_id': task.id})
@@ -295,7 +295,7 @@ def create_files_with_signs_info(request, claim_id):
     }]
 
     task = create_files_with_signs_info_task.delay(
-        users_services.certificate_get_data(request.session['cert_id']),
+        request.user.pk,
         claim_id,
         signs,
     )
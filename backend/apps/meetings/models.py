@@ -44,7 +44,7 @@ class Meeting(TimeStampModel):
     @property
     def accept_count(self):
         """Количество принявших приглашение."""
-        return self.invitation_set.filter(accepted_at__isnull=False).count()
+        return len([invitation for invitation in self.invitation_set.all() if invitation.accepted_at])
 
 
 class Invitation(TimeStampModel):
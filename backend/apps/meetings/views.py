@@ -163,7 +163,7 @@ class MeetingCreateView(LoginRequiredMixin, CreateView):
 
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
-        kwargs['case'] = self.case = case_services.case_get_one(self.kwargs['case_id'])
+        kwargs['case'] = self.case = case_services.case_get_one(self.kwargs['case_id'], 'documents')
         if not self.case:
             raise Http404
         return kwargs
@@ -4,12 +4,13 @@ from django.db.models.functions import Concat
 
 from typing import Iterable
 
-from apps.cases.models import Case
+from apps.cases.models import Case, CaseSummary
 from apps.classifiers.models import ClaimPersonType
 
 
-def search(params: QueryDict) -> Iterable[Case]:
-    res = Case.objects.select_related('claim', 'claim__obj_kind')
+def search(params: QueryDict) -> Iterable[CaseSummary]:
+    """Возвращает сводные данные ап. дел, удовлетворяющих параметрам поиска."""
+    res = Case.objects.all()
 
     if params.get('person_type'):
         if params['person_type'] == 'appellant':
@@ -95,4 +96,5 @@ def search(params: QueryDict) -> Iterable[Case]:
     if params.get('meeting_date_to'):
         res = res.filter(meeting__datetime__lte=f"{params['meeting_date_to']} 23:59:59", meeting__status='DONE')
 
-    return res
+    # Результаты поиска отображаются по сводным данным ап. дел (без повторов из-за соединений таблиц)
+    return CaseSummary.objects.filter(pk__in=res.values('pk')).order_by('-created_at', '-case_id')
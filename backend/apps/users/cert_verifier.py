@@ -0,0 +1,208 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from pathlib import Path
+from typing import Dict, Optional, Union
+import atexit
+import hashlib
+import importlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def set_key_center_settings(eu_interface, key_center):
+    """Устанавливает параметры соединения с АЦСК"""
+    eu_interface.Initialize()
+    ca_settings = {
+        'szPath': settings.EUSIGN_FILESTORE_PATH,
+        'bCheckCRLs': True,
+        'bAutoRefresh': True,
+        'bOwnCRLsOnly': True,
+        'bFullAndDeltaCRLs': True,
+        'bAutoDownloadCRLs': True,
+        'bSaveLoadedCerts': True,
+        'dwExpireTime': 3600,
+    }
+    eu_interface.SetFileStoreSettings(ca_settings)
+
+    ocspAccessPointAddress = key_center.get('ocspAccessPointAddress', '')
+    ca_settings = {
+        'bUseOCSP': ocspAccessPointAddress != '',
+        'szAddress': ocspAccessPointAddress,
+        'bBeforeStore': True,
+        'szPort': str(key_center['ocspAccessPointPort']),
+    }
+    eu_interface.SetOCSPSettings(ca_settings)
+
+    tspAddress = key_center.get('tspAddress')
+    ca_settings = {
+        'bGetStamps': tspAddress != '',
+        'szAddress': tspAddress,
+        'szPort': str(key_center.get('tspAddressPort', '')),
+    }
+    eu_interface.SetTSPSettings(ca_settings)
+
+    cmpAddress = key_center.get('cmpAddress', '')
+    ca_settings = {
+        'bUseCMP': cmpAddress != '',
+        'szAddress': cmpAddress,
+        'szPort': '80',
+        'szCommonName': '',
+    }
+    eu_interface.SetCMPSettings(ca_settings)
+
+
+class _CertInterface:
+    """Инициализированный интерфейс библиотеки и АЦСК, параметры которого в нём установлены."""
+
+    def __init__(self, iface):
+        self.iface = iface
+        self.key_center: Optional[dict] = None
+
+
+class CertVerifier:
+    """Проверка ЭЦП библиотекой ІІТ (EUSignCP).
+
+    Библиотека загружается один раз на процесс при первой проверке, настройки АЦСК (CAs.json) считываются
+    и индексируются по CN издателя один раз. Проверки выполняются пулом инициализированных интерфейсов библиотеки;
+    параметры АЦСК устанавливаются в интерфейсе только при смене АЦСК. Результаты успешных проверок кешируются
+    на cache_ttl секунд по хешу подписанных данных."""
+
+    def __init__(self, library: str, cas_path: Union[str, Path], interfaces: int = 1, cache_ttl: int = 60):
+        self.library_name = library
+        self.cas_path = Path(cas_path)
+        self.interfaces_count = max(1, interfaces)
+        self.cache_ttl = cache_ttl
+        self.library = None
+        self.key_centers: Dict[str, dict] = {}
+        self._interfaces: 'queue.Queue[_CertInterface]' = queue.Queue()
+        self._lock = threading.Lock()
+        self._metrics = {'verifications': 0, 'cache_hits': 0, 'errors': 0, 'verify_time': 0.0}
+
+    def _load_key_centers(self) -> Dict[str, dict]:
+        """Возвращает настройки АЦСК по CN издателя (при повторах CN - первые в файле, как при переборе списка)."""
+        with open(self.cas_path, encoding='utf-8-sig') as f:
+            key_centers = json.load(f)
+        res = {}
+        for key_center in key_centers:
+            for issuer_cn in key_center['issuerCNs']:
+                res.setdefault(issuer_cn, key_center)
+        return res
+
+    def start(self) -> None:
+        """Загружает библиотеку, настройки АЦСК и инициализирует интерфейсы (если ещё не загружены)."""
+        with self._lock:
+            if self.library is not None:
+                return
+            library = importlib.import_module(self.library_name)
+            self.key_centers = self._load_key_centers()
+            library.EULoad()
+            for _ in range(self.interfaces_count):
+                iface = library.EUGetInterface()
+                iface.Initialize()
+                self._interfaces.put(_CertInterface(iface))
+            self.library = library
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self.library is None:
+                return
+            while not self._interfaces.empty():
+                try:
+                    self._interfaces.get_nowait().iface.Finalize()
+                except Exception:
+                    logger.exception('EUSignCP interface finalization failed')
+            self.library.EUUnload()
+            self.library = None
+
+    @staticmethod
+    def get_cache_key(signed_data: str, secret: str, key_center_title: str) -> str:
+        digest = hashlib.sha256('\0'.join((signed_data, secret, key_center_title or '')).encode()).hexdigest()
+        return f"cert_verifier:{digest}"
+
+    def verify(self, signed_data: str, secret: str, key_center_title: str) -> dict:
+        """Проверяет подпись secret (signed_data) и возвращает данные сертификата подписанта
+        (пустой словарь, если проверка закончилась неудачей)."""
+        cache_key = self.get_cache_key(signed_data, secret, key_center_title)
+        sign_info = cache.get(cache_key)
+        if sign_info is not None:
+            self._metrics['cache_hits'] += 1
+            return sign_info
+
+        self.start()
+        p_data = secret.encode('utf-16-le')
+        signed_data_bytes = signed_data.encode()
+        sign_info = {}
+        start = time.perf_counter()
+        item = self._interfaces.get()
+        try:
+            # Применение настроек центра сертификации
+            key_center = self.key_centers.get(key_center_title)
+            if key_center is not None and item.key_center is not key_center:
+                set_key_center_settings(item.iface, key_center)
+                item.key_center = key_center
+
+            # Верификация и получение данных из подписанных данных
+            item.iface.VerifyData(p_data, len(p_data), signed_data_bytes, None, len(signed_data_bytes), sign_info)
+        except Exception:
+            self._metrics['errors'] += 1
+            logger.exception('Signature verification failed')
+            # Параметры АЦСК будут установлены заново
+            item.key_center = None
+        finally:
+            self._interfaces.put(item)
+            self._metrics['verifications'] += 1
+            self._metrics['verify_time'] += time.perf_counter() - start
+
+        if sign_info:
+            cache.set(cache_key, sign_info, self.cache_ttl)
+        return sign_info
+
+    def get_metrics(self) -> dict:
+        metrics = dict(self._metrics)
+        metrics['verify_avg'] = metrics['verify_time'] / metrics['verifications'] if metrics['verifications'] else 0
+        metrics['interfaces'] = self.interfaces_count
+        metrics['loaded'] = self.library is not None
+        return metrics
+
+
+_verifier: Optional[CertVerifier] = None
+_verifier_pid: Optional[int] = None
+_verifier_lock = threading.Lock()
+
+
+def cert_verifier_get() -> CertVerifier:
+    global _verifier, _verifier_pid
+
+    with _verifier_lock:
+        # Состояние библиотеки не наследуется дочерними процессами (fork), в новом процессе она загружается заново
+        if _verifier is None or _verifier_pid != os.getpid():
+            _verifier = CertVerifier(
+                library=getattr(settings, 'EUSIGN_LIBRARY', 'EUSignCP'),
+                cas_path=getattr(
+                    settings, 'EUSIGN_CAS_PATH', Path(settings.BASE_DIR) / '../frontend/assets/digital_sign/CAs.json'
+                ),
+                interfaces=getattr(settings, 'EUSIGN_INTERFACES', 1),
+                cache_ttl=getattr(settings, 'EUSIGN_VERIFY_CACHE_TTL', 60),
+            )
+            _verifier_pid = os.getpid()
+        return _verifier
+
+
+def cert_verifier_shutdown() -> None:
+    """Выгружает библиотеку ІІТ (при завершении процесса)."""
+    global _verifier
+
+    with _verifier_lock:
+        if _verifier is not None and _verifier_pid == os.getpid():
+            _verifier.shutdown()
+        _verifier = None
+
+
+atexit.register(cert_verifier_shutdown)
@@ -1,9 +1,10 @@
-from django.template.loader import render_to_string
 from django.contrib.auth import get_user_model
 
 
 from rest_framework import serializers
 
+from apps.common.fragment_cache import fragment_render
+
 
 UserModel = get_user_model()
 
@@ -22,30 +23,36 @@ class UserSerializer(serializers.ModelSerializer):
         return 'Так' if user.at_work else 'Ні'
 
     def get_absent_display(self, user):
-        return render_to_string(
+        return fragment_render(
             'users/list/_partials/user_absent.html',
+            user,
             {
                 'user': user,
                 'request': self.context['request']
-            }
+            },
+            vary=(user.at_work,)
         )
 
     def get_cases_finished_num(self, user):
-        return render_to_string(
+        return fragment_render(
             'users/list/_partials/cases_finished_link.html',
+            user,
             {
                 'user': user,
                 'request': self.context['request']
-            }
+            },
+            vary=(user.cases_finished_num,)
         )
 
     def get_cases_current_num(self, user):
-        return render_to_string(
+        return fragment_render(
             'users/list/_partials/cases_current_link.html',
+            user,
             {
                 'user': user,
                 'request': self.context['request']
-            }
+            },
+            vary=(user.cases_current_num,)
         )
 
     class Meta:
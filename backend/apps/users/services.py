@@ -1,16 +1,18 @@
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.db.models import Prefetch, Count, Q, Case, When
 from django.db.models.functions import Concat
 from django.utils import timezone
 
 from .models import CertificateOwner, User
+from .cert_verifier import cert_verifier_get
 from apps.classifiers.models import ObjKind
 
-from typing import Iterable
-import os
-import json
+from typing import Dict, Iterable, Tuple, Union
 import logging
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -18,84 +20,9 @@ logger = logging.getLogger(__name__)
 UserModel = get_user_model()
 
 
-def set_key_center_settings(eu_interface, key_center):
-    """Устанавливает параметры соединения с АЦСК"""
-    eu_interface.Initialize()
-    ca_settings = {
-        'szPath': settings.EUSIGN_FILESTORE_PATH,
-        'bCheckCRLs': True,
-        'bAutoRefresh': True,
-        'bOwnCRLsOnly': True,
-        'bFullAndDeltaCRLs': True,
-        'bAutoDownloadCRLs': True,
-        'bSaveLoadedCerts': True,
-        'dwExpireTime': 3600,
-    }
-    eu_interface.SetFileStoreSettings(ca_settings)
-
-    ocspAccessPointAddress = key_center.get('ocspAccessPointAddress', '')
-    ca_settings = {
-        'bUseOCSP': ocspAccessPointAddress != '',
-        'szAddress': ocspAccessPointAddress,
-        'bBeforeStore': True,
-        'szPort': str(key_center['ocspAccessPointPort']),
-    }
-    eu_interface.SetOCSPSettings(ca_settings)
-
-    tspAddress = key_center.get('tspAddress')
-    ca_settings = {
-        'bGetStamps': tspAddress != '',
-        'szAddress': tspAddress,
-        'szPort': str(key_center.get('tspAddressPort', '')),
-    }
-    eu_interface.SetTSPSettings(ca_settings)
-
-    cmpAddress = key_center.get('cmpAddress', '')
-    ca_settings = {
-        'bUseCMP': cmpAddress != '',
-        'szAddress': cmpAddress,
-        'szPort': '80',
-        'szCommonName': '',
-    }
-    eu_interface.SetCMPSettings(ca_settings)
-
-
 def get_signed_data_info(signed_data, secret, key_center_title):
     """Проверяет валидность ЭЦП."""
-    # Загрузка бибилиотек ІІТ
-    from EUSignCP import EULoad, EUGetInterface, EUGetInterface, EUUnload
-
-    EULoad()
-    pIface = EUGetInterface()
-    pIface.Initialize()
-    eu_interface = EUGetInterface()
-
-    # Считывание настроек центров сертификации из файла CAs.json
-    key_centers = open(os.path.join(settings.BASE_DIR, 'apps', 'my_auth', 'static', 'my_auth', 'CAs.json'), "r").read()
-    key_centers = json.loads(key_centers)
-
-    # Применение настроек центра сертификации
-    for key_center in key_centers:
-        if key_center_title in key_center['issuerCNs']:
-            set_key_center_settings(eu_interface, key_center)
-            break
-
-    # Проверка подписи
-    pData = secret.encode('utf-16-le')
-    signed_data = signed_data.encode()
-    sign_info = {}
-    try:
-        # Верификация и получение данных из подписанных данных
-        pIface.VerifyData(pData, len(pData), signed_data, None, len(signed_data), sign_info)
-    except Exception as e:
-        print(e)
-        # logger.error(e)
-
-    # Выгрузка бибилиотек ІІТ
-    eu_interface.Finalize()
-    EUUnload()
-
-    return sign_info
+    return cert_verifier_get().verify(signed_data, secret, key_center_title)
 
 
 def get_certificate(post_data, secret):
@@ -202,6 +129,67 @@ def user_get_or_create_from_cert(cert_data: dict):
     return cert.user
 
 
+# Идентификаторы пользователей, определённые текущим процессом: серийный номер сертификата -> (id, время истечения)
+_cert_users: Dict[str, Tuple[int, float]] = {}
+_cert_users_lock = threading.Lock()
+# Максимальное количество сертификатов в кеше процесса
+CERT_USERS_LOCAL_MAX_SIZE = 10000
+
+
+def _certificate_user_cache_key(serial: str) -> str:
+    return f"cert_user:{serial}"
+
+
+def certificate_resolve_user_id(cert_data: dict) -> int:
+    """Возвращает id пользователя по данным сертификата ЭЦП (создаёт сертификат и пользователя, если их нет).
+
+    Соответствие серийного номера сертификата пользователю кешируется в процессе и в общем кеше
+    на CERT_USER_CACHE_TTL секунд (в процессе - не дольше CERT_USER_LOCAL_CACHE_TTL: кеши других процессов
+    при изменении сертификата не сбрасываются)."""
+    serial = cert_data['pszSerial']
+    now = time.monotonic()
+    item = _cert_users.get(serial)
+    if item and item[1] > now:
+        return item[0]
+
+    cache_key = _certificate_user_cache_key(serial)
+    user_id = cache.get(cache_key)
+    if user_id is None:
+        user_id = user_get_or_create_from_cert(cert_data).pk
+        cache.set(cache_key, user_id, getattr(settings, 'CERT_USER_CACHE_TTL', 60 * 60))
+
+    with _cert_users_lock:
+        if len(_cert_users) >= CERT_USERS_LOCAL_MAX_SIZE:
+            _cert_users.clear()
+        _cert_users[serial] = (user_id, now + getattr(settings, 'CERT_USER_LOCAL_CACHE_TTL', 60))
+    return user_id
+
+
+def certificate_invalidate_user(serial: str) -> None:
+    """Удаляет из кешей соответствие сертификата пользователю (при изменении или удалении сертификата)."""
+    if not serial:
+        return
+    with _cert_users_lock:
+        _cert_users.pop(serial, None)
+    cache.delete(_certificate_user_cache_key(serial))
+
+
+def user_get_for_task(user: Union[int, dict]) -> UserModel:
+    """Возвращает пользователя, от имени которого выполняется задача внешнего модуля.
+
+    user - id пользователя или данные сертификата ЭЦП (в таком виде пользователь передавался задачам,
+    поставленным в очередь до перехода на id)."""
+    if not isinstance(user, dict):
+        return user_get_by_pk(user)
+
+    res = user_get_by_pk(certificate_resolve_user_id(user))
+    if res is None:
+        # Пользователь удалён после кеширования
+        certificate_invalidate_user(user['pszSerial'])
+        res = user_get_or_create_from_cert(user)
+    return res
+
+
 def user_get_appeals_user_list_qs() -> Iterable[UserModel]:
     """Возвращает Queryset членов апеляционной палаты."""
     users = User.objects.filter(
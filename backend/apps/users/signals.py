@@ -0,0 +1,20 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from apps.common.fragment_cache import fragment_invalidate
+from .models import CertificateOwner
+from .services import certificate_invalidate_user
+
+UserModel = get_user_model()
+
+
+@receiver(post_save, sender=UserModel)
+def invalidate_fragments_hook(sender, instance, **kwargs):
+    fragment_invalidate(instance)
+
+
+@receiver(post_save, sender=CertificateOwner)
+@receiver(post_delete, sender=CertificateOwner)
+def invalidate_certificate_user_hook(sender, instance, **kwargs):
+    # Сертификаты удаляются и при удалении пользователя (CASCADE), поэтому кеш сбрасывается и в этом случае
+    certificate_invalidate_user(instance.pszSerial)
@@ -0,0 +1,43 @@
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.test import TestCase
+
+from apps.users import services
+from apps.users.models import CertificateOwner
+
+
+class CertificateUserTests(TestCase):
+    def setUp(self) -> None:
+        Group.objects.get_or_create(name='Заявник')
+        services._cert_users.clear()
+        cache.clear()
+        fields = [
+            'pszIssuer', 'pszIssuerCN', 'pszSubject', 'pszSubjCN', 'pszSubjOrg', 'pszSubjOrgUnit', 'pszSubjTitle',
+            'pszSubjState', 'pszSubjFullName', 'pszSubjAddress', 'pszSubjPhone', 'pszSubjEMail', 'pszSubjDNS',
+            'pszSubjEDRPOUCode', 'pszSubjLocality',
+        ]
+        self.cert_data = {field: '' for field in fields}
+        self.cert_data.update(pszSerial='0001', pszSubjDRFOCode='1234567890')
+
+    def test_user_is_resolved_once(self) -> None:
+        user_id = services.certificate_resolve_user_id(self.cert_data)
+        self.assertEqual(CertificateOwner.objects.get(pszSerial='0001').user_id, user_id)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(services.certificate_resolve_user_id(self.cert_data), user_id)
+
+        # Кеш другого процесса
+        services._cert_users.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(services.certificate_resolve_user_id(self.cert_data), user_id)
+
+    def test_cache_is_invalidated_on_certificate_change(self) -> None:
+        services.certificate_resolve_user_id(self.cert_data)
+        CertificateOwner.objects.get(pszSerial='0001').delete()
+        self.assertNotIn('0001', services._cert_users)
+        self.assertIsNone(cache.get('cert_user:0001'))
+
+    def test_user_get_for_task(self) -> None:
+        user = services.user_get_for_task(self.cert_data)
+        self.assertEqual(user.email, '1234567890')
+        self.assertEqual(services.user_get_for_task(user.pk), user)
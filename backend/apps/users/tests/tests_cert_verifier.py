@@ -0,0 +1,78 @@
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from apps.users.cert_verifier import CertVerifier
+
+from pathlib import Path
+import json
+import sys
+import tempfile
+import types
+
+
+class FakeInterface:
+    """Интерфейс библиотеки ІІТ: подпись считается верной, если подписанные данные начинаются с 'valid'."""
+
+    def __init__(self, library):
+        self.library = library
+
+    def Initialize(self):
+        self.library.calls.append('Initialize')
+
+    def Finalize(self):
+        self.library.calls.append('Finalize')
+
+    def VerifyData(self, data, data_len, signed_data, signed_data_str, signed_data_len, sign_info):
+        self.library.calls.append('VerifyData')
+        if not signed_data.startswith(b'valid'):
+            raise ValueError('Invalid signature')
+        sign_info['pszSerial'] = '0001'
+
+    def __getattr__(self, name):
+        # SetFileStoreSettings, SetOCSPSettings и т.д.
+        return lambda settings: self.library.calls.append(name)
+
+
+def make_fake_library() -> types.ModuleType:
+    library = types.ModuleType('fake_eusign')
+    library.calls = []
+    library.EULoad = lambda: library.calls.append('EULoad')
+    library.EUUnload = lambda: library.calls.append('EUUnload')
+    library.EUGetInterface = lambda: FakeInterface(library)
+    return library
+
+
+@override_settings(EUSIGN_FILESTORE_PATH='')
+class CertVerifierTests(SimpleTestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.library = make_fake_library()
+        sys.modules['fake_eusign'] = self.library
+        self.addCleanup(sys.modules.pop, 'fake_eusign')
+
+        cas_path = Path(tempfile.mkdtemp()) / 'CAs.json'
+        cas_path.write_text(json.dumps([
+            {'issuerCNs': ['CA 1', 'CA 1 (old)'], 'ocspAccessPointPort': '80'},
+            {'issuerCNs': ['CA 2'], 'ocspAccessPointPort': '80'},
+        ]))
+        self.verifier = CertVerifier('fake_eusign', cas_path, interfaces=2)
+        self.addCleanup(self.verifier.shutdown)
+
+    def test_library_is_loaded_once(self) -> None:
+        self.assertEqual(self.verifier.verify('valid-a', 'a', 'CA 1'), {'pszSerial': '0001'})
+        self.assertEqual(self.verifier.verify('valid-b', 'b', 'CA 1 (old)'), {'pszSerial': '0001'})
+        self.assertEqual(self.verifier.verify('wrong', 'c', 'CA 2'), {})
+        self.assertEqual(self.library.calls.count('EULoad'), 1)
+        self.assertEqual(self.library.calls.count('VerifyData'), 3)
+        self.assertNotIn('EUUnload', self.library.calls)
+        self.assertIs(self.verifier.key_centers['CA 1'], self.verifier.key_centers['CA 1 (old)'])
+
+        self.verifier.shutdown()
+        self.assertEqual(self.library.calls.count('Finalize'), 2)
+        self.assertEqual(self.library.calls[-1], 'EUUnload')
+
+    def test_result_is_cached(self) -> None:
+        for _ in range(3):
+            self.assertEqual(self.verifier.verify('valid-a', 'a', 'CA 1'), {'pszSerial': '0001'})
+        self.assertEqual(self.library.calls.count('VerifyData'), 1)
+        self.assertEqual(self.verifier.get_metrics()['cache_hits'], 2)
@@ -84,6 +84,27 @@ export const uploadSign = async function (documentId, signData, signInfo, origin
 }
 
 
+// Загружает на сервер подписи нескольких документов одним запросом: signs - [{documentId, signData, signInfo}]
+export const uploadSigns = async function (signs) {
+  const csrftoken = getCookie('csrftoken')
+
+  const data = new FormData()
+  const signInfo = {}
+  for (const sign of signs) {
+    data.append('blob_' + sign.documentId, new Blob([sign.signData], {type: "application/octet-stream"}))
+    signInfo[sign.documentId] = sign.signInfo
+  }
+  data.append('sign_info', JSON.stringify(signInfo))
+
+  const response = await fetch('/cases/upload-signs-internal/', {
+    method: 'POST',
+    headers: {'X-CSRFToken': csrftoken},
+    mode: 'same-origin',
+    body: data
+  })
+  return await response.json()
+}
+
 export const getTaskResult = async function (taskId, maxRetries = 20, currentTry = 1) {
     const url = '/filling/get-task-result/' + taskId + '/'
 
@@ -101,3 +122,25 @@ export const getTaskResult = async function (taskId, maxRetries = 20, currentTry
         return await getTaskResult(taskId, maxRetries, currentTry)
     }
 }
+
+// Ожидает окончания конвертации документов в pdf
+export const waitPdfConversion = async function (documentIds, maxRetries = 60, currentTry = 1) {
+    const url = '/cases/documents-pdf-status/?ids=' + documentIds.join(',')
+
+    let response = await fetch(url)
+    let json = await response.json()
+
+    const failed = json.documents.find(doc => doc.status === 'failed')
+    if (failed) {
+        throw new Error(failed.error || "Помилка конвертації документа у pdf.")
+    }
+    if (json.documents.every(doc => doc.status !== 'pending' && doc.status !== 'converting')) {
+        return json.documents
+    }
+    if (currentTry === maxRetries) {
+        throw new Error("Max retries count reached.")
+    }
+    currentTry++
+    await new Promise(r => setTimeout(r, 1000));
+    return await waitPdfConversion(documentIds, maxRetries, currentTry)
+}